@@ -113,7 +113,9 @@ class CrawlerService:
                 self.tasks[task_id]['state'] = 'SUCCESS'
                 self.tasks[task_id]['result'] = {
                     'message': f'成功爬取 {len(user_ids)} 个用户的微博',
-                    'user_ids': user_ids
+                    'user_ids': user_ids,
+                    'users': wb.crawl_results,
+                    'throttle': wb.rate_limiter.stats()
                 }
                 if self.current_task_id == task_id:
                     self.current_task_id = None
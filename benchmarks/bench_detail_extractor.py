@@ -0,0 +1,62 @@
+"""
+长微博详情页解析对比
+
+比较原先用find/rfind切片再json.loads的方式与util.detail_extractor.extract_status
+解析同一批详情页时每条微博的CPU耗时和内存峰值。
+
+运行：python benchmarks/bench_detail_extractor.py
+"""
+import json
+import os
+import sys
+import tracemalloc
+from time import process_time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from benchmarks.fixtures import detail_html  # noqa: E402
+from util.detail_extractor import extract_status  # noqa: E402
+
+PAGE_COUNT = 200
+
+
+def slice_status(html):
+    """原先get_long_weibo中的解析方式"""
+    html = html[html.find('"status":') :]
+    html = html[: html.rfind('"call"')]
+    html = html[: html.rfind(",")]
+    html = "{" + html + "}"
+    js = json.loads(html, strict=False)
+    return js.get("status")
+
+
+def measure(func, pages):
+    start = process_time()
+    for html in pages:
+        assert func(html)["id"]
+    cpu = process_time() - start
+    tracemalloc.start()
+    for html in pages:
+        func(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "cpu_us_per_post": round(cpu / len(pages) * 1e6, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    pages = [detail_html(i) for i in range(PAGE_COUNT)]
+    assert slice_status(pages[0]) == extract_status(pages[0])
+    result = {
+        "posts": PAGE_COUNT,
+        "page_kb": round(len(pages[0].encode("utf-8")) / 1024, 1),
+        "slice": measure(slice_status, pages),
+        "extract_status": measure(extract_status, pages),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
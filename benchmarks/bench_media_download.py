@@ -0,0 +1,121 @@
+"""
+图片下载方式对比
+
+在本地启动两个模拟图片CDN的HTTP服务，每个请求固定延迟后返回一张完整的JPEG，
+分别用原先的方式（每个文件新建Session、逐个下载）和MediaDownloader（每个域名
+一个连接池、线程池并发下载，经过download_one_file的校验和保存）下载同一批图片，
+比较总耗时。
+
+运行：python benchmarks/bench_media_download.py
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+FILE_COUNT = 200
+LATENCY = 0.05  # 模拟的CDN响应延迟（秒）
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * (200 * 1024) + b"\xff\xd9"
+
+
+class FakeCdnHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        sleep(LATENCY)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(JPEG)))
+        self.end_headers()
+        self.wfile.write(JPEG)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCdnServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_fake_cdn():
+    server = FakeCdnServer(("127.0.0.1", 0), FakeCdnHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_port
+
+
+def download_sequential(jobs):
+    """原先的下载方式：每个文件新建Session，逐个下载"""
+    for url, file_path, _, _ in jobs:
+        s = requests.Session()
+        s.mount(url, HTTPAdapter(max_retries=5))
+        downloaded = s.get(url, timeout=(5, 10)).content
+        with open(file_path, "wb") as f:
+            f.write(downloaded)
+
+
+def make_jobs(hosts, out_dir):
+    return [
+        (
+            "%s/large/%d.jpg" % (hosts[i % len(hosts)], i),
+            os.path.join(out_dir, "%d.jpg" % i),
+            "img",
+            str(i),
+        )
+        for i in range(FILE_COUNT)
+    ]
+
+
+def main():
+    from benchmarks.run import make_crawler
+    from util.download_manifest import MANIFEST_NAME, DownloadManifest
+    import weibo
+
+    logging.getLogger("weibo").setLevel(logging.WARNING)
+    servers = [start_fake_cdn() for _ in range(2)]
+    hosts = [host for _, host in servers]
+    tmp_dir = tempfile.mkdtemp(prefix="weibo-bench-media-")
+    try:
+        crawler = make_crawler(weibo, tmp_dir)
+        crawler.rate_limiter.enabled = False
+        result = {"files": FILE_COUNT, "latency": LATENCY, "hosts": len(hosts)}
+
+        out_dir = os.path.join(tmp_dir, "sequential")
+        os.makedirs(out_dir)
+        start = monotonic()
+        download_sequential(make_jobs(hosts, out_dir))
+        result["sequential_seconds"] = round(monotonic() - start, 2)
+
+        out_dir = os.path.join(tmp_dir, "pooled")
+        os.makedirs(out_dir)
+        jobs = make_jobs(hosts, out_dir)
+        # 与爬取时一样，下载前打开下载记录
+        crawler.download_manifest = DownloadManifest(os.path.join(tmp_dir, MANIFEST_NAME))
+        start = monotonic()
+        crawler.media_downloader.run(crawler.download_one_file, jobs)
+        result["pooled_seconds"] = round(monotonic() - start, 2)
+        crawler.media_downloader.close()
+        assert len(os.listdir(out_dir)) == FILE_COUNT
+        assert len(crawler.download_manifest.done) == FILE_COUNT
+
+        result["speedup"] = round(result["sequential_seconds"] / result["pooled_seconds"], 1)
+        print(json.dumps(result, indent=2))
+    finally:
+        for server, _ in servers:
+            server.shutdown()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
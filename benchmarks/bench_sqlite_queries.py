@@ -0,0 +1,209 @@
+"""
+SQLite常用查询在升级索引前后的耗时
+
+生成一个有数百万行的weibodata.db（默认200万条微博、200万条评论），分别在
+没有索引的版本2数据库和升级到最新版本后，测量API查询微博、导出评论、检查文件
+是否已存入数据库等查询的耗时中位数，并输出升级本身的耗时。
+
+运行：python benchmarks/bench_sqlite_queries.py --weibos 2000000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from util.sqlite_schema import SCHEMA_VERSION, migrate  # noqa: E402
+
+WEIBO_ID_BASE = 4000000000000000
+REPEAT = 20
+
+
+def get_create_sql():
+    import weibo
+
+    logging.getLogger("weibo").setLevel(logging.WARNING)
+    return weibo.Weibo.get_sqlite_create_sql(None)
+
+
+def created_at(rng):
+    return "20%02d-%02d-%02d %02d:%02d:%02d" % (
+        rng.randint(12, 26), rng.randint(1, 12), rng.randint(1, 28),
+        rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59),
+    )
+
+
+def fill(con, weibo_count, user_count, rng, chunk=50000):
+    """按爬虫写入的格式生成微博、评论、转发和文件记录"""
+    comment_count = weibo_count
+    repost_count = weibo_count // 4
+    bin_count = weibo_count // 20
+    for start in range(0, weibo_count, chunk):
+        con.executemany(
+            "INSERT INTO weibo(id, bid, user_id, screen_name, text, created_at, "
+            "attitudes_count, comments_count, reposts_count, retweet_id) "
+            "VALUES(?,?,?,?,?,?,?,?,?,?)",
+            (
+                (
+                    str(WEIBO_ID_BASE + i), "B%d" % i, str(1000000000 + i % user_count),
+                    "用户%d" % (i % user_count), "微博正文%d" % i, created_at(rng),
+                    i % 100, i % 10, i % 5, "",
+                )
+                for i in range(start, min(start + chunk, weibo_count))
+            ),
+        )
+    for start in range(0, comment_count, chunk):
+        con.executemany(
+            "INSERT INTO comments(id, bid, weibo_id, root_id, user_id, created_at, "
+            "user_screen_name, text, like_count) VALUES(?,?,?,?,?,?,?,?,?)",
+            (
+                (
+                    str(5000000000000000 + i), "C%d" % i,
+                    str(WEIBO_ID_BASE + rng.randrange(weibo_count)), "",
+                    str(2000000000 + i % 5000), created_at(rng), "评论用户%d" % (i % 5000),
+                    "评论%d" % i, i % 7,
+                )
+                for i in range(start, min(start + chunk, comment_count))
+            ),
+        )
+    for start in range(0, repost_count, chunk):
+        con.executemany(
+            "INSERT INTO reposts(id, bid, weibo_id, user_id, created_at, user_screen_name, "
+            "text, like_count) VALUES(?,?,?,?,?,?,?,?)",
+            (
+                (
+                    str(6000000000000000 + i), "R%d" % i,
+                    str(WEIBO_ID_BASE + rng.randrange(weibo_count)),
+                    str(3000000000 + i % 5000), created_at(rng), "转发用户%d" % (i % 5000),
+                    "转发微博", 0,
+                )
+                for i in range(start, min(start + chunk, repost_count))
+            ),
+        )
+    con.executemany(
+        "INSERT INTO bins(ext, data, weibo_id, path, url) VALUES(?,?,?,?,?)",
+        (
+            (".jpg", b"\xff\xd8\xff" + b"0" * 64, str(WEIBO_ID_BASE + i),
+             "/weibo/img/%d.jpg" % i, "https://wx1.sinaimg.cn/large/%d.jpg" % i)
+            for i in range(bin_count)
+        ),
+    )
+    con.commit()
+    return {
+        "weibo": weibo_count,
+        "comments": comment_count,
+        "reposts": repost_count,
+        "bins": bin_count,
+    }
+
+
+def get_queries(weibo_count, user_count, rng):
+    """(名称, SQL, 生成参数的函数)，SQL与API和爬虫中的查询一致"""
+
+    def user_id():
+        return str(1000000000 + rng.randrange(user_count))
+
+    def weibo_id():
+        return str(WEIBO_ID_BASE + rng.randrange(weibo_count))
+
+    return [
+        (
+            "api_weibos_one_user",
+            "SELECT * FROM weibo WHERE 1=1 AND user_id IN (?) ORDER BY created_at DESC LIMIT 100",
+            lambda: (user_id(),),
+        ),
+        (
+            "api_weibos_three_users",
+            "SELECT * FROM weibo WHERE 1=1 AND user_id IN (?,?,?) ORDER BY created_at DESC LIMIT 100",
+            lambda: (user_id(), user_id(), user_id()),
+        ),
+        (
+            "api_weibos_latest",
+            "SELECT * FROM weibo WHERE 1=1 ORDER BY created_at DESC LIMIT 100",
+            lambda: (),
+        ),
+        (
+            "export_user_comments",
+            "SELECT c.id, c.weibo_id, c.created_at, c.user_screen_name, c.text, c.pic_url, "
+            "c.like_count FROM comments c JOIN weibo w ON c.weibo_id = w.id "
+            "WHERE w.user_id = ? ORDER BY c.weibo_id, c.id",
+            lambda: (user_id(),),
+        ),
+        (
+            "weibo_reposts",
+            "SELECT * FROM reposts WHERE weibo_id = ?",
+            lambda: (weibo_id(),),
+        ),
+        (
+            "sqlite_exist_file",
+            "SELECT 1 FROM bins WHERE path=? LIMIT 1",
+            lambda: ("/weibo/img/%d.jpg" % rng.randrange(weibo_count // 10),),
+        ),
+    ]
+
+
+def measure(con, queries, repeat):
+    result = {}
+    for name, sql, make_params in queries:
+        timings = []
+        for _ in range(repeat):
+            params = make_params()
+            start = perf_counter()
+            con.execute(sql, params).fetchall()
+            timings.append(perf_counter() - start)
+        result[name] = round(statistics.median(timings) * 1000, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite查询耗时对比")
+    parser.add_argument("--weibos", type=int, default=2000000, help="微博条数，评论数与之相同")
+    parser.add_argument("--users", type=int, default=500, help="用户数")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="每个查询的执行次数")
+    parser.add_argument("--db", help="数据库路径，默认在临时目录中生成并在结束后删除")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    path = args.db
+    if not path:
+        tmp_dir = tempfile.mkdtemp(prefix="weibo-bench-sqlite-")
+        path = os.path.join(tmp_dir, "weibodata.db")
+    rng = random.Random(42)
+    try:
+        con = sqlite3.connect(path)
+        migrate(con, get_create_sql(), target=2)
+        start = perf_counter()
+        rows = fill(con, args.weibos, args.users, rng)
+        fill_seconds = perf_counter() - start
+        queries = get_queries(args.weibos, args.users, rng)
+        before = measure(con, queries, args.repeat)
+        start = perf_counter()
+        migrate(con, get_create_sql())
+        migrate_seconds = perf_counter() - start
+        after = measure(con, queries, args.repeat)
+        con.close()
+        report = {
+            "rows": rows,
+            "fill_seconds": round(fill_seconds, 1),
+            "migrate_to_version": SCHEMA_VERSION,
+            "migrate_seconds": round(migrate_seconds, 2),
+            "median_ms": {
+                name: {"before": before[name], "after": after[name]} for name in before
+            },
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
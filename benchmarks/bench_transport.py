@@ -0,0 +1,78 @@
+"""
+同步与异步传输层对比
+
+在本地启动一个模拟m.weibo.cn的HTTP服务，每个请求固定延迟后返回json，
+分别用SyncTransport逐个请求和AsyncTransport并发请求，比较总耗时。
+
+运行：python benchmarks/bench_transport.py
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from util.transport import AsyncTransport, SyncTransport  # noqa: E402
+
+REQUEST_COUNT = 50
+LATENCY = 0.1  # 模拟的服务器响应延迟（秒）
+
+
+class FakeWeiboHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        sleep(LATENCY)
+        body = json.dumps({"ok": 1, "data": {"cards": []}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeWeiboServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_fake_server():
+    """启动模拟服务，返回服务对象和地址"""
+    server = FakeWeiboServer(("127.0.0.1", 0), FakeWeiboHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/api/container/getIndex" % server.server_port
+
+
+def run(transport, url):
+    calls = [(url, {"params": {"page": page}, "timeout": 10}) for page in range(REQUEST_COUNT)]
+    start = monotonic()
+    results = transport.get_many(calls)
+    elapsed = monotonic() - start
+    assert all(r.json()["ok"] == 1 for r in results)
+    return elapsed
+
+
+def main():
+    server, url = start_fake_server()
+    try:
+        result = {"requests": REQUEST_COUNT, "latency": LATENCY}
+        result["sync_seconds"] = run(SyncTransport(requests.Session()), url)
+        transport = AsyncTransport(requests.Session(), max_in_flight=32)
+        try:
+            result["async_seconds"] = run(transport, url)
+        finally:
+            transport.close()
+        result["speedup"] = result["sync_seconds"] / result["async_seconds"]
+        print(json.dumps(result, indent=2))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+基准测试使用的合成数据
+
+结构与m.weibo.cn接口返回的数据一致：timeline_page对应containerid=230413的列表页，
+mblog对应其中的一条微博，detail_html对应m.weibo.cn/detail长微博详情页。
+"""
+import json
+import random
+
+LOCATION_ICON = (
+    "https://h5.sinaimg.cn/upload/2015/09/25/3/timeline_card_small_location_default.png"
+)
+
+
+def weibo_text(index, paragraphs=3):
+    """生成包含@用户、话题、位置和表情的微博正文html"""
+    rng = random.Random(index)
+    parts = []
+    for p in range(paragraphs):
+        parts.append(
+            '<a href="/n/用户{u}">@用户{u}</a> 第{p}段正文，编号{i}，'
+            '<a href="https://m.weibo.cn/search?containerid=231522type%3D1%26q%3D%23话题{t}%23">'
+            '<span class="surl-text">#话题{t}#</span></a>'
+            '<span class="url-icon"><img alt="[doge]" src="https://face.t.sinajs.cn/t4/doge.png" '
+            'style="width:1em; height:1em;" /></span>'
+            "这里是一些比较长的内容，用来模拟真实微博的长度。<br />".format(
+                u=rng.randint(1, 50), p=p, i=index, t=rng.randint(1, 20)
+            )
+        )
+    parts.append(
+        '<span class="url-icon"><img style="width: 1rem;height: 1rem" src="{icon}"></span>'
+        '<span class="surl-text">北京·朝阳区</span>'.format(icon=LOCATION_ICON)
+    )
+    return "".join(parts)
+
+
+def mblog(index, retweet=False, long_text=False, paragraphs=3, pic_num=3):
+    """生成一条微博的mblog数据"""
+    info = {
+        "id": str(5000000000000000 - index),
+        "bid": "N{}".format(index),
+        "text": weibo_text(index, paragraphs),
+        "user": {"id": 1669879400, "screen_name": "基准用户"},
+        "created_at": "Mon Oct 14 10:{:02d}:00 +0800 2024".format(index % 60),
+        "source": "iPhone客户端",
+        "attitudes_count": index * 3,
+        "comments_count": "1万+" if index % 11 == 0 else index,
+        "reposts_count": index % 7,
+        "pic_num": pic_num,
+        "pics": [
+            {"large": {"url": "https://wx1.sinaimg.cn/large/{}_{}.jpg".format(index, n)}}
+            for n in range(pic_num)
+        ],
+        "isLongText": long_text,
+        "edit_count": index % 2,
+    }
+    if retweet:
+        original = mblog(index + 1000000, paragraphs=paragraphs, pic_num=1)
+        original["id"] = str(4000000000000000 - index)
+        info["retweeted_status"] = original
+    return info
+
+
+def timeline_page(page, per_page=10, retweet_every=3):
+    """生成一页微博列表接口的返回数据"""
+    cards = []
+    for k in range(per_page):
+        index = page * per_page + k
+        cards.append(
+            {"card_type": 9, "mblog": mblog(index, retweet=k % retweet_every == 0)}
+        )
+    return {"ok": 1, "data": {"cards": cards}}
+
+
+def detail_html(index, paragraphs=40):
+    """生成一条长微博的详情页html"""
+    status = mblog(index, long_text=True, paragraphs=paragraphs)
+    padding = "\n".join(
+        '<link rel="preload" href="https://h5.sinaimg.cn/m/weibo-lite/js/chunk-{}.js">'.format(n)
+        for n in range(200)
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">{padding}<script>\n"
+        "var config = {{env: \"prod\", st: \"abc\"}};\n"
+        "var $render_data = [{{\n"
+        "    \"status\": {status},\n"
+        "    \"hotScheme\": \"sinaweibo://detail?mblogid={bid}\",\n"
+        "    \"appScheme\": \"sinaweibo://detail?mblogid={bid}\",\n"
+        "    \"call\": \"1\"\n"
+        "}}][0] || {{}};\n"
+        "</script></head><body><div id=\"app\"></div></body></html>"
+    ).format(
+        padding=padding,
+        status=json.dumps(status, ensure_ascii=False, indent=4),
+        bid=status["bid"],
+    )
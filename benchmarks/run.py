@@ -0,0 +1,642 @@
+"""
+解析与写入基准测试
+
+对合成或录制的微博数据测量parse_weibo及其各个步骤、get_write_info和各写入方式
+每秒处理的微博数与进程内存峰值，结果以json输出。每项测试在独立的子进程中运行，
+互不影响内存峰值。指定--baseline时与之前的结果比较，处理速度下降或内存峰值上升
+超过--tolerance时以状态码1退出，可放在部署前检查中。
+
+运行：
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --recorded weibo/raw_responses --baseline bench.json
+    python benchmarks/run.py --only parse_weibo write_csv
+"""
+import argparse
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import types
+from collections import OrderedDict
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import timeline_page  # noqa: E402
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """注册一项基准测试，被注册的函数接收BenchContext，返回处理的条数"""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def load_recorded_cards(dir_path):
+    """从raw_capture记录的文件中读取微博列表页里的微博"""
+    cards = []
+    for name in sorted(os.listdir(dir_path)):
+        if not name.endswith(".jsonl.gz"):
+            continue
+        with gzip.open(os.path.join(dir_path, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("family") != "timeline":
+                        continue
+                    js = json.loads(entry["body"])
+                    page_cards = js["data"]["cards"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                for card in page_cards:
+                    if card.get("card_type") == 11:
+                        card = (card.get("card_group") or [card])[0] or card
+                    if card.get("card_type") == 9 and card.get("mblog"):
+                        cards.append(card)
+    return cards
+
+
+def make_cards(post_count):
+    cards = []
+    page = 0
+    while len(cards) < post_count:
+        cards.extend(timeline_page(page)["data"]["cards"])
+        page += 1
+    return cards[:post_count]
+
+
+class StandInCursor(object):
+    """MySQL的本地替身，按pymysql的方式在客户端格式化SQL，但不发送"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, args=None):
+        if args is not None:
+            sql = sql % tuple(self.connection.escape(v) for v in args)
+        self.connection.bytes_sent += len(sql.encode("utf-8"))
+        StandInConnection.statements += 1
+
+    def executemany(self, sql, args):
+        for row in args:
+            self.execute(sql, row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class StandInConnection(object):
+    connects = 0
+    statements = 0
+
+    def __init__(self, **kwargs):
+        self.bytes_sent = 0
+        StandInConnection.connects += 1
+
+    def escape(self, value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, bool):
+            return str(int(value))
+        if isinstance(value, (int, float)):
+            return str(value)
+        return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def install_mysql_stand_in():
+    module = types.ModuleType("pymysql")
+    module.connect = StandInConnection
+    module.OperationalError = type("OperationalError", (Exception,), {})
+    sys.modules["pymysql"] = module
+
+
+class StandInCollection(object):
+    """MongoDB集合的本地替身，文档保存在内存中，记录请求次数"""
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+
+    def _request(self):
+        StandInMongoClient.round_trips += 1
+
+    def create_index(self, key, unique=False):
+        self._request()
+
+    def find_one(self, query):
+        self._request()
+        return self.documents.get(query["id"])
+
+    def insert_one(self, document):
+        self._request()
+        self.documents[document["id"]] = dict(document)
+
+    def update_one(self, query, update, upsert=False):
+        self._request()
+        self.documents.setdefault(query["id"], {}).update(update["$set"])
+
+    def bulk_write(self, operations, ordered=True):
+        self._request()
+        for operation in operations:
+            self.documents.setdefault(operation.query["id"], {}).update(operation.update["$set"])
+
+
+class StandInMongoClient(object):
+    round_trips = 0
+
+    def __init__(self, uri=None):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, StandInDatabase())
+
+    def close(self):
+        pass
+
+
+class StandInDatabase(object):
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, StandInCollection(name))
+
+
+class StandInUpdateOne(object):
+    def __init__(self, query, update, upsert=False):
+        self.query = query
+        self.update = update
+
+
+def install_mongo_stand_in():
+    module = types.ModuleType("pymongo")
+    module.MongoClient = StandInMongoClient
+    module.UpdateOne = StandInUpdateOne
+    errors = types.ModuleType("pymongo.errors")
+    errors.ServerSelectionTimeoutError = type("ServerSelectionTimeoutError", (Exception,), {})
+    errors.OperationFailure = type("OperationFailure", (Exception,), {})
+    module.errors = errors
+    sys.modules["pymongo"] = module
+    sys.modules["pymongo.errors"] = errors
+
+
+class BenchContext(object):
+    """一项基准测试的运行环境：临时目录中的爬虫实例和微博数据"""
+
+    def __init__(self, cards, tmp_dir):
+        import weibo
+
+        logging.getLogger("weibo").setLevel(logging.WARNING)
+        self.tmp_dir = tmp_dir
+        self.cards = cards
+        self.crawler = make_crawler(weibo, tmp_dir)
+        self.crawler.initialize_info(
+            {"user_id": "1669879400", "since_date": "2000-01-01T00:00:00", "query_list": []}
+        )
+        self.crawler.user = {"id": "1669879400", "screen_name": "基准用户"}
+
+    def parsed(self):
+        """解析好的微博，写入类测试的输入"""
+        weibos = [self.crawler.get_one_weibo(card) for card in self.cards]
+        return [w for w in weibos if w]
+
+
+def make_crawler(weibo, tmp_dir):
+    """创建结果写入临时目录、不访问网络的爬虫"""
+
+    class BenchWeibo(weibo.Weibo):
+        def get_filepath(self, type):
+            file_dir = os.path.join(tmp_dir, "weibo")
+            if type in ["img", "video", "live_photo"]:
+                file_dir = os.path.join(file_dir, type)
+            if not os.path.isdir(file_dir):
+                os.makedirs(file_dir)
+            if type in ["img", "video", "live_photo"]:
+                return file_dir
+            return os.path.join(file_dir, "1669879400." + type)
+
+        def get_sqlte_path(self):
+            return os.path.join(tmp_dir, "weibodata.db")
+
+    replay_dir = os.path.join(tmp_dir, "replay")
+    os.makedirs(replay_dir)
+    config = {
+        "user_id_list": ["1669879400"],
+        "only_crawl_original": 0,
+        "remove_html_tag": 1,
+        "since_date": "2000-01-01",
+        "write_mode": ["csv"],
+        "original_pic_download": 0,
+        "retweet_pic_download": 0,
+        "original_video_download": 0,
+        "retweet_video_download": 0,
+        "original_live_photo_download": 0,
+        "retweet_live_photo_download": 0,
+        "download_comment": 0,
+        "comment_max_download_count": 0,
+        "download_repost": 0,
+        "repost_max_download_count": 0,
+        "page_weibo_count": 10,
+        "replay_dir": replay_dir,
+    }
+    return BenchWeibo(config)
+
+
+@benchmark("html_parse")
+def bench_html_parse(ctx):
+    from lxml import etree
+
+    for card in ctx.cards:
+        etree.HTML(card["mblog"]["text"])
+    return len(ctx.cards)
+
+
+def selectors(ctx):
+    from lxml import etree
+
+    return [etree.HTML(card["mblog"]["text"]) for card in ctx.cards]
+
+
+@benchmark("get_topics")
+def bench_get_topics(ctx):
+    trees = selectors(ctx)
+    start = perf_counter()
+    for selector in trees:
+        ctx.crawler.get_topics(selector)
+    return len(trees), perf_counter() - start
+
+
+@benchmark("get_at_users")
+def bench_get_at_users(ctx):
+    trees = selectors(ctx)
+    start = perf_counter()
+    for selector in trees:
+        ctx.crawler.get_at_users(selector)
+    return len(trees), perf_counter() - start
+
+
+@benchmark("get_location")
+def bench_get_location(ctx):
+    trees = selectors(ctx)
+    start = perf_counter()
+    for selector in trees:
+        ctx.crawler.get_location(selector)
+    return len(trees), perf_counter() - start
+
+
+@benchmark("extract_text_info")
+def bench_extract_text_info(ctx):
+    from util.text_extractor import extract_text_info
+
+    trees = selectors(ctx)
+    start = perf_counter()
+    for selector in trees:
+        extract_text_info(selector)
+    return len(trees), perf_counter() - start
+
+
+@benchmark("standardize_info")
+def bench_standardize_info(ctx):
+    weibos = [ctx.crawler.parse_weibo(card["mblog"]) for card in ctx.cards]
+    start = perf_counter()
+    for w in weibos:
+        ctx.crawler.standardize_info(w)
+    return len(weibos), perf_counter() - start
+
+
+@benchmark("parse_weibo")
+def bench_parse_weibo(ctx):
+    for card in ctx.cards:
+        ctx.crawler.parse_weibo(card["mblog"])
+    return len(ctx.cards)
+
+
+@benchmark("get_one_weibo")
+def bench_get_one_weibo(ctx):
+    for card in ctx.cards:
+        ctx.crawler.get_one_weibo(card)
+    return len(ctx.cards)
+
+
+def load_weibos(ctx):
+    ctx.crawler.weibo = ctx.parsed()
+    ctx.crawler.got_count = len(ctx.crawler.weibo)
+    return len(ctx.crawler.weibo)
+
+
+@benchmark("hold_weibos")
+def bench_hold_weibos(ctx):
+    """解析的微博全部留在内存中，与rss_before_kb相比的peak_rss_kb增量即这些微博占用的内存"""
+    return load_weibos(ctx)
+
+
+def crawl_pages(ctx, page_size=10):
+    """把微博按每页page_size条交给get_one_page，模拟一次完整的回溯爬取"""
+    for page, start in enumerate(range(0, len(ctx.cards), page_size), 1):
+        js = {"ok": 1, "data": {"cards": ctx.cards[start : start + page_size]}}
+        ctx.crawler.get_one_page(page, js)
+
+
+@benchmark("get_one_page")
+def bench_get_one_page(ctx):
+    crawl_pages(ctx)
+    return ctx.crawler.got_count
+
+
+@benchmark("get_one_page_unchanged")
+def bench_get_one_page_unchanged(ctx):
+    """覆盖模式下再次爬取，全部微博都已写入且没有再编辑"""
+    ctx.crawler.stored_edit_counts = {
+        str(card["mblog"]["id"]): card["mblog"].get("edit_count", 0) for card in ctx.cards
+    }
+    crawl_pages(ctx)
+    return ctx.crawler.skipped_count
+
+
+@benchmark("get_write_info")
+def bench_get_write_info(ctx):
+    count = load_weibos(ctx)
+    start = perf_counter()
+    ctx.crawler.get_write_info(0)
+    return count, perf_counter() - start
+
+
+@benchmark("write_csv")
+def bench_write_csv(ctx):
+    count = load_weibos(ctx)
+    start = perf_counter()
+    ctx.crawler.write_csv(0)
+    return count, perf_counter() - start
+
+
+@benchmark("write_json")
+def bench_write_json(ctx):
+    count = load_weibos(ctx)
+    start = perf_counter()
+    ctx.crawler.write_json(0)
+    return count, perf_counter() - start
+
+
+def write_in_batches(ctx, method, batch_size=200):
+    """按每爬20页写入一次的方式分批写入，返回写入的微博数和耗时"""
+    weibos = ctx.parsed()
+    crawler = ctx.crawler
+    start = perf_counter()
+    for wrote_count in range(0, len(weibos), batch_size):
+        crawler.weibo = weibos[: wrote_count + batch_size]
+        crawler.got_count = len(crawler.weibo)
+        getattr(crawler, method)(wrote_count)
+    return len(weibos), perf_counter() - start
+
+
+@benchmark("update_json_data")
+def bench_update_json_data(ctx, existing=100000, new=2000):
+    """json文件中已有10万条微博，合并2000条新抓取的微博，其中一半已存在且被编辑过"""
+    old = {
+        "weibo": [
+            {"id": 4800000000000000 + i, "text": "微博%d" % i, "edit_count": 0}
+            for i in range(existing)
+        ]
+    }
+    # 新微博在前、已存在的在后，与按时间倒序抓取到已写入部分时的顺序一致
+    batch = [
+        {"id": 4800000000000000 + i, "text": "微博%d" % i, "edit_count": 1}
+        for i in list(range(existing, existing + new // 2))
+        + list(range(existing - new // 2, existing))
+    ]
+    start = perf_counter()
+    data = ctx.crawler.update_json_data(old, batch)
+    elapsed = perf_counter() - start
+    assert len(data["weibo"]) == existing + new // 2
+    return new, elapsed
+
+
+@benchmark("write_json_batches")
+def bench_write_json_batches(ctx):
+    return write_in_batches(ctx, "write_json")
+
+
+@benchmark("write_jsonl_batches")
+def bench_write_jsonl_batches(ctx):
+    from util.jsonl_store import JsonLinesStore
+
+    ctx.crawler.jsonl_store = JsonLinesStore(ctx.crawler.get_filepath("jsonl"))
+    return write_in_batches(ctx, "write_jsonl")
+
+
+@benchmark("weibo_to_sqlite")
+def bench_weibo_to_sqlite(ctx):
+    count = load_weibos(ctx)
+    start = perf_counter()
+    ctx.crawler.weibo_to_sqlite(0)
+    flush_sqlite(ctx.crawler)
+    return count, perf_counter() - start
+
+
+def flush_sqlite(crawler):
+    """提交攒批未写入的行，计入写入耗时"""
+    writer = getattr(crawler, "sqlite_writer", None)
+    if writer is not None:
+        writer.flush()
+
+
+def make_comments(weibo_id, count):
+    return [
+        {
+            "id": "%s%04d" % (weibo_id, i),
+            "bid": "C%d" % i,
+            "rootid": "%s%04d" % (weibo_id, i),
+            "created_at": "Sat Oct 17 10:00:00 +0800 2026",
+            "user": {"id": 2000000 + i, "screen_name": "评论用户%d" % i, "avatar_hd": ""},
+            "text": "第%d条评论<span>回复内容</span>" % i,
+            "like_count": i % 7,
+        }
+        for i in range(count)
+    ]
+
+
+@benchmark("sqlite_insert_comments")
+def bench_sqlite_insert_comments(ctx):
+    """每条微博20页评论，每页20条，按爬取评论时的方式逐页写入"""
+    weibos = [{"id": 4800000000000000 + i} for i in range(max(1, len(ctx.cards) // 20))]
+    pages = [(w, make_comments(w["id"], 20)) for w in weibos for _ in range(20)]
+    start = perf_counter()
+    for weibo, comments in pages:
+        ctx.crawler.sqlite_insert_comments(weibo, comments)
+    flush_sqlite(ctx.crawler)
+    return len(pages) * 20, perf_counter() - start
+
+
+@benchmark("download_skip")
+def bench_download_skip(ctx):
+    """已下载过的图片再次运行时判断跳过的耗时，每条微博9张图片"""
+    crawler = ctx.crawler
+    crawler.write_mode = ["sqlite"]
+    crawler.download_comment = 1
+    crawler.open_user_files()
+    file_dir = crawler.get_filepath("img")
+    jobs = []
+    for i in range(len(ctx.cards) * 9):
+        file_path = os.path.join(file_dir, "%d.jpg" % i)
+        open(file_path, "wb").close()
+        url = "https://wx1.sinaimg.cn/large/%d.jpg" % i
+        jobs.append((url, file_path, "img", str(4800000000000000 + i // 9)))
+    for job in jobs:  # 第一次运行，文件已在磁盘上
+        crawler.download_one_file(*job)
+    start = perf_counter()
+    for job in jobs:
+        crawler.download_one_file(*job)
+    return len(jobs), perf_counter() - start
+
+
+@benchmark("mysql_insert")
+def bench_mysql_insert(ctx):
+    from util.mysql_writer import MySQLWriter
+
+    install_mysql_stand_in()
+    count = load_weibos(ctx)
+    ctx.crawler.write_mode = ["mysql"]
+    ctx.crawler.mysql_writer = MySQLWriter({}, ctx.crawler.get_mysql_create_sql())
+    start = perf_counter()
+    ctx.crawler.weibo_to_mysql(0)
+    return count, perf_counter() - start
+
+
+@benchmark("mongo_upsert")
+def bench_mongo_upsert(ctx):
+    from util.mongo_writer import MongoWriter
+
+    install_mongo_stand_in()
+    count = load_weibos(ctx)
+    ctx.crawler.write_mode = ["mongo"]
+    ctx.crawler.mongo_writer = MongoWriter()
+    start = perf_counter()
+    ctx.crawler.weibo_to_mongodb(0)
+    return count, perf_counter() - start
+
+
+def run_one(name, cards, result_queue):
+    """在子进程中运行一项测试"""
+    tmp_dir = tempfile.mkdtemp(prefix="weibo-bench-")
+    try:
+        ctx = BenchContext(cards, tmp_dir)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = perf_counter()
+        outcome = BENCHMARKS[name](ctx)
+        elapsed = perf_counter() - start
+        # 返回(条数, 耗时)的测试自己排除了准备数据的时间
+        if isinstance(outcome, tuple):
+            count, elapsed = outcome
+        else:
+            count = outcome
+        result_queue.put(
+            {
+                "name": name,
+                "items": count,
+                "seconds": round(elapsed, 4),
+                "items_per_sec": round(count / elapsed, 1) if elapsed > 0 else None,
+                "rss_before_kb": rss_before,
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }
+        )
+    except Exception as e:
+        result_queue.put({"name": name, "error": repr(e)})
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run(names, cards):
+    results = OrderedDict()
+    for name in names:
+        result_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_one, args=(name, cards, result_queue))
+        process.start()
+        result = result_queue.get()
+        process.join()
+        results[result.pop("name")] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与之前的结果比较，返回退化的测试项说明"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old or "error" in old or "error" in result:
+            continue
+        if old["items_per_sec"] and result["items_per_sec"] < old["items_per_sec"] * (1 - tolerance):
+            regressions.append(
+                "%s: 每秒%.1f条，基准为%.1f条" % (name, result["items_per_sec"], old["items_per_sec"])
+            )
+        if result["peak_rss_kb"] > old["peak_rss_kb"] * (1 + tolerance):
+            regressions.append(
+                "%s: 内存峰值%dKB，基准为%dKB" % (name, result["peak_rss_kb"], old["peak_rss_kb"])
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微博解析与写入基准测试")
+    parser.add_argument("--posts", type=int, default=2000, help="合成微博条数")
+    parser.add_argument("--recorded", help="raw_capture记录目录，使用其中的真实微博代替合成数据")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="只运行指定测试")
+    parser.add_argument("--output", help="结果json文件路径，默认输出到标准输出")
+    parser.add_argument("--baseline", help="之前的结果json文件，用于检查性能退化")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    args = parser.parse_args()
+
+    cards = load_recorded_cards(args.recorded) if args.recorded else make_cards(args.posts)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "posts": len(cards),
+            "fixtures": "recorded" if args.recorded else "synthetic",
+        },
+        "results": run(args.only or list(BENCHMARKS), cards),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report["results"], json.load(f), args.tolerance)
+        for regression in regressions:
+            print("性能退化 " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
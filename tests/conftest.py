@@ -0,0 +1,78 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的weibo.py和util包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import pytest  # noqa: E402
+
+USER_CONFIG = {"user_id": "1669879400", "since_date": "2000-01-01T00:00:00", "query_list": []}
+
+
+def make_crawler(tmp_dir, **config):
+    """创建结果写入tmp_dir、不访问网络的爬虫，config覆盖默认配置"""
+    import weibo
+
+    class TestWeibo(weibo.Weibo):
+        def get_result_root(self):
+            return os.path.join(tmp_dir, "weibo")
+
+        def get_sqlte_path(self):
+            return os.path.join(tmp_dir, "weibodata.db")
+
+        def get_long_text_cache_path(self):
+            return os.path.join(tmp_dir, "long_text_cache.db")
+
+        def get_blob_store_path(self):
+            return os.path.join(tmp_dir, "blobs")
+
+    # 设置回放目录后爬虫不会预热Session，也不会访问网络
+    replay_dir = os.path.join(tmp_dir, "replay")
+    os.makedirs(replay_dir, exist_ok=True)
+    defaults = {
+        "user_id_list": ["1669879400"],
+        "only_crawl_original": 0,
+        "remove_html_tag": 1,
+        "since_date": "2000-01-01",
+        "write_mode": ["csv"],
+        "original_pic_download": 0,
+        "retweet_pic_download": 0,
+        "original_video_download": 0,
+        "retweet_video_download": 0,
+        "original_live_photo_download": 0,
+        "retweet_live_photo_download": 0,
+        "download_comment": 0,
+        "comment_max_download_count": 0,
+        "download_repost": 0,
+        "repost_max_download_count": 0,
+        "page_weibo_count": 10,
+        "replay_dir": replay_dir,
+    }
+    defaults.update(config)
+    return TestWeibo(defaults)
+
+
+@pytest.fixture
+def crawler_factory(tmp_path):
+    """按给定配置创建爬虫，用完后关闭"""
+    crawlers = []
+
+    def factory(**config):
+        crawler = make_crawler(str(tmp_path), **config)
+        crawlers.append(crawler)
+        return crawler
+
+    yield factory
+    for crawler in crawlers:
+        crawler.sqlite_writer.close()
+        crawler.long_text_cache.close()
+        crawler.media_downloader.close()
+
+
+@pytest.fixture
+def crawler(crawler_factory):
+    """已初始化一个用户的爬虫"""
+    crawler = crawler_factory()
+    crawler.initialize_info(dict(USER_CONFIG))
+    crawler.user = {"id": "1669879400", "screen_name": "测试用户"}
+    return crawler
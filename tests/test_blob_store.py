@@ -0,0 +1,79 @@
+import hashlib
+import os
+
+from util import blob_store
+from util.blob_store import BlobStore
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def stored_files(root):
+    return sorted(name for _, _, files in os.walk(root) for name in files)
+
+
+def test_put_stores_identical_content_once(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    digest = store.put(b"image")
+    assert digest == hashlib.sha256(b"image").hexdigest()
+    assert store.put(b"image") == digest
+    assert store.get_path(digest) == os.path.join(
+        str(tmp_path / "blobs"), digest[:2], digest[2:4], digest
+    )
+    assert stored_files(str(tmp_path / "blobs")) == [digest]
+    assert store.read(digest) == b"image"
+
+
+def test_put_file_moves_file_and_drops_duplicates(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    first = write(tmp_path / "a.part", b"video")
+    second = write(tmp_path / "b.part", b"video")
+    digest = store.put_file(first)
+    assert store.put_file(second) == digest
+    assert not os.path.exists(first)
+    assert not os.path.exists(second)
+    assert stored_files(str(tmp_path / "blobs")) == [digest]
+
+
+def test_link_shares_stored_file(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    digest = store.put(b"image")
+    target = str(tmp_path / "a.jpg")
+    store.link(digest, target)
+    assert os.path.samefile(target, store.get_path(digest))
+
+
+def test_link_copies_when_hard_links_are_unsupported(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs"))
+    digest = store.put(b"image")
+
+    def no_link(src, dst):
+        raise OSError("hard links not supported")
+
+    monkeypatch.setattr(blob_store.os, "link", no_link)
+    target = str(tmp_path / "a.jpg")
+    store.link(digest, target)
+    assert not os.path.samefile(target, store.get_path(digest))
+    with open(target, "rb") as f:
+        assert f.read() == b"image"
+
+
+def test_crawler_records_digest_instead_of_file_data(crawler_factory, tmp_path):
+    crawler = crawler_factory(write_mode=["sqlite"], store_binary_in_sqlite=1)
+    paths = []
+    for name in ("1.jpg", "2.jpg"):
+        file_path = str(tmp_path / name)
+        digest = crawler.save_file(file_path, write(tmp_path / (name + ".part"), b"image"))
+        crawler.insert_file_sqlite(file_path, "5000", "https://wx1.sinaimg.cn/" + name, 5, digest)
+        paths.append(file_path)
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            assert f.read() == b"image"
+    assert stored_files(crawler.get_blob_store_path()) == [hashlib.sha256(b"image").hexdigest()]
+    row = crawler.sqlite_writer.fetchone(
+        "SELECT data, sha256, size FROM bins WHERE path=?", (paths[1],)
+    )
+    assert row == (b"", hashlib.sha256(b"image").hexdigest(), 5)
@@ -0,0 +1,96 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from util.ratelimit import DEFAULT_RATES
+
+USER_IDS = ["100000000%d" % i for i in range(7)]
+
+
+@pytest.fixture
+def pool(crawler_factory, monkeypatch):
+    """替换get_pages：记录各用户由哪个线程、按什么顺序开始爬取，并发出5个timeline请求"""
+    started = []
+    lock = threading.Lock()
+    threads = set()
+    barrier = []
+
+    def get_pages(self):
+        user_id = self.user_config["user_id"]
+        thread = threading.current_thread().name
+        with lock:
+            started.append((user_id, thread))
+            first = thread not in threads
+            threads.add(thread)
+        if first and barrier:
+            # 每个线程爬取第一个用户时等其他线程也开始，确保用户分给了多个线程
+            barrier[0].wait()
+        for _ in range(5):
+            self.rate_limiter.acquire("timeline")
+        self.user = {"id": user_id, "screen_name": "用户" + user_id[-1]}
+        self.got_count = int(user_id[-1])
+
+    def make(**config):
+        crawler = crawler_factory(rate_limit={"timeline": 10000}, rate_limit_jitter=0, **config)
+        monkeypatch.setattr(type(crawler), "get_pages", get_pages)
+        crawler.rate_limiter.enabled = True
+        if crawler.crawl_worker_count > 1:
+            barrier.append(threading.Barrier(crawler.crawl_worker_count, timeout=10))
+        crawler.user_config_list = [
+            {"user_id": user_id, "since_date": "2000-01-01T00:00:00", "query_list": []}
+            for user_id in USER_IDS
+        ]
+        return crawler
+
+    return SimpleNamespace(make=make, started=started)
+
+
+def test_each_user_is_crawled_once_in_config_order(pool):
+    crawler = pool.make(crawl_worker_count=3)
+    crawler.start()
+    assert [user_id for user_id, _ in pool.started] == USER_IDS
+    assert len({thread for _, thread in pool.started}) == 3
+    assert all(thread.startswith("crawl-worker-") for _, thread in pool.started)
+    results = {r["user_id"]: r for r in crawler.crawl_results}
+    assert sorted(results) == USER_IDS
+    assert [results[u]["got_count"] for u in USER_IDS] == list(range(7))
+    assert not any(r["error"] for r in crawler.crawl_results)
+
+
+def test_single_worker_keeps_result_order(pool):
+    crawler = pool.make()
+    crawler.start()
+    assert [r["user_id"] for r in crawler.crawl_results] == USER_IDS
+    assert {thread for _, thread in pool.started} == {threading.current_thread().name}
+
+
+def test_workers_share_one_limiter(pool):
+    crawler = pool.make(crawl_worker_count=3)
+    crawler.start()
+    assert crawler.rate_limiter.stats()["timeline"]["requests"] == 5 * len(USER_IDS)
+
+
+def test_default_rates_do_not_grow_with_workers(crawler_factory):
+    crawler = crawler_factory(crawl_worker_count=4)
+    assert crawler.rate_limiter.base_rates == {
+        family: rate for family, (rate, _) in DEFAULT_RATES.items()
+    }
+    assert crawler.rate_limiter.buckets["user"].capacity == DEFAULT_RATES["user"][1]
+
+
+def test_failed_user_does_not_stop_other_workers(pool, monkeypatch):
+    crawler = pool.make(crawl_worker_count=3)
+    get_pages = type(crawler).get_pages
+
+    def fail_one(self):
+        if self.user_config["user_id"] == USER_IDS[2]:
+            raise RuntimeError("失败")
+        get_pages(self)
+
+    monkeypatch.setattr(type(crawler), "get_pages", fail_one)
+    crawler.start()
+    errors = {r["user_id"]: r["error"] for r in crawler.crawl_results}
+    assert len(errors) == len(USER_IDS)
+    assert errors[USER_IDS[2]] == "失败"
+    assert sum(1 for error in errors.values() if error) == 1
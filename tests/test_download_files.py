@@ -0,0 +1,61 @@
+import os
+
+def test_shared_retweet_is_downloaded_once(crawler):
+    source = {
+        "id": "4000000000000001",
+        "created_at": "2024-10-14",
+        "pics": "https://wx1.sinaimg.cn/large/a.jpg",
+    }
+    crawler.weibo = [
+        {"id": "5000000000000001", "created_at": "2024-10-15", "retweet": source},
+        {"id": "5000000000000002", "created_at": "2024-10-16", "retweet": dict(source)},
+    ]
+    crawler.got_count = len(crawler.weibo)
+    downloaded = []
+    crawler.download_one_file = lambda url, file_path, file_type, weibo_id: downloaded.append(
+        file_path
+    )
+    crawler.download_files("img", "retweet", 0)
+    assert len(downloaded) == 1
+    assert downloaded[0].endswith("20241014_4000000000000001.jpg")
+
+
+def test_download_without_manifest(crawler, tmp_path, caplog):
+    jpeg = b"\xff\xd8\xff\xe0" + b"\x00" * 32 + b"\xff\xd9"
+
+    def download(url, temp_path, **kwargs):
+        with open(temp_path, "wb") as f:
+            f.write(jpeg)
+        return {
+            "headers": {},
+            "head": jpeg[:16],
+            "tail": jpeg[-16:],
+            "size": len(jpeg),
+            "expected": len(jpeg),
+        }
+
+    crawler.download_manifest = None
+    crawler.media_downloader.download = download
+    file_path = str(tmp_path / "1.jpg")
+    crawler.download_one_file("https://wx1.sinaimg.cn/large/1.jpg", file_path, "img", "1")
+    with open(file_path, "rb") as f:
+        assert f.read() == jpeg
+    crawler.download_one_file("https://wx1.sinaimg.cn/large/1.jpg", file_path, "img", "1")
+    assert "Error" not in caplog.text
+
+
+def test_get_filepath_when_another_sink_created_the_directory(crawler, monkeypatch):
+    csv_path = crawler.get_filepath("csv")
+    isdir = os.path.isdir
+    checked = []
+
+    def isdir_before_other_sink(path):
+        # 另一个写入线程在这次检查之后、创建之前建好了目录
+        if not checked:
+            checked.append(path)
+            return False
+        return isdir(path)
+
+    monkeypatch.setattr(os.path, "isdir", isdir_before_other_sink)
+    assert crawler.get_filepath("csv") == csv_path
+    assert checked == [os.path.dirname(csv_path)]
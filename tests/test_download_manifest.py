@@ -0,0 +1,85 @@
+import threading
+from datetime import datetime, timedelta
+
+from util import download_manifest
+from util.download_manifest import DownloadManifest
+
+
+def line_count(path):
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def test_load_keeps_last_entry_per_file(tmp_path):
+    path = str(tmp_path / "download_manifest.jsonl")
+    manifest = DownloadManifest(path)
+    manifest.add_failed(1, "https://a/1.jpg", "img/1.jpg", "img", "timeout")
+    manifest.add_failed(1, "https://a/1.jpg", "img/1.jpg", "img", "timeout")
+    manifest.add_done(1, "https://a/1.jpg", "img/1.jpg", "img")
+    manifest.add_failed(2, "https://a/2.jpg", "img/2.jpg", "img", "404")
+    # 写入中断留下的不完整行
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"weibo_id": "3"')
+
+    loaded = DownloadManifest(path)
+    assert loaded.is_done(1, "https://a/1.jpg")
+    assert not loaded.is_done(2, "https://a/2.jpg")
+    assert list(loaded.failed) == [("2", "https://a/2.jpg")]
+
+    loaded.add_done(3, "https://a/3.jpg", "img/3.jpg", "img")
+    assert DownloadManifest(path).is_done(3, "https://a/3.jpg")
+
+
+def test_compact_keeps_one_line_per_file(tmp_path):
+    path = str(tmp_path / "download_manifest.jsonl")
+    manifest = DownloadManifest(path)
+    for _ in range(3):
+        manifest.add_failed(1, "https://a/1.jpg", "img/1.jpg", "img")
+    manifest.add_done(2, "https://a/2.jpg", "img/2.jpg", "img")
+    assert line_count(path) == 4
+
+    manifest.compact()
+    assert line_count(path) == 2
+    loaded = DownloadManifest(path)
+    assert loaded.failed[("1", "https://a/1.jpg")]["attempts"] == 3
+    assert loaded.is_done(2, "https://a/2.jpg")
+
+
+def test_load_compacts_large_history(tmp_path):
+    path = str(tmp_path / "download_manifest.jsonl")
+    manifest = DownloadManifest(path)
+    for _ in range(1100):
+        manifest.add_done(1, "https://a/1.jpg", "img/1.jpg", "img")
+    DownloadManifest(path)
+    assert line_count(path) == 1
+
+
+def test_retry_entries_back_off(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / "download_manifest.jsonl"))
+    manifest.add_failed(1, "https://a/1.jpg", "img/1.jpg", "img")
+    for _ in range(download_manifest.RETRY_MAX_ATTEMPTS):
+        manifest.add_failed(2, "https://a/2.jpg", "img/2.jpg", "img")
+    now = datetime.now()
+    assert manifest.get_retry_entries(now)[1:] == (1, 1)
+    due, waiting, given_up = manifest.get_retry_entries(now + timedelta(hours=1))
+    assert [entry["weibo_id"] for entry in due] == ["1"]
+    assert (waiting, given_up) == (0, 1)
+
+
+def test_concurrent_failures_count_every_attempt(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / "download_manifest.jsonl"))
+    threads = [
+        threading.Thread(
+            target=lambda: [
+                manifest.add_failed(1, "https://a/1.jpg", "img/1.jpg", "img") for _ in range(50)
+            ]
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert manifest.failed[("1", "https://a/1.jpg")]["attempts"] == 200
+    loaded = DownloadManifest(manifest.path)
+    assert loaded.failed[("1", "https://a/1.jpg")]["attempts"] == 200
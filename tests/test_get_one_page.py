@@ -0,0 +1,108 @@
+import os
+
+from requests.exceptions import RequestException
+
+from benchmarks.fixtures import mblog
+
+
+def long_cards(count):
+    return [{"card_type": 9, "mblog": mblog(i, long_text=True)} for i in range(count)]
+
+
+def record_detail_requests(crawler):
+    """记录批量获取的长微博id，不发出请求"""
+    requested = []
+
+    def get_many(calls, max_workers=1):
+        requested.extend(url.rsplit("/", 1)[1] for url, _ in calls)
+        return [RequestException("offline")] * len(calls)
+
+    crawler.transport.get_many = get_many
+    return requested
+
+
+def test_prefetch_skips_seen_and_old_posts(crawler):
+    cards = long_cards(4)
+    crawler.weibo_ids.add(int(cards[0]["mblog"]["id"]))
+    cards[1]["mblog"]["created_at"] = "Thu Oct 14 10:00:00 +0800 1999"
+    requested = record_detail_requests(crawler)
+    crawler.prefetch_long_weibos(cards)
+    assert requested == [cards[2]["mblog"]["id"], cards[3]["mblog"]["id"]]
+
+
+def test_prefetch_skips_pinned_posts_in_append_mode(crawler, monkeypatch):
+    import const
+
+    cards = long_cards(2)
+    cards[0]["mblog"]["title"] = {"text": "置顶"}
+    crawler.last_weibo_date = "2000-01-01T00:00:00"
+    requested = record_detail_requests(crawler)
+    monkeypatch.setattr(const, "MODE", "append")
+    crawler.prefetch_long_weibos(cards)
+    assert requested == [cards[1]["mblog"]["id"]]
+
+
+def stored(cards):
+    return {card["mblog"]["id"]: card["mblog"]["edit_count"] for card in cards}
+
+
+def test_is_unchanged_weibo(crawler):
+    cards = long_cards(3)
+    crawler.stored_edit_counts = stored(cards[:2])
+    cards[1]["mblog"]["edit_count"] += 1
+    assert crawler.is_unchanged_weibo(cards[0]["mblog"])
+    # 再次编辑过的和没有写入过的微博需要重新获取
+    assert not crawler.is_unchanged_weibo(cards[1]["mblog"])
+    assert not crawler.is_unchanged_weibo(cards[2]["mblog"])
+
+
+def test_is_unchanged_weibo_keeps_old_posts_and_append_mode(crawler, monkeypatch):
+    import const
+
+    cards = long_cards(1)
+    crawler.stored_edit_counts = stored(cards)
+    crawler.user_config["since_date"] = "2030-01-01T00:00:00"
+    # 早于since_date的微博照常处理，get_one_page才能据此结束翻页
+    assert not crawler.is_unchanged_weibo(cards[0]["mblog"])
+    crawler.user_config["since_date"] = "2000-01-01T00:00:00"
+    monkeypatch.setattr(const, "MODE", "append")
+    assert not crawler.is_unchanged_weibo(cards[0]["mblog"])
+
+
+def test_unchanged_posts_are_skipped_without_parsing(crawler):
+    cards = long_cards(4)
+    crawler.stored_edit_counts = stored(cards[:3])
+    cards[2]["mblog"]["edit_count"] += 1
+    requested = record_detail_requests(crawler)
+    crawler.long_text_workers = 4
+    parsed = []
+    get_one_weibo = crawler.get_one_weibo
+    crawler.get_one_weibo = lambda card: parsed.append(card["mblog"]["id"]) or get_one_weibo(card)
+    crawler.get_long_weibo = lambda id, edit_count=0: None
+    crawler.get_one_page(1, {"ok": 1, "data": {"cards": cards}})
+    changed = [cards[2]["mblog"]["id"], cards[3]["mblog"]["id"]]
+    assert requested == changed
+    assert parsed == changed
+    assert crawler.skipped_count == 2
+    assert [str(w["id"]) for w in crawler.weibo] == changed
+
+
+def test_written_weibos_are_kept_per_write_mode_and_output(crawler, monkeypatch):
+    import const
+
+    monkeypatch.setattr(const, "MODE", "overwrite")
+    crawler.skip_unchanged_weibo = 1
+    crawler.weibo = [card["mblog"] for card in long_cards(2)]
+    crawler.write_csv(0)
+    crawler.record_written_weibos()
+    crawler.open_user_files()
+    assert crawler.stored_edit_counts == stored(long_cards(2))
+
+    crawler.download_comment = 1
+    crawler.open_user_files()
+    assert crawler.stored_edit_counts == {}
+
+    crawler.download_comment = 0
+    os.remove(crawler.get_filepath("csv"))
+    crawler.open_user_files()
+    assert crawler.stored_edit_counts == {}
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from benchmarks.fixtures import timeline_page
+
+
+@pytest.fixture
+def pipelined(crawler):
+    """预取两页的爬虫，列表页用合成数据代替，记录请求的页码和每次写入的范围"""
+    crawler.prefetch_pages = 2
+    crawler.fetched = []
+    crawler.batches = []
+
+    def get_weibo_json(page):
+        crawler.fetched.append(page)
+        return timeline_page(page, per_page=2, retweet_every=100)
+
+    crawler.get_weibo_json = get_weibo_json
+    crawler.write_batch = lambda wrote_count: crawler.batches.append(
+        (wrote_count, crawler.got_count)
+    )
+    return crawler
+
+
+def fetcher_alive():
+    return any(t.name == "page-fetcher" for t in threading.enumerate())
+
+
+def test_pipelined_pages_are_parsed_and_written_in_order(pipelined):
+    pipelined.get_pages_pipelined(range(1, 26))
+    ids = [w["id"] for w in pipelined.weibo]
+    expected = [
+        int(card["mblog"]["id"])
+        for page in range(1, 26)
+        for card in timeline_page(page, per_page=2, retweet_every=100)["data"]["cards"]
+    ]
+    assert ids == expected
+    # 第20页写入一次，剩余的5页在结束时写入
+    assert pipelined.batches == [(0, 40), (40, 50)]
+    assert not fetcher_alive()
+
+
+def test_pipelined_early_end_stops_fetcher(pipelined):
+    get_one_page = pipelined.get_one_page
+    pipelined.get_one_page = lambda page, js=None: get_one_page(page, js) or page == 3
+    pipelined.get_pages_pipelined(range(1, 100))
+    assert pipelined.got_count == 6
+    assert pipelined.batches == [(0, 6)]
+    # 预取线程最多比解析多取队列容量加上正在请求的页面
+    assert max(pipelined.fetched) <= 3 + pipelined.prefetch_pages + 1
+    assert not fetcher_alive()
+
+
+def test_pipelined_fetch_error_is_raised_after_writing(pipelined):
+    get_weibo_json = pipelined.get_weibo_json
+
+    def failing(page):
+        if page == 4:
+            raise RuntimeError("timeline unavailable")
+        return get_weibo_json(page)
+
+    pipelined.get_weibo_json = failing
+    with pytest.raises(RuntimeError):
+        pipelined.get_pages_pipelined(range(1, 10))
+    # 出错前解析的微博仍然写入
+    assert pipelined.batches == [(0, 6)]
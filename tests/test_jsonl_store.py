@@ -0,0 +1,60 @@
+import json
+
+from util.jsonl_store import JsonLinesStore
+
+USER = {"id": "1669879400", "screen_name": "测试用户"}
+
+
+def weibo(id, text):
+    return {"id": id, "text": text}
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_only_changed_posts_are_appended(tmp_path):
+    path = str(tmp_path / "1669879400.jsonl")
+    store = JsonLinesStore(path)
+    assert store.write(USER, [weibo(1, "a"), weibo(2, "b")]) == 2
+    assert store.write(USER, [weibo(1, "a"), weibo(2, "b2"), weibo(3, "c")]) == 2
+    assert len(read_lines(path)) == 4
+
+    loaded = JsonLinesStore(path)
+    assert loaded.user == USER
+    assert list(loaded.iter_weibos()) == [weibo(1, "a"), weibo(2, "b2"), weibo(3, "c")]
+    assert loaded.write(USER, [weibo(3, "c")]) == 0
+
+
+def test_missing_index_lines_are_rebuilt(tmp_path):
+    path = str(tmp_path / "1669879400.jsonl")
+    JsonLinesStore(path).write(USER, [weibo(1, "a")])
+    # 数据文件写入后、索引写入前中断，最后还有一行不完整
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(weibo(2, "b")) + "\n")
+        f.write('{"id": 3')
+
+    loaded = JsonLinesStore(path)
+    assert list(loaded.iter_weibos()) == [weibo(1, "a"), weibo(2, "b")]
+    assert len(read_lines(path)) == 2
+    assert list(JsonLinesStore(path).records) == ["1", "2"]
+
+
+def test_compact_and_export(tmp_path):
+    path = str(tmp_path / "1669879400.jsonl")
+    store = JsonLinesStore(path)
+    store.write(USER, [weibo(1, "a"), weibo(2, "b")])
+    store.write(USER, [weibo(1, "a2")])
+    assert store.compact() == 1
+    assert read_lines(path) == [weibo(1, "a2"), weibo(2, "b")]
+    assert store.compact() == 0
+
+    loaded = JsonLinesStore(path)
+    assert loaded.user == USER
+    assert list(loaded.iter_weibos()) == [weibo(1, "a2"), weibo(2, "b")]
+
+    json_path = str(tmp_path / "1669879400.json")
+    loaded.export_json(json_path)
+    with open(json_path, encoding="utf-8") as f:
+        assert json.load(f) == {"user": USER, "weibo": [weibo(1, "a2"), weibo(2, "b")]}
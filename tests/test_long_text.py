@@ -0,0 +1,63 @@
+import json
+
+from benchmarks.fixtures import mblog
+from util.transport import TransportResponse
+
+
+class FakeTransport(object):
+    """按url返回固定内容的传输层，记录发出的请求"""
+
+    is_async = False
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, family=None, params=None, **kwargs):
+        self.requests.append(url)
+        body = self.pages.get(url, "")
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return TransportResponse(url, 200, {}, body.encode("utf-8"))
+
+    def get_many(self, calls, max_workers=1):
+        return [self.get(url, **kwargs) for url, kwargs in calls]
+
+
+def detail_page(status):
+    return "<script>var $render_data = [%s][0] || {};</script>" % json.dumps(
+        {"status": status}, ensure_ascii=False
+    )
+
+
+def test_status_show_is_tried_once_after_detail_pages_fail(crawler):
+    status = mblog(1, long_text=True)
+    crawler.transport = FakeTransport(
+        {"https://m.weibo.cn/statuses/show": {"ok": 1, "data": status}}
+    )
+    assert crawler.get_long_weibo_status(status["id"]) == status
+    detail_url = "https://m.weibo.cn/detail/%s" % status["id"]
+    assert crawler.transport.requests == [detail_url] * 5 + ["https://m.weibo.cn/statuses/show"]
+
+
+def test_detail_page_is_used_when_it_parses(crawler):
+    status = mblog(1, long_text=True)
+    detail_url = "https://m.weibo.cn/detail/%s" % status["id"]
+    crawler.transport = FakeTransport({detail_url: detail_page(status)})
+    assert crawler.get_long_weibo_status(status["id"]) == status
+    assert crawler.transport.requests == [detail_url]
+
+
+def test_prefetched_long_posts_are_parsed_from_cache(crawler):
+    statuses = [mblog(i, long_text=True) for i in range(3)]
+    crawler.transport = FakeTransport(
+        {"https://m.weibo.cn/detail/%s" % s["id"]: detail_page(s) for s in statuses}
+    )
+    crawler.long_text_workers = 4
+    crawler.prefetch_long_weibos([{"card_type": 9, "mblog": s} for s in statuses])
+    assert len(crawler.transport.requests) == 3
+    for status in statuses:
+        assert crawler.long_text_cache.get(status["id"], status["edit_count"]) == status
+        assert crawler.get_long_weibo(status["id"], status["edit_count"])["id"] == int(status["id"])
+    # 解析时全部命中缓存，不再请求详情页
+    assert len(crawler.transport.requests) == 3
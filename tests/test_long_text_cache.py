@@ -0,0 +1,49 @@
+from util import long_text_cache
+from util.long_text_cache import LongTextCache
+
+
+def test_get_returns_cached_status():
+    cache = LongTextCache()
+    cache.put(1, {"id": "1", "text": "全文"})
+    assert cache.get("1") == {"id": "1", "text": "全文"}
+    assert cache.get(2) is None
+
+
+def test_newer_edit_invalidates_entry():
+    cache = LongTextCache()
+    cache.put("1", {"text": "旧"}, edit_count=1)
+    assert cache.get("1", edit_count=1) == {"text": "旧"}
+    assert cache.get("1", edit_count=2) is None
+
+
+def test_expired_entry_is_ignored(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(long_text_cache, "time", lambda: now[0])
+    cache = LongTextCache(ttl_days=1)
+    cache.put("1", {"text": "全文"})
+    now[0] += 86400 - 1
+    assert cache.get("1") == {"text": "全文"}
+    now[0] += 2
+    assert cache.get("1") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LongTextCache(max_memory_entries=2)
+    cache.put("1", {"text": "一"})
+    cache.put("2", {"text": "二"})
+    cache.get("1")
+    cache.put("3", {"text": "三"})
+    assert list(cache.memory) == ["1", "3"]
+
+
+def test_entries_persist_across_runs(tmp_path):
+    path = str(tmp_path / "cache" / "long_text_cache.db")
+    cache = LongTextCache(path, ttl_days=30)
+    cache.put("1", {"text": "全文"}, edit_count=1)
+    cache.close()
+    cache = LongTextCache(path, ttl_days=30)
+    try:
+        assert cache.get("1", edit_count=1) == {"text": "全文"}
+        assert cache.get("1", edit_count=2) is None
+    finally:
+        cache.close()
@@ -0,0 +1,196 @@
+import os
+import re
+import threading
+
+import pytest
+from requests.exceptions import HTTPError, RequestException
+
+from util.media_downloader import MediaDownloader
+
+URL = "https://wx1.sinaimg.cn/large/1.jpg"
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4 + b"\xff\xd9"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError("%d" % self.status_code, response=self)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """模拟图片CDN：supports_range为False时忽略Range头；truncate_first为真时第一次只返回前一部分"""
+
+    def __init__(self, content, supports_range=True, truncate_first=0):
+        self.content = content
+        self.supports_range = supports_range
+        self.truncate_first = truncate_first
+        self.ranges = []
+
+    def get(self, url, headers=None, stream=False, **kwargs):
+        requested = (headers or {}).get("Range")
+        self.ranges.append(requested)
+        total = len(self.content)
+        if requested and self.supports_range:
+            start = int(re.match(r"bytes=(\d+)-", requested).group(1))
+            if start >= total:
+                return FakeResponse(416, {"Content-Range": "bytes */%d" % total}, b"")
+            body = self.content[start:]
+            headers = {
+                "Content-Range": "bytes %d-%d/%d" % (start, total - 1, total),
+                "Content-Length": str(len(body)),
+            }
+            return FakeResponse(206, headers, body)
+        body = self.content
+        if self.truncate_first:
+            # 连接中途断开，Content-Length仍是完整的大小
+            body, self.truncate_first = body[: self.truncate_first], 0
+        return FakeResponse(200, {"Content-Length": str(total)}, body)
+
+    def close(self):
+        pass
+
+
+def make_downloader(session):
+    downloader = MediaDownloader()
+    downloader.sessions["wx1.sinaimg.cn"] = session
+    downloader.host_slots["wx1.sinaimg.cn"] = threading.BoundedSemaphore(1)
+    return downloader
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_resume_from_partial_file(tmp_path):
+    temp_path = str(tmp_path / "1.jpg.part")
+    write(temp_path, JPEG[:100])
+    session = FakeSession(JPEG)
+    result = make_downloader(session).download(URL, temp_path)
+    assert session.ranges == ["bytes=100-"]
+    assert read(temp_path) == JPEG
+    assert (result["size"], result["expected"]) == (len(JPEG), len(JPEG))
+    assert result["head"] == JPEG[:16]
+    assert result["tail"] == JPEG[-16:]
+
+
+def test_full_response_when_range_is_ignored(tmp_path):
+    temp_path = str(tmp_path / "1.jpg.part")
+    write(temp_path, b"stale partial data")
+    session = FakeSession(JPEG, supports_range=False)
+    result = make_downloader(session).download(URL, temp_path)
+    assert session.ranges == ["bytes=18-"]
+    assert read(temp_path) == JPEG
+    assert result["size"] == result["expected"] == len(JPEG)
+
+
+def test_invalid_resume_position_discards_partial_file(tmp_path):
+    temp_path = str(tmp_path / "1.jpg.part")
+    write(temp_path, JPEG + b"extra")
+    with pytest.raises(RequestException):
+        make_downloader(FakeSession(JPEG)).download(URL, temp_path)
+    assert not os.path.exists(temp_path)
+
+
+def test_truncated_download_resumes_after_backoff(crawler, tmp_path, monkeypatch):
+    import weibo
+
+    sleeps = []
+    monkeypatch.setattr(weibo, "sleep", sleeps.append)
+    session = FakeSession(JPEG, truncate_first=300)
+    crawler.media_downloader = make_downloader(session)
+    file_path = str(tmp_path / "1.jpg")
+    crawler.download_one_file(URL, file_path, "img", "1")
+    assert read(file_path) == JPEG
+    assert not os.path.exists(file_path + ".part")
+    assert session.ranges == [None, "bytes=300-"]
+    assert sleeps == [2]
+
+
+def test_run_downloads_jobs_concurrently_and_reports_each(tmp_path):
+    downloader = MediaDownloader(max_workers=4)
+    barrier = threading.Barrier(4, timeout=5)
+    done = []
+    threads = set()
+
+    def job(index):
+        # 4个任务都开始后才能继续，逐个执行时会超时
+        barrier.wait()
+        threads.add(threading.current_thread().name)
+        if index == 0:
+            raise ValueError("broken file")
+
+    try:
+        downloader.run(job, [(i,) for i in range(4)], on_done=lambda: done.append(1))
+    finally:
+        downloader.close()
+    assert len(done) == 4
+    assert len(threads) == 4
+    assert all(name.startswith("media-download") for name in threads)
+
+
+def test_run_with_one_worker_downloads_in_calling_thread():
+    downloader = MediaDownloader(max_workers=1)
+    threads = []
+    downloader.run(lambda i: threads.append(threading.current_thread()), [(1,), (2,)])
+    assert threads == [threading.current_thread()] * 2
+    assert downloader.executor is None
+
+
+def test_each_host_gets_one_pooled_session():
+    downloader = MediaDownloader(per_host=3)
+    try:
+        first, slots = downloader._get_host("wx1.sinaimg.cn")
+        assert downloader._get_host("wx1.sinaimg.cn")[0] is first
+        assert downloader._get_host("f.video.weibocdn.com")[0] is not first
+        assert first.get_adapter(URL)._pool_maxsize == 3
+    finally:
+        downloader.close()
+
+
+def test_requests_per_host_are_limited():
+    class CountingSession(object):
+        def __init__(self):
+            self.active = 0
+            self.most_active = 0
+            self.lock = threading.Lock()
+            self.release = threading.Event()
+
+        def get(self, url, **kwargs):
+            with self.lock:
+                self.active += 1
+                self.most_active = max(self.most_active, self.active)
+            self.release.wait(0.1)
+            with self.lock:
+                self.active -= 1
+            return FakeResponse(200, {}, b"")
+
+        def close(self):
+            pass
+
+    session = CountingSession()
+    downloader = MediaDownloader(max_workers=6, per_host=2)
+    downloader.sessions["wx1.sinaimg.cn"] = session
+    downloader.host_slots["wx1.sinaimg.cn"] = threading.BoundedSemaphore(2)
+    try:
+        downloader.run(downloader.get, [(URL,)] * 6)
+    finally:
+        downloader.close()
+    assert session.most_active == 2
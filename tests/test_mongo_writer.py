@@ -0,0 +1,97 @@
+import sys
+import types
+
+import pytest
+
+from util.mongo_writer import MongoWriter
+
+
+class OperationFailure(Exception):
+    pass
+
+
+class UpdateOne(object):
+    def __init__(self, filter, update, upsert=False):
+        self.args = (filter, update, upsert)
+
+
+class FakeCollection(object):
+    def __init__(self, name, duplicate_ids=False):
+        self.name = name
+        self.duplicate_ids = duplicate_ids
+        self.indexes = []
+        self.bulk_writes = []
+
+    def create_index(self, key, unique=False):
+        if unique and self.duplicate_ids:
+            raise OperationFailure("E11000 duplicate key")
+        self.indexes.append((key, unique))
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append(([op.args for op in operations], ordered))
+
+
+class FakeClient(object):
+    instances = []
+
+    def __init__(self, uri=None):
+        self.uri = uri
+        self.databases = []
+        self.collections = {}
+        self.closed = False
+        FakeClient.instances.append(self)
+
+    def __getitem__(self, database):
+        self.databases.append(database)
+        # 名为old的集合中有旧版本写入的重复id
+        return {
+            name: self.collections.setdefault(name, FakeCollection(name, name == "old"))
+            for name in ("weibo", "user", "old")
+        }
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """用假的pymongo模块代替真实的MongoDB，返回创建过的客户端"""
+    FakeClient.instances = []
+    errors = types.SimpleNamespace(OperationFailure=OperationFailure)
+    pymongo = types.SimpleNamespace(MongoClient=FakeClient, UpdateOne=UpdateOne, errors=errors)
+    monkeypatch.setitem(sys.modules, "pymongo", pymongo)
+    monkeypatch.setitem(sys.modules, "pymongo.errors", errors)
+    return FakeClient.instances
+
+
+def test_documents_are_upserted_in_unordered_batches(clients):
+    writer = MongoWriter("mongodb://localhost", batch_size=2)
+    documents = [{"id": str(i), "text": "微博%d" % i} for i in range(5)]
+    assert writer.upsert("weibo", documents) == 5
+    collection = clients[0].collections["weibo"]
+    assert [len(ops) for ops, _ in collection.bulk_writes] == [2, 2, 1]
+    assert all(ordered is False for _, ordered in collection.bulk_writes)
+    assert collection.bulk_writes[0][0][0] == (
+        {"id": "0"}, {"$set": {"id": "0", "text": "微博0"}}, True
+    )
+    assert (writer.documents, writer.round_trips) == (5, 4)
+
+
+def test_one_client_and_one_index_per_collection(clients):
+    writer = MongoWriter()
+    writer.upsert("weibo", [{"id": "1"}])
+    writer.upsert("weibo", [{"id": "2"}])
+    writer.upsert("user", [{"id": "3"}])
+    assert writer.upsert("weibo", []) == 0
+    assert len(clients) == 1
+    assert set(clients[0].databases) == {"weibo"}
+    assert clients[0].collections["weibo"].indexes == [("id", True)]
+    assert clients[0].collections["user"].indexes == [("id", True)]
+    writer.close()
+    assert clients[0].closed
+
+
+def test_duplicate_ids_fall_back_to_plain_index(clients):
+    writer = MongoWriter()
+    writer.upsert("old", [{"id": "1"}])
+    assert clients[0].collections["old"].indexes == [("id", False)]
@@ -0,0 +1,130 @@
+import sys
+import threading
+import types
+
+import pytest
+
+from util.mysql_writer import CREATE_DATABASE_SQL, MySQLWriter
+
+CREATE_SQL = ["CREATE TABLE IF NOT EXISTS weibo (id varchar(20))"]
+
+
+class FakeCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args=None):
+        if self.connection.fail:
+            raise RuntimeError("lost connection")
+        self.connection.executed.append((sql, args))
+
+
+class FakeConnection(object):
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.fail = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """用记录执行语句的假连接代替pymysql.connect，返回建立过的连接"""
+    connections = []
+
+    def connect(**kwargs):
+        connection = FakeConnection(kwargs)
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setitem(sys.modules, "pymysql", types.SimpleNamespace(connect=connect))
+    return connections
+
+
+def rows(count, start=0):
+    return [{"id": str(i), "text": "微博%d" % i} for i in range(start, start + count)]
+
+
+def test_schema_is_created_once(connections):
+    writer = MySQLWriter({"host": "localhost", "db": "other"}, CREATE_SQL)
+    writer.insert("weibo", rows(1))
+    writer.insert("weibo", rows(1))
+    schema, pooled = connections
+    assert [sql for sql, _ in schema.executed] == [CREATE_DATABASE_SQL, "USE weibo"] + CREATE_SQL
+    assert schema.closed
+    # 配置中的db被忽略，连接池中的连接固定使用weibo数据库
+    assert schema.kwargs == {"host": "localhost"}
+    assert pooled.kwargs == {"host": "localhost", "db": "weibo"}
+
+
+def test_rows_are_written_in_multi_row_statements(connections):
+    writer = MySQLWriter({}, CREATE_SQL, batch_rows=2)
+    data = rows(3) + [{"id": "9"}]
+    assert writer.insert("weibo", data) == 4
+    pooled = connections[1]
+    sqls = [sql for sql, _ in pooled.executed]
+    assert sqls == [
+        "INSERT INTO weibo(id, text) VALUES (%s, %s), (%s, %s) "
+        "ON DUPLICATE KEY UPDATE id = VALUES(id), text = VALUES(text)",
+        "INSERT INTO weibo(id, text) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE id = VALUES(id), text = VALUES(text)",
+        "INSERT INTO weibo(id) VALUES (%s) ON DUPLICATE KEY UPDATE id = VALUES(id)",
+    ]
+    assert pooled.executed[0][1] == ["0", "微博0", "1", "微博1"]
+    assert pooled.commits == 1
+    assert (writer.statements, writer.rows) == (3, 4)
+
+
+def test_connections_are_reused_up_to_pool_size(connections):
+    writer = MySQLWriter({}, CREATE_SQL, pool_size=2)
+    barrier = threading.Barrier(4, timeout=5)
+
+    def write(start):
+        barrier.wait()
+        for i in range(5):
+            writer.insert("weibo", rows(1, start + i))
+
+    threads = [threading.Thread(target=write, args=(i * 10,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pooled = connections[1:]
+    assert len(pooled) <= 2
+    assert sum(c.commits for c in pooled) == 20
+    writer.close()
+    assert all(c.closed for c in pooled)
+
+
+def test_failed_connection_is_discarded(connections):
+    writer = MySQLWriter({}, CREATE_SQL, pool_size=1)
+    writer.insert("weibo", rows(1))
+    broken = connections[1]
+    broken.fail = True
+    with pytest.raises(RuntimeError):
+        writer.insert("weibo", rows(1))
+    assert broken.rollbacks == 1
+    assert broken.closed
+    writer.insert("weibo", rows(1))
+    assert len(connections) == 3
+    assert connections[2].commits == 1
@@ -0,0 +1,26 @@
+from util import ratelimit
+from util.ratelimit import RateLimiter
+
+
+def jitter_sleeps(monkeypatch, limiter, waited):
+    """令牌桶等待waited秒时，限速器额外随机等待的时长（取上限）"""
+    sleeps = []
+    monkeypatch.setattr(ratelimit, "sleep", sleeps.append)
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(limiter.buckets["timeline"], "acquire", lambda: waited)
+    limiter.acquire("timeline")
+    return sleeps
+
+
+def test_no_jitter_without_waiting(monkeypatch):
+    assert jitter_sleeps(monkeypatch, RateLimiter(), 0.0) == []
+
+
+def test_jitter_is_proportional_to_the_wait(monkeypatch):
+    limiter = RateLimiter(jitter=0.5, max_jitter=2)
+    assert jitter_sleeps(monkeypatch, limiter, 1.0) == [0.5]
+
+
+def test_jitter_is_capped(monkeypatch):
+    limiter = RateLimiter(jitter=0.5, max_jitter=2)
+    assert jitter_sleeps(monkeypatch, limiter, 60.0) == [2]
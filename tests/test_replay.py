@@ -0,0 +1,35 @@
+from time import monotonic
+
+import pytest
+
+from util.capture import NotCapturedError, ReplayTransport
+
+
+def test_missing_request_raises(tmp_path):
+    transport = ReplayTransport(str(tmp_path))
+    with pytest.raises(NotCapturedError):
+        transport.get("https://m.weibo.cn/api/container/getIndex", params={"page": 1})
+    responses = transport.get_many([("https://m.weibo.cn/detail/1", {})])
+    assert isinstance(responses[0], NotCapturedError)
+
+
+def test_missing_page_fails_without_captcha(crawler, tmp_path):
+    crawler.transport = ReplayTransport(str(tmp_path))
+
+    def handle_captcha(js):
+        raise AssertionError("回放时不应处理验证码")
+
+    crawler.handle_captcha = handle_captcha
+    with pytest.raises(NotCapturedError):
+        crawler.get_one_page(1)
+
+
+def test_speed_uses_wall_clock(crawler, caplog):
+    # 两个用户并发爬取，各耗时10秒，整个运行也只用了10秒
+    crawler.start_time = monotonic() - 10
+    crawler.crawl_results = [
+        {"user_id": str(i), "screen_name": "", "got_count": 100, "elapsed": 10, "error": None}
+        for i in range(2)
+    ]
+    crawler.print_crawl_results()
+    assert "平均每秒20.0条" in caplog.text
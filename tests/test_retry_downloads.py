@@ -0,0 +1,108 @@
+import os
+import threading
+
+import pytest
+from requests.exceptions import HTTPError
+
+from util.download_manifest import MANIFEST_NAME, DownloadManifest
+from util.media_downloader import MediaDownloader
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 64 + b"\xff\xd9"
+OK_URL = "https://wx1.sinaimg.cn/large/ok.jpg"
+MISSING_URL = "https://wx1.sinaimg.cn/large/missing.jpg"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=b""):
+        self.status_code = status_code
+        self.headers = {"Content-Length": str(len(body))}
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError("%d" % self.status_code, response=self)
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """OK_URL返回图片，其他url返回404，记录请求的url"""
+
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        if url == OK_URL:
+            return FakeResponse(200, JPEG)
+        return FakeResponse(404)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def retry_crawler(crawler_factory, monkeypatch):
+    import weibo
+
+    monkeypatch.setattr(weibo, "sleep", lambda seconds: None)
+    crawler = crawler_factory()
+    crawler.media_downloader = MediaDownloader(max_workers=1)
+    crawler.session_stub = FakeSession()
+    crawler.media_downloader.sessions["wx1.sinaimg.cn"] = crawler.session_stub
+    crawler.media_downloader.host_slots["wx1.sinaimg.cn"] = threading.BoundedSemaphore(1)
+    crawler.user_dir = os.path.join(crawler.get_result_root(), "测试用户")
+    os.makedirs(os.path.join(crawler.user_dir, "img"))
+    return crawler
+
+
+def test_legacy_failures_are_imported_once(tmp_path):
+    txt_path = str(tmp_path / "not_downloaded.txt")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write("1:img/1.jpg:https://a/1.jpg:https://m.weibo.cn/detail/1\n")
+        f.write("1:img/1.jpg:https://a/1.jpg:https://m.weibo.cn/detail/1\n")
+        f.write("2:img/2.jpg:https://a/2.jpg\n")
+        f.write("无法解析的一行\n")
+    manifest = DownloadManifest(str(tmp_path / MANIFEST_NAME))
+    assert manifest.import_not_downloaded(txt_path, "img") == 2
+    assert not os.path.exists(txt_path)
+    assert os.path.exists(txt_path + ".imported")
+    entry = manifest.failed[("1", "https://a/1.jpg")]
+    assert (entry["path"], entry["type"], entry["attempts"]) == ("img/1.jpg", "img", 0)
+    # 导入的记录立即可以重试
+    assert len(manifest.get_retry_entries()[0]) == 2
+
+
+def test_retry_downloads_due_files_and_records_results(retry_crawler):
+    img_dir = os.path.join(retry_crawler.user_dir, "img")
+    ok_path = os.path.join(img_dir, "ok.jpg")
+    missing_path = os.path.join(img_dir, "missing.jpg")
+    with open(os.path.join(img_dir, "not_downloaded.txt"), "w", encoding="utf-8") as f:
+        f.write("1:%s:%s\n" % (ok_path, OK_URL))
+        f.write("2:%s:%s\n" % (missing_path, MISSING_URL))
+    manifest_path = os.path.join(retry_crawler.user_dir, MANIFEST_NAME)
+    # 刚失败过的文件还没到重试时间
+    DownloadManifest(manifest_path).add_failed(
+        3, "https://wx1.sinaimg.cn/large/3.jpg", os.path.join(img_dir, "3.jpg"), "img"
+    )
+
+    counts = retry_crawler.retry_downloads()
+    assert dict(counts) == {
+        "retried": 2, "succeeded": 1, "failed": 1, "waiting": 1, "given_up": 0
+    }
+    with open(ok_path, "rb") as f:
+        assert f.read() == JPEG
+    manifest = DownloadManifest(manifest_path)
+    assert manifest.is_done(1, OK_URL)
+    assert manifest.failed[("2", MISSING_URL)]["attempts"] == 1
+    assert retry_crawler.download_manifest is None
+
+    # 再次运行时失败的文件在等待重试，成功的文件不再下载
+    requested = len(retry_crawler.session_stub.urls)
+    counts = retry_crawler.retry_downloads()
+    assert (counts["retried"], counts["waiting"]) == (0, 2)
+    assert len(retry_crawler.session_stub.urls) == requested
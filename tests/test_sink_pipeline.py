@@ -0,0 +1,94 @@
+import csv
+import threading
+
+import pytest
+
+from benchmarks.fixtures import timeline_page
+from util.sink_pipeline import SinkPipeline
+
+
+def recording_sink(written):
+    def write(batch):
+        written.append((batch, threading.current_thread().name))
+
+    return write
+
+
+def test_each_sink_writes_every_batch_in_order_on_its_own_thread():
+    a, b = [], []
+    pipeline = SinkPipeline({"a": recording_sink(a), "b": recording_sink(b)})
+    for batch in range(5):
+        pipeline.submit(batch)
+    pipeline.close()
+    assert a == [(batch, "sink-a") for batch in range(5)]
+    assert b == [(batch, "sink-b") for batch in range(5)]
+    assert pipeline.stats()["a"]["batches"] == 5
+
+
+def test_slow_sink_does_not_hold_back_other_sinks():
+    release = threading.Event()
+    fast_done = threading.Event()
+    fast = []
+
+    def slow(batch):
+        release.wait(5)
+
+    def write_fast(batch):
+        fast.append(batch)
+        if len(fast) == 2:
+            fast_done.set()
+
+    pipeline = SinkPipeline({"slow": slow, "fast": write_fast}, max_pending=2)
+    pipeline.submit(1)
+    pipeline.submit(2)
+    assert fast_done.wait(5)
+    release.set()
+    pipeline.close()
+    assert fast == [1, 2]
+
+
+def test_failed_batch_is_recorded_and_later_batches_still_written():
+    written = []
+
+    def write(batch):
+        if batch == 1:
+            raise ValueError("bad batch")
+        written.append(batch)
+
+    pipeline = SinkPipeline({"csv": write})
+    for batch in range(3):
+        pipeline.submit(batch)
+    pipeline.close()
+    assert written == [0, 2]
+    assert pipeline.errors == ["csv写入失败: bad batch"]
+
+
+def test_sink_exit_is_raised_from_close():
+    written = []
+
+    def write(batch):
+        if batch == 0:
+            raise SystemExit("缺少依赖")
+        written.append(batch)
+
+    pipeline = SinkPipeline({"mysql": write})
+    pipeline.submit(0)
+    pipeline.submit(1)
+    with pytest.raises(SystemExit):
+        pipeline.close()
+    # 要求退出后不再写入之后的批次
+    assert written == []
+
+
+def test_crawler_writes_batches_through_pipeline(crawler):
+    crawler.sink_pipeline = crawler.create_sink_pipeline()
+    wrote_count = 0
+    for page in (1, 2):
+        crawler.get_one_page(page, timeline_page(page, retweet_every=100))
+        crawler.write_batch(wrote_count)
+        wrote_count = crawler.got_count
+    crawler.sink_pipeline.close()
+    with open(crawler.get_filepath("csv"), encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))[1:]
+    assert [int(row[0]) for row in rows] == [w["id"] for w in crawler.weibo]
+    assert len(rows) == 20
@@ -0,0 +1,34 @@
+import sqlite3
+
+from util import sqlite_schema
+from weibo import Weibo
+
+CREATE_SQL = Weibo.get_sqlite_create_sql(None)
+
+
+def columns(con, table):
+    return [row[1] for row in con.execute("PRAGMA table_info(%s)" % table)]
+
+
+def test_migrate_database_without_version(tmp_path):
+    con = sqlite3.connect(str(tmp_path / "old.db"))
+    # 旧版本建的库：没有版本号，weibo表没有edited、edit_count列
+    old_sql = CREATE_SQL.replace(
+        "                    ,edited BOOLEAN DEFAULT 0\n                    ,edit_count INT DEFAULT 0\n                    ,PRIMARY KEY (id)\n                );\n\n                CREATE TABLE IF NOT EXISTS bins",
+        "                    ,PRIMARY KEY (id)\n                );\n\n                CREATE TABLE IF NOT EXISTS bins",
+    )
+    con.executescript(old_sql)
+    assert "edit_count" not in columns(con, "weibo")
+    user_columns = columns(con, "user")
+
+    assert sqlite_schema.migrate(con, CREATE_SQL) == sqlite_schema.SCHEMA_VERSION
+    assert sqlite_schema.get_version(con) == sqlite_schema.SCHEMA_VERSION
+    assert columns(con, "weibo")[-2:] == ["edited", "edit_count"]
+    assert columns(con, "user") == user_columns
+    assert {"sha256", "size"} <= set(columns(con, "bins"))
+    indexes = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_weibo_user_created", "idx_bins_path", "idx_bins_sha256"} <= indexes
+
+    # 已是最新版本时不再升级
+    assert sqlite_schema.migrate(con, CREATE_SQL) == sqlite_schema.SCHEMA_VERSION
+    con.close()
@@ -0,0 +1,92 @@
+import sqlite3
+from time import monotonic, sleep
+
+import pytest
+
+from util.sqlite_writer import SQLiteWriter
+from weibo import Weibo
+
+CREATE_SQL = Weibo.get_sqlite_create_sql(None)
+
+
+def make_writer(tmp_path, **kwargs):
+    return SQLiteWriter(str(tmp_path / "test.db"), CREATE_SQL, **kwargs)
+
+
+def test_flush_writes_pending_rows(tmp_path):
+    writer = make_writer(tmp_path)
+    for i in range(3):
+        writer.insert("user", {"id": str(i), "nick_name": "n%d" % i})
+    assert writer.fetchone("SELECT count(*) FROM user") == (3,)
+    writer.close()
+    assert writer.rows == 3
+
+
+def test_bad_row_is_skipped_and_others_are_kept(tmp_path, caplog):
+    writer = make_writer(tmp_path)
+    writer.insert("user", {"id": "1", "nick_name": "a"})
+    writer.insert("user", {"id": "2", "nick_name": None})  # 违反NOT NULL
+    writer.insert("user", {"id": "3", "nick_name": "c"})
+    writer.flush()
+    assert writer.fetchone("SELECT group_concat(id) FROM user") == ("1,3",)
+    assert writer.rows == 2
+    assert writer.failed_rows == 1
+    assert writer.pending == []
+    assert "'2'" in caplog.text
+    writer.close()
+
+
+def test_operational_error_keeps_pending_rows(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.insert("missing", {"id": "1"})
+    with pytest.raises(sqlite3.OperationalError):
+        writer.flush()
+    assert writer.pending_rows == 1
+    writer.pending = []
+    writer.pending_rows = 0
+    writer.close()
+
+
+def count_committed(tmp_path):
+    """用另一个连接查询，只能看到已提交的行"""
+    con = sqlite3.connect(str(tmp_path / "test.db"))
+    try:
+        return con.execute("SELECT count(*) FROM user").fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_fetchone_reads_pending_rows_without_committing(tmp_path):
+    writer = make_writer(tmp_path, commit_interval=60)
+    writer.insert("user", {"id": "1", "nick_name": "a"})
+    assert writer.fetchone("SELECT nick_name FROM user WHERE id=?", ("1",)) == ("a",)
+    writer.insert("user", {"id": "2", "nick_name": "b"})
+    assert writer.fetchone("SELECT count(*) FROM user") == (2,)
+    assert writer.commits == 0
+    assert count_committed(tmp_path) == 0
+    writer.close()
+    assert count_committed(tmp_path) == 2
+    assert writer.rows == 2
+
+
+def test_pending_rows_are_committed_on_a_timer(tmp_path):
+    writer = make_writer(tmp_path, commit_interval=0.1)
+    writer.insert("user", {"id": "1", "nick_name": "a"})
+    deadline = monotonic() + 5
+    while writer.commits == 0 and monotonic() < deadline:
+        sleep(0.02)
+    assert writer.commits == 1
+    assert count_committed(tmp_path) == 1
+    writer.close()
+
+
+def test_bad_row_after_a_query_keeps_earlier_rows(tmp_path):
+    writer = make_writer(tmp_path, commit_interval=60)
+    writer.insert("user", {"id": "1", "nick_name": "a"})
+    writer.fetchone("SELECT 1")
+    writer.insert("user", {"id": "2", "nick_name": None})  # 违反NOT NULL
+    writer.insert("user", {"id": "3", "nick_name": "c"})
+    writer.flush()
+    assert count_committed(tmp_path) == 2
+    assert (writer.rows, writer.failed_rows, writer.pending_rows) == (2, 1, 0)
+    writer.close()
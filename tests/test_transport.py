@@ -0,0 +1,82 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+pytest.importorskip("aiohttp")
+
+from util.transport import AsyncTransport  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+    # 前drops次请求直接断开连接
+    drops = 0
+
+    def do_GET(self):
+        if Handler.drops > 0:
+            Handler.drops -= 1
+            self.close_connection = True
+            self.connection.close()
+            return
+        body = (self.headers.get("Cookie") or "").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Set-Cookie", "XSRF-TOKEN=abc; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:%d/api" % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session():
+    return requests.Session()
+
+
+@pytest.fixture
+def transport(session):
+    transport = AsyncTransport(session, backoff_factor=0.01)
+    yield transport
+    transport.close()
+
+
+def test_cookies_are_shared_with_the_session(transport, session, url):
+    session.cookies.set("SUB", "new")
+    assert transport.get(url, timeout=5).text == "SUB=new"
+    assert session.cookies.get("XSRF-TOKEN") == "abc"
+    assert "XSRF-TOKEN=abc" in transport.get(url, timeout=5).text
+
+
+def test_connection_errors_are_retried(transport, url):
+    Handler.drops = 2
+    assert transport.get(url, timeout=5).status_code == 200
+    Handler.drops = 100
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.get(url, timeout=5)
+    finally:
+        Handler.drops = 0
+
+
+def test_async_falls_back_to_sync_without_aiohttp(crawler, monkeypatch, caplog):
+    import sys
+
+    from util.transport import SyncTransport
+
+    monkeypatch.setitem(sys.modules, "aiohttp", None)
+    crawler.replay_dir = None
+    transport = crawler.create_transport({"http_transport": "async"})
+    assert isinstance(transport, SyncTransport)
+    assert "pip install aiohttp" in caplog.text
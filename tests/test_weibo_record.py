@@ -0,0 +1,50 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+from util.weibo_record import UserRecord, WeiboRecord, to_dict
+
+
+def test_keys_follow_field_order_then_extra_keys():
+    record = WeiboRecord()
+    record["text"] = "正文"
+    record["id"] = "1"
+    record["custom"] = 1
+    record["user_id"] = 2
+    assert list(record) == ["user_id", "id", "text", "custom"]
+    assert len(record) == 4
+    assert "bid" not in record
+    assert record.get("bid") is None
+    with pytest.raises(KeyError):
+        record["bid"]
+
+
+def test_delete_and_update():
+    record = UserRecord()
+    record.update(id="1", screen_name="测试用户", extra="x")
+    del record["screen_name"]
+    del record["extra"]
+    assert dict(record) == {"id": "1"}
+    with pytest.raises(KeyError):
+        del record["screen_name"]
+    with pytest.raises(KeyError):
+        del record["extra"]
+    assert record.setdefault("gender", "f") == "f"
+    assert record.pop("gender") == "f"
+    assert record == {"id": "1"}
+
+
+def test_to_dict_converts_nested_records():
+    retweet = WeiboRecord()
+    retweet["id"] = "2"
+    weibo = WeiboRecord()
+    weibo["id"] = "1"
+    weibo["retweet"] = retweet
+    converted = to_dict(weibo)
+    assert isinstance(converted, OrderedDict)
+    assert isinstance(converted["retweet"], OrderedDict)
+    assert json.dumps(converted) == '{"id": "1", "retweet": {"id": "2"}}'
+    plain = {"id": "3"}
+    assert to_dict(plain) is plain
+
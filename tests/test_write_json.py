@@ -0,0 +1,40 @@
+import json
+
+from benchmarks.fixtures import timeline_page
+
+
+def post(id, edit_count=0, text=""):
+    return {"id": id, "edit_count": edit_count, "text": text}
+
+
+def test_update_json_data_merges_by_id(crawler):
+    data = {"weibo": [post(1, text="一"), post(2, 1, text="二"), post(3, text="三")]}
+    data = crawler.update_json_data(
+        data, [post(4, text="四"), post(2, 2, text="编辑后"), post(3, text="再次获取")]
+    )
+    assert data["user"] == {"id": "1669879400", "screen_name": "测试用户"}
+    assert data["weibo"] == [
+        post(1, text="一"),
+        post(2, 2, text="编辑后"),
+        post(3, text="再次获取"),
+        post(4, text="四"),
+    ]
+
+
+def test_update_json_data_keeps_more_edited_version(crawler):
+    data = {"weibo": [post(1, 3, text="编辑三次")]}
+    data = crawler.update_json_data(data, [post(1, 1, text="旧版本")])
+    assert data["weibo"] == [post(1, 3, text="编辑三次")]
+
+
+def test_write_json_merges_batches_without_duplicates(crawler):
+    crawler.get_one_page(1, timeline_page(1, retweet_every=100))
+    crawler.write_json(0)
+    crawler.get_one_page(2, timeline_page(2, retweet_every=100))
+    crawler.write_json(10)
+    # 重新写入全部微博时已有的微博原位更新
+    crawler.write_json(0)
+    with open(crawler.get_filepath("json"), encoding="utf-8") as f:
+        data = json.load(f)
+    assert [w["id"] for w in data["weibo"]] == [w["id"] for w in crawler.weibo]
+    assert len(data["weibo"]) == 20
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import shutil
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore(object):
+    """内容寻址的文件存储
+
+    图片视频按内容的sha256保存为root/ab/cd/abcd...，相同内容只保存一份，
+    多个用户转发的同一张图片不会重复占用空间。数据库中只记录sha256和文件信息，
+    不再保存二进制数据。结果目录中的文件通过硬链接指向存储中的文件，
+    不支持硬链接时复制一份。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.isfile(self.get_path(digest))
+
+    def _temp_path(self, path):
+        return "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+
+    def _prepare_dir(self, path):
+        dir_name = os.path.dirname(path)
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+
+    def put(self, data):
+        """保存二进制数据，返回sha256"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.isfile(path):
+            self._prepare_dir(path)
+            temp_path = self._temp_path(path)
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return digest
+
+    def put_file(self, src_path, digest=None):
+        """把已写好的文件移入存储，返回sha256，已有相同内容时删除src_path"""
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(src_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+        path = self.get_path(digest)
+        if os.path.isfile(path):
+            os.remove(src_path)
+        else:
+            self._prepare_dir(path)
+            try:
+                os.replace(src_path, path)
+            except OSError:
+                # 不在同一个文件系统上时先复制到存储目录再替换
+                temp_path = self._temp_path(path)
+                shutil.copyfile(src_path, temp_path)
+                os.replace(temp_path, path)
+                os.remove(src_path)
+        return digest
+
+    def link(self, digest, target):
+        """在target处生成指向存储中文件的硬链接，不支持硬链接时复制"""
+        path = self.get_path(digest)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(path, target)
+
+    def read(self, digest):
+        with open(self.get_path(digest), "rb") as f:
+            return f.read()
@@ -0,0 +1,204 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from time import time
+
+from util.transport import TransportResponse
+
+logger = logging.getLogger("weibo")
+
+# 二进制的图片视频不记录
+SKIP_FAMILIES = ("media",)
+# 同时打开的记录文件数
+MAX_OPEN_FILES = 16
+
+
+class ResponseCapture(object):
+    """原始响应记录
+
+    将接口返回的原始数据按用户追加写入gzip压缩的JSON Lines文件，每行一条记录，
+    包含请求类型、url、参数、状态码和响应正文，可用于排查问题和离线回放解析。
+    记录先放入有界队列，由后台线程压缩写入，不阻塞爬取；队列满时丢弃记录。
+    每个用户的文件超过max_mb后轮换为.1文件，只保留最近两份。
+    """
+
+    def __init__(self, dir_path, max_mb=50, max_queue=1000):
+        self.dir_path = dir_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.files = {}
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+        self.thread = threading.Thread(
+            target=self._write_loop, name="response-capture", daemon=True
+        )
+        self.thread.start()
+
+    def get_path(self, user_id):
+        safe_user_id = re.sub(r"[^\w-]", "_", str(user_id or "unknown"))
+        return os.path.join(self.dir_path, safe_user_id + ".jsonl.gz")
+
+    def record(self, user_id, family, url, params, response):
+        """记录一条响应，队列已满时直接丢弃"""
+        if family in SKIP_FAMILIES:
+            return
+        item = (
+            user_id,
+            {
+                "ts": round(time(), 3),
+                "family": family,
+                "url": url,
+                "params": params or {},
+                "status": response.status_code,
+                "body": response.text,
+            },
+        )
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self, user_id):
+        path = self.get_path(user_id)
+        if os.path.isfile(path) and os.path.getsize(path) >= self.max_bytes:
+            os.replace(path, path + ".1")
+        return gzip.open(path, "ab")
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            user_id, entry = item
+            try:
+                f = self.files.get(user_id)
+                if f is None:
+                    if len(self.files) >= MAX_OPEN_FILES:
+                        # 关闭最早打开的文件，避免用户很多时占用过多文件句柄
+                        self.files.pop(next(iter(self.files))).close()
+                    f = self.files[user_id] = self._open(user_id)
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+                if f.fileobj.tell() >= self.max_bytes:
+                    f.close()
+                    self.files[user_id] = self._open(user_id)
+            except Exception as e:
+                logger.exception(e)
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped:
+            logger.warning("原始响应记录队列已满，丢弃了%d条记录", self.dropped)
+
+
+class CapturingTransport(object):
+    """在其他传输层外记录原始响应，owner为当前爬虫，用于确定记录属于哪个用户"""
+
+    def __init__(self, transport, capture, owner):
+        self.transport = transport
+        self.capture = capture
+        self.owner = owner
+        self.is_async = transport.is_async
+
+    def bind(self, owner):
+        """返回记录到另一个爬虫名下的传输层，多用户并发爬取时每个线程各用一个"""
+        return CapturingTransport(self.transport, self.capture, owner)
+
+    def _user_id(self):
+        return (self.owner.user_config or {}).get("user_id", "")
+
+    def get(self, url, family=None, **kwargs):
+        response = self.transport.get(url, family=family, **kwargs)
+        self.capture.record(self._user_id(), family, url, kwargs.get("params"), response)
+        return response
+
+    def get_many(self, calls, max_workers=1):
+        responses = self.transport.get_many(calls, max_workers=max_workers)
+        user_id = self._user_id()
+        for (url, kwargs), response in zip(calls, responses):
+            if not isinstance(response, Exception):
+                self.capture.record(
+                    user_id, kwargs.get("family"), url, kwargs.get("params"), response
+                )
+        return responses
+
+    def close(self):
+        self.transport.close()
+        self.capture.close()
+
+
+class NotCapturedError(Exception):
+    """回放数据中没有记录该请求
+
+    不是RequestException，爬虫不会当作网络错误重试，也不会当作验证码等待用户输入
+    """
+
+
+class ReplayTransport(object):
+    """离线回放传输层
+
+    从ResponseCapture记录的文件中读取原始响应，按url和参数返回，不发出任何网络请求，
+    用于在不访问m.weibo.cn的情况下重跑解析和写入流程。同一请求记录了多次时按记录
+    顺序依次返回，用完后重复返回最后一次的响应。没有记录的请求抛出NotCapturedError。
+    """
+
+    is_async = False
+
+    def __init__(self, dir_path):
+        self.responses = {}
+        self.served = {}
+        self.misses = 0
+        for name in sorted(os.listdir(dir_path)):
+            if not (name.endswith(".jsonl.gz") or name.endswith(".jsonl.gz.1")):
+                continue
+            with gzip.open(os.path.join(dir_path, name), "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 被中断的写入可能留下不完整的最后一行
+                        continue
+                    key = self.get_key(entry["url"], entry.get("params"))
+                    self.responses.setdefault(key, []).append(entry)
+        logger.info("从%s载入%d个请求的回放数据", dir_path, len(self.responses))
+
+    def get_key(self, url, params):
+        params = {k: str(v) for k, v in (params or {}).items() if v is not None}
+        return url + "?" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+    def get(self, url, family=None, **kwargs):
+        key = self.get_key(url, kwargs.get("params"))
+        entries = self.responses.get(key)
+        if not entries:
+            self.misses += 1
+            raise NotCapturedError("回放数据中没有请求：%s" % key)
+        index = self.served.get(key, 0)
+        self.served[key] = index + 1
+        entry = entries[min(index, len(entries) - 1)]
+        return TransportResponse(url, entry["status"], {}, entry["body"].encode("utf-8"))
+
+    def _get_or_error(self, call):
+        url, kwargs = call
+        try:
+            return self.get(url, **kwargs)
+        except NotCapturedError as e:
+            return e
+
+    def get_many(self, calls, max_workers=1):
+        """与SyncTransport相同，没有记录的请求对应位置为异常对象"""
+        return [self._get_or_error(call) for call in calls]
+
+    def close(self):
+        if self.misses:
+            logger.warning("回放过程中有%d个请求没有记录", self.misses)
+
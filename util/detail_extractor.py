@@ -0,0 +1,37 @@
+import json
+
+RENDER_DATA_MARK = "$render_data"
+STATUS_KEY = '"status"'
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+def extract_status(html):
+    """
+    从m.weibo.cn/detail页面中提取status对象
+
+    页面中的微博数据以 var $render_data = [{"status": {...}, ...}][0] || {}; 的形式
+    嵌在script里。先定位$render_data，再找到其后的"status"键，从键值的起始位置
+    直接解码出status这一个对象，不复制页面的其他部分，也不依赖status之后的字段。
+    找不到或解码失败时返回None。
+    """
+    if not html:
+        return None
+    start = html.find(RENDER_DATA_MARK)
+    key = html.find(STATUS_KEY, start if start >= 0 else 0)
+    if key < 0:
+        return None
+    colon = html.find(":", key + len(STATUS_KEY))
+    if colon < 0:
+        return None
+    value = colon + 1
+    length = len(html)
+    while value < length and html[value] in " \t\r\n":
+        value += 1
+    if value >= length or html[value] != "{":
+        return None
+    try:
+        status, _ = _decoder.raw_decode(html, value)
+    except ValueError:
+        return None
+    return status if isinstance(status, dict) else None
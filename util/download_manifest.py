@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("weibo")
+
+MANIFEST_NAME = "download_manifest.jsonl"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# 下载失败的文件在重试前等待的时间，每失败一次翻倍
+RETRY_BASE_SECONDS = 10 * 60
+RETRY_MAX_SECONDS = 24 * 60 * 60
+RETRY_MAX_ATTEMPTS = 8  # 失败次数达到后不再重试
+# 旧版本not_downloaded.txt中的一行：weibo_id:文件路径:url[:原微博url]
+NOT_DOWNLOADED_LINE = re.compile(
+    r"^(\d+):(.*?):(https?://.*?)(?::https://m\.weibo\.cn/detail/\d+)?$"
+)
+
+
+def get_next_retry_time(entry):
+    """失败记录下次可以重试的时间"""
+    attempts = entry.get("attempts", 0)
+    if attempts <= 0:
+        return datetime.min
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return datetime.strptime(entry["time"], TIME_FORMAT) + timedelta(seconds=delay)
+
+
+class DownloadManifest(object):
+    """图片视频下载记录
+
+    每个用户目录下一个download_manifest.jsonl，每行一条记录，包含文件的url、所属
+    微博id、保存路径、类型和下载状态(done/failed)，同一文件以最后一条记录为准。
+    开始下载前把记录一次性读入内存，判断文件是否已下载只需查字典，不必逐个文件
+    检查磁盘或数据库；下载失败的文件及失败次数也记录在这里，用于之后重试。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self.failed = {}
+        self.lock = threading.Lock()
+        self.needs_newline = False  # 文件末尾是写入中断留下的不完整行
+        self.load()
+
+    def load(self):
+        self.done = {}
+        self.failed = {}
+        if not os.path.isfile(self.path):
+            return
+        line_count = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self.needs_newline = not line.endswith("\n")
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 写入中断时最后一行可能不完整
+                    logger.warning("跳过下载记录中无法解析的一行: %s", self.path)
+                    continue
+                line_count += 1
+                self._apply(entry)
+        if line_count > 2 * (len(self.done) + len(self.failed)) + 1000:
+            self.compact()
+
+    def _apply(self, entry):
+        key = (str(entry["weibo_id"]), entry["url"])
+        if entry.get("status") == "done":
+            self.done[key] = entry
+            self.failed.pop(key, None)
+        else:
+            self.failed[key] = entry
+
+    def _append(self, entry):
+        with self.lock:
+            if entry.get("status") == "failed" and "attempts" not in entry:
+                # 失败次数在锁内根据已有记录计算，同一文件同时失败时不会少算
+                previous = self.failed.get((str(entry["weibo_id"]), entry["url"]))
+                entry["attempts"] = (previous or {}).get("attempts", 0) + 1
+            self._apply(entry)
+            dir_name = os.path.dirname(self.path)
+            if dir_name and not os.path.isdir(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self.needs_newline:
+                    f.write("\n")
+                    self.needs_newline = False
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def compact(self):
+        """重写记录文件，每个文件只保留最后一条记录"""
+        with self.lock:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for entries in (self.done, self.failed):
+                    for entry in entries.values():
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.path)
+            self.needs_newline = False
+
+    def is_done(self, weibo_id, url):
+        return (str(weibo_id), url) in self.done
+
+    def add_done(self, weibo_id, url, path, type):
+        self._append(
+            {
+                "weibo_id": str(weibo_id),
+                "url": url,
+                "path": path,
+                "type": type,
+                "status": "done",
+                "time": datetime.now().strftime(TIME_FORMAT),
+            }
+        )
+
+    def add_failed(self, weibo_id, url, path, type, error=""):
+        self._append(
+            {
+                "weibo_id": str(weibo_id),
+                "url": url,
+                "path": path,
+                "type": type,
+                "status": "failed",
+                "error": str(error),
+                "time": datetime.now().strftime(TIME_FORMAT),
+            }
+        )
+
+    def get_retry_entries(self, now=None):
+        """
+        返回(到了重试时间的失败记录, 还未到重试时间的数量, 已放弃重试的数量)
+        """
+        now = now or datetime.now()
+        due = []
+        waiting = 0
+        given_up = 0
+        for entry in list(self.failed.values()):
+            if entry.get("attempts", 0) >= RETRY_MAX_ATTEMPTS:
+                given_up += 1
+            elif get_next_retry_time(entry) > now:
+                waiting += 1
+            else:
+                due.append(entry)
+        return due, waiting, given_up
+
+    def import_not_downloaded(self, txt_path, type):
+        """
+        把旧版本写入的not_downloaded.txt导入下载记录，导入后改名为
+        not_downloaded.txt.imported，返回导入的文件数
+        """
+        count = 0
+        with open(txt_path, "rb") as f:
+            lines = f.read().decode("utf-8", "ignore").splitlines()
+        for line in lines:
+            match = NOT_DOWNLOADED_LINE.match(line.strip())
+            if not match:
+                continue
+            weibo_id, path, url = match.groups()
+            key = (weibo_id, url)
+            if key in self.done or key in self.failed:
+                continue
+            self._append(
+                {
+                    "weibo_id": weibo_id,
+                    "url": url,
+                    "path": path,
+                    "type": type,
+                    "status": "failed",
+                    "attempts": 0,
+                    "error": "not_downloaded.txt",
+                    "time": datetime.now().strftime(TIME_FORMAT),
+                }
+            )
+            count += 1
+        os.replace(txt_path, txt_path + ".imported")
+        return count
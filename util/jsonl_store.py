@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger("weibo")
+
+
+def get_record_hash(line):
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+
+class JsonLinesStore(object):
+    """按行追加写入的微博json结果文件
+
+    数据文件<user_id>.jsonl每行一条微博，微博内容有变化时在文件末尾追加新的一行，
+    不修改已写入的内容；索引文件<user_id>.jsonl.idx同样逐行追加，记录每条微博
+    最新一行在数据文件中的位置、长度和内容摘要，以及用户信息。写入时只追加新增
+    或内容有变化的微博，不必读取和重写整个文件。compact去掉数据文件中过时的行，
+    export_json生成与json写入方式格式相同的单个json文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.records = OrderedDict()  # 微博id -> (位置, 长度, 摘要)，按首次写入的顺序
+        self.user = None
+        self.load()
+
+    def load(self):
+        self.records = OrderedDict()
+        self.user = None
+        if not os.path.isfile(self.path):
+            return
+        end = 0
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "user" in entry:
+                        self.user = entry["user"]
+                    else:
+                        self.records[entry["id"]] = (
+                            entry["offset"],
+                            entry["length"],
+                            entry["hash"],
+                        )
+                        end = max(end, entry["offset"] + entry["length"])
+        # 数据文件写入后、索引写入前中断时，补充索引数据文件末尾未记录的行
+        if os.path.getsize(self.path) > end:
+            self._index_tail(end)
+
+    def _index_tail(self, offset):
+        entries = []
+        with open(self.path, "rb+") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 写入中断留下的不完整行
+                    f.truncate(offset)
+                    break
+                record = json.loads(line)
+                entry = (offset, len(line), get_record_hash(line))
+                self.records[str(record["id"])] = entry
+                entries.append(entry + (str(record["id"]),))
+                offset += len(line)
+        if entries:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for offset, length, digest, weibo_id in entries:
+                    f.write(self._index_line(weibo_id, offset, length, digest))
+
+    def _index_line(self, weibo_id, offset, length, digest):
+        return (
+            json.dumps(
+                {"id": weibo_id, "offset": offset, "length": length, "hash": digest}
+            )
+            + "\n"
+        )
+
+    def write(self, user, weibos):
+        """写入用户信息和微博，返回新增或更新的微博数"""
+        lines = []
+        for weibo in weibos:
+            line = (json.dumps(weibo, ensure_ascii=False) + "\n").encode("utf-8")
+            digest = get_record_hash(line)
+            old = self.records.get(str(weibo["id"]))
+            if old and old[2] == digest:
+                continue
+            lines.append((str(weibo["id"]), line, digest))
+        index_lines = []
+        if lines:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                for weibo_id, line, digest in lines:
+                    f.write(line)
+                    self.records[weibo_id] = (offset, len(line), digest)
+                    index_lines.append(self._index_line(weibo_id, offset, len(line), digest))
+                    offset += len(line)
+        if user != self.user:
+            self.user = user
+            index_lines.append(json.dumps({"user": user}, ensure_ascii=False) + "\n")
+        if index_lines:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(index_lines)
+        return len(lines)
+
+    def iter_weibos(self):
+        """按首次写入的顺序返回每条微博的最新内容"""
+        if not self.records:
+            return
+        with open(self.path, "rb") as f:
+            for offset, length, _ in self.records.values():
+                f.seek(offset)
+                yield json.loads(f.read(length))
+
+    def compact(self):
+        """重写数据文件，只保留每条微博的最新一行，返回去掉的行数"""
+        if not os.path.isfile(self.path):
+            return 0
+        line_count = 0
+        with open(self.path, "rb") as f:
+            for _ in f:
+                line_count += 1
+        if line_count == len(self.records):
+            return 0
+        temp_path = self.path + ".tmp"
+        records = OrderedDict()
+        with open(temp_path, "wb") as f:
+            for weibo in self.iter_weibos():
+                line = (json.dumps(weibo, ensure_ascii=False) + "\n").encode("utf-8")
+                records[str(weibo["id"])] = (f.tell(), len(line), get_record_hash(line))
+                f.write(line)
+        # 先删除旧索引，替换数据文件后中断时下次读取会重新建立索引
+        if os.path.isfile(self.index_path):
+            os.remove(self.index_path)
+        os.replace(temp_path, self.path)
+        self.records = records
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            for weibo_id, (offset, length, digest) in records.items():
+                f.write(self._index_line(weibo_id, offset, length, digest))
+            if self.user is not None:
+                f.write(json.dumps({"user": self.user}, ensure_ascii=False) + "\n")
+        os.replace(self.index_path + ".tmp", self.index_path)
+        return line_count - len(records)
+
+    def export_json(self, json_path):
+        """生成{"user": ..., "weibo": [...]}格式的json文件"""
+        temp_path = json_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write('{"user": ')
+            json.dump(self.user or {}, f, ensure_ascii=False)
+            f.write(', "weibo": [')
+            for i, weibo in enumerate(self.iter_weibos()):
+                if i:
+                    f.write(", ")
+                json.dump(weibo, f, ensure_ascii=False)
+            f.write("]}")
+        os.replace(temp_path, json_path)
+
+
+def compact_all(root):
+    """整理root下各用户文件夹中的jsonl结果文件并生成对应的json文件，返回处理的文件数"""
+    count = 0
+    if not os.path.isdir(root):
+        return count
+    for dir_name in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, dir_name)
+        if not os.path.isdir(user_dir):
+            continue
+        for file_name in sorted(os.listdir(user_dir)):
+            path = os.path.join(user_dir, file_name)
+            # 只处理有索引文件的jsonl结果文件
+            if not file_name.endswith(".jsonl") or not os.path.isfile(path + ".idx"):
+                continue
+            store = JsonLinesStore(path)
+            removed = store.compact()
+            json_path = path[: -len(".jsonl")] + ".json"
+            store.export_json(json_path)
+            logger.info(
+                "%s：%d条微博，去掉%d行旧数据，已生成%s",
+                path,
+                len(store.records),
+                removed,
+                json_path,
+            )
+            count += 1
+    return count
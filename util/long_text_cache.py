@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class LongTextCache(object):
+    """长微博详情缓存
+
+    以微博id为键缓存m.weibo.cn/detail页面中的status原始数据，同一次运行中
+    被多个用户转发的长微博只请求一次。指定path时同时写入SQLite文件，跨运行复用。
+    缓存的编辑次数小于微博当前的编辑次数，或超过有效期时视为失效。
+    """
+
+    def __init__(self, path=None, ttl_days=0, max_memory_entries=10000):
+        """
+        :path 持久化缓存的SQLite文件路径，为None时只缓存在内存中
+        :ttl_days 缓存有效天数，0代表不过期
+        :max_memory_entries 内存中最多缓存的微博数，超出后淘汰最久未使用的
+        """
+        self.ttl = ttl_days * 86400
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.con = None
+        if path:
+            dir_name = os.path.dirname(path)
+            if dir_name and not os.path.isdir(dir_name):
+                os.makedirs(dir_name, exist_ok=True)
+            self.con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.con.execute(
+                """CREATE TABLE IF NOT EXISTS long_text (
+                    id varchar(20) NOT NULL
+                    ,edit_count INT DEFAULT 0
+                    ,fetched_at REAL
+                    ,status text
+                    ,PRIMARY KEY (id)
+                )"""
+            )
+            self.con.commit()
+
+    def _remember(self, weibo_id, entry):
+        self.memory[weibo_id] = entry
+        self.memory.move_to_end(weibo_id)
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, weibo_id, edit_count=0):
+        """返回缓存的status，不存在或已失效时返回None"""
+        weibo_id = str(weibo_id)
+        with self.lock:
+            entry = self.memory.get(weibo_id)
+            if entry is None and self.con:
+                row = self.con.execute(
+                    "SELECT status, edit_count, fetched_at FROM long_text WHERE id=?",
+                    (weibo_id,),
+                ).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1], row[2])
+            if entry is None:
+                return None
+            status, cached_edit_count, fetched_at = entry
+            if (cached_edit_count or 0) < (edit_count or 0):
+                return None
+            if self.ttl and time() - fetched_at > self.ttl:
+                return None
+            self._remember(weibo_id, entry)
+            return status
+
+    def put(self, weibo_id, status, edit_count=0):
+        """缓存一条长微博的status"""
+        weibo_id = str(weibo_id)
+        entry = (status, edit_count or 0, time())
+        with self.lock:
+            self._remember(weibo_id, entry)
+            if self.con:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO long_text(id, edit_count, fetched_at, status) VALUES(?,?,?,?)",
+                    (weibo_id, entry[1], entry[2], json.dumps(status, ensure_ascii=False)),
+                )
+                self.con.commit()
+
+    def close(self):
+        with self.lock:
+            if self.con:
+                self.con.close()
+                self.con = None
@@ -0,0 +1,168 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+logger = logging.getLogger("weibo")
+
+CHUNK_SIZE = 64 * 1024
+# 校验文件类型和完整性时检查的开头、结尾字节数
+HEAD_SIZE = 16
+TAIL_SIZE = 16
+
+
+def get_expected_size(response, offset):
+    """根据Content-Range或Content-Length返回文件的总字节数，未知时返回None"""
+    content_range = response.headers.get("Content-Range", "")
+    match = re.search(r"/(\d+)$", content_range)
+    if match:
+        return int(match.group(1))
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and not response.headers.get(
+        "Content-Encoding"
+    ):
+        return offset + int(content_length)
+    return None
+
+
+class MediaDownloader(object):
+    """图片视频下载器
+
+    每个CDN域名一个带连接池的Session，复用TCP/TLS连接，每个域名同时最多
+    per_host个请求；下载任务在最多max_workers个线程的线程池中执行，多用户并发
+    爬取时共用同一个线程池。get与传输层的get用法相同，同样受media类请求的限速控制。
+    """
+
+    def __init__(self, limiter=None, max_workers=8, per_host=4):
+        """
+        :limiter 请求限速器，为None时不限速
+        :max_workers 同时下载的文件数，为1时在调用线程中逐个下载
+        :per_host 每个域名同时进行的请求数
+        """
+        self.limiter = limiter
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.sessions = {}
+        self.host_slots = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_host(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.per_host, max_retries=5
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return session, self.host_slots[host]
+
+    def get(self, url, family="media", **kwargs):
+        """发出GET请求，同一域名的请求数达到上限时等待"""
+        session, slots = self._get_host(urlsplit(url).netloc)
+        with slots:
+            if self.limiter:
+                self.limiter.acquire(family)
+            response = session.get(url, **kwargs)
+            if self.limiter:
+                self.limiter.on_response(family, response.status_code)
+            return response
+
+    def download(self, url, temp_path, family="media", headers=None, **kwargs):
+        """
+        分块流式下载到temp_path，不把整个文件读入内存
+
+        temp_path中已有上次中断时下载的部分时，用Range请求从断点继续下载；服务器
+        不支持Range时从头下载。返回响应头、文件开头和结尾的若干字节（用于校验文件
+        类型和完整性）、已下载的总字节数，以及服务器声明的总字节数（未知时为None）。
+        """
+        offset = os.path.getsize(temp_path) if os.path.isfile(temp_path) else 0
+        headers = dict(headers or {})
+        if offset:
+            headers["Range"] = "bytes=%d-" % offset
+        response = self.get(url, family=family, headers=headers, stream=True, **kwargs)
+        try:
+            if response.status_code == 416 and offset:
+                # 断点超出了文件大小，说明本地的部分文件已经无效
+                os.remove(temp_path)
+                raise RequestException("续传位置无效，将重新下载: %s" % url)
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+            expected = get_expected_size(response, offset)
+            head = b""
+            if offset:
+                with open(temp_path, "rb") as f:
+                    head = f.read(HEAD_SIZE)
+            tail = b""
+            size = offset
+            with open(temp_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    size += len(chunk)
+                    if len(head) < HEAD_SIZE:
+                        head += chunk[: HEAD_SIZE - len(head)]
+                    tail = (tail + chunk[-TAIL_SIZE:])[-TAIL_SIZE:]
+            if len(tail) < TAIL_SIZE and size > len(tail):
+                # 续传时新下载的部分太短，结尾的字节有一部分在之前下载的内容中
+                with open(temp_path, "rb") as f:
+                    f.seek(max(0, size - TAIL_SIZE))
+                    tail = f.read()
+            return {
+                "headers": response.headers,
+                "head": head,
+                "tail": tail,
+                "size": size,
+                "expected": expected,
+            }
+        finally:
+            response.close()
+
+    def run(self, func, jobs, on_done=None):
+        """
+        对每个job执行func(*job)，全部完成后返回
+        :on_done 每完成一个job调用一次，用于显示进度
+        """
+        if self.max_workers == 1 or len(jobs) <= 1:
+            for job in jobs:
+                self._call(func, job)
+                if on_done:
+                    on_done()
+            return
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="media-download"
+                )
+            executor = self.executor
+        futures = [executor.submit(self._call, func, job) for job in jobs]
+        for _ in as_completed(futures):
+            if on_done:
+                on_done()
+
+    def _call(self, func, job):
+        try:
+            func(*job)
+        except Exception as e:
+            logger.exception(e)
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            sessions, self.sessions = self.sessions, {}
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for session in sessions.values():
+            session.close()
@@ -0,0 +1,81 @@
+import logging
+import threading
+
+logger = logging.getLogger("weibo")
+
+DATABASE = "weibo"
+
+
+class MongoWriter(object):
+    """整个运行过程共用的MongoDB写入器
+
+    只创建一个MongoClient（自带连接池，多线程共用）；每个集合第一次写入前建立id的
+    唯一索引。写入时按id批量upsert，每batch_size条文档一次bulk_write，不再每条
+    文档先查询再插入或更新。写入不会修改传入的文档。
+    """
+
+    def __init__(self, uri=None, batch_size=1000):
+        """
+        :uri MongoDB连接字符串，为None时连接本机默认端口
+        :batch_size 每次bulk_write的文档数
+        """
+        self.uri = uri
+        self.batch_size = max(1, batch_size)
+        self.client = None
+        self.indexed = set()
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.documents = 0
+
+    def get_collection(self, name):
+        with self.lock:
+            if self.client is None:
+                from pymongo import MongoClient
+
+                self.client = MongoClient(self.uri)
+            collection = self.client[DATABASE][name]
+            if name not in self.indexed:
+                self.ensure_index(collection)
+                self.indexed.add(name)
+            return collection
+
+    def ensure_index(self, collection):
+        from pymongo.errors import OperationFailure
+
+        try:
+            collection.create_index("id", unique=True)
+        except OperationFailure as e:
+            # 旧版本写入的数据中id可能有重复，此时只能使用普通索引
+            logger.warning("无法为%s建立id唯一索引，将使用普通索引: %s", collection.name, e)
+            collection.create_index("id")
+        self.round_trips += 1
+
+    def upsert(self, name, documents):
+        """按id插入或更新文档，返回写入的文档数"""
+        if not documents:
+            return 0
+        from pymongo import UpdateOne
+
+        collection = self.get_collection(name)
+        for start in range(0, len(documents), self.batch_size):
+            operations = [
+                UpdateOne({"id": document["id"]}, {"$set": document}, upsert=True)
+                for document in documents[start : start + self.batch_size]
+            ]
+            collection.bulk_write(operations, ordered=False)
+            with self.lock:
+                self.round_trips += 1
+        with self.lock:
+            self.documents += len(documents)
+        return len(documents)
+
+    def close(self):
+        with self.lock:
+            client, self.client = self.client, None
+            self.indexed = set()
+        if client is not None:
+            client.close()
+        if self.documents:
+            logger.info(
+                "MongoDB共写入%d条文档，发出%d次写入请求", self.documents, self.round_trips
+            )
@@ -0,0 +1,156 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("weibo")
+
+DATABASE = "weibo"
+CREATE_DATABASE_SQL = """CREATE DATABASE IF NOT EXISTS weibo DEFAULT
+                         CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"""
+
+
+class MySQLWriter(object):
+    """整个运行过程共用的MySQL写入器
+
+    维护一个最多pool_size个连接的连接池，多用户并发爬取的各线程共用，连接在第一次
+    需要时才建立；数据库和表只在第一次写入前创建一次。每次写入的行按batch_rows行
+    一组拼成多行的INSERT ... ON DUPLICATE KEY UPDATE语句，整次写入在一个事务中提交。
+    不修改传入的连接配置。
+    """
+
+    def __init__(self, config, create_sql, pool_size=2, batch_rows=500):
+        """
+        :config pymysql.connect的参数，其中的db会被忽略，固定使用weibo数据库
+        :create_sql 建表语句列表
+        :pool_size 连接池中最多的连接数
+        :batch_rows 每条INSERT语句最多包含的行数
+        """
+        self.config = {k: v for k, v in config.items() if k != "db"}
+        self.create_sql = create_sql
+        self.pool_size = max(1, pool_size)
+        self.batch_rows = max(1, batch_rows)
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.schema_ready = False
+        self.sql_cache = {}
+        self.statements = 0
+        self.rows = 0
+
+    def ensure_schema(self):
+        """创建weibo数据库和表，只在第一次调用时执行"""
+        with self.lock:
+            if self.schema_ready:
+                return
+            import pymysql
+
+            connection = pymysql.connect(**self.config)
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(CREATE_DATABASE_SQL)
+                    cursor.execute("USE " + DATABASE)
+                    for sql in self.create_sql:
+                        cursor.execute(sql)
+                connection.commit()
+            finally:
+                connection.close()
+            self.schema_ready = True
+
+    def _connect(self):
+        import pymysql
+
+        return pymysql.connect(db=DATABASE, **self.config)
+
+    @contextmanager
+    def connection(self):
+        """从连接池取出一个连接，用完放回；出错的连接关闭后不再放回"""
+        self.ensure_schema()
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = None
+            with self.lock:
+                if self.created < self.pool_size:
+                    self.created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                connection = self.idle.get()
+        try:
+            yield connection
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+        else:
+            self.idle.put(connection)
+
+    def get_insert_sql(self, table, keys, row_count):
+        cache_key = (table, keys, row_count)
+        sql = self.sql_cache.get(cache_key)
+        if sql is None:
+            row = "(" + ", ".join(["%s"] * len(keys)) + ")"
+            sql = "INSERT INTO {table}({keys}) VALUES {values} ON DUPLICATE KEY UPDATE {update}".format(
+                table=table,
+                keys=", ".join(keys),
+                values=", ".join([row] * row_count),
+                update=", ".join("{key} = VALUES({key})".format(key=key) for key in keys),
+            )
+            if len(self.sql_cache) > 64:
+                self.sql_cache.clear()
+            self.sql_cache[cache_key] = sql
+        return sql
+
+    def insert(self, table, data_list):
+        """插入或更新数据，字段相同的连续行每batch_rows行合成一条语句，返回写入的行数"""
+        groups = []
+        for data in data_list:
+            keys = tuple(data.keys())
+            if groups and groups[-1][0] == keys and len(groups[-1][1]) < self.batch_rows:
+                groups[-1][1].append(tuple(data.values()))
+            else:
+                groups.append((keys, [tuple(data.values())]))
+        if not groups:
+            return 0
+        with self.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    for keys, rows in groups:
+                        args = [value for row in rows for value in row]
+                        cursor.execute(self.get_insert_sql(table, keys, len(rows)), args)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        with self.lock:
+            self.statements += len(groups)
+            self.rows += len(data_list)
+        return len(data_list)
+
+    def close(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.close()
+            except Exception:
+                pass
+        with self.lock:
+            self.created = 0
+        if self.rows:
+            logger.info("MySQL共写入%d行，执行%d条INSERT语句", self.rows, self.statements)
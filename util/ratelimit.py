@@ -0,0 +1,169 @@
+import logging
+import random
+import threading
+from time import monotonic, sleep
+
+logger = logging.getLogger("weibo")
+
+# 各类接口默认每秒请求数与突发容量，数值参考原先的随机等待时长
+# timeline: 微博列表页，原先每1到5页随机等待6到10秒
+# user: 用户信息，原先每个用户前随机等待30到60秒
+# detail: 长微博详情页，原先每次请求前随机等待1到2.5秒
+# comments: 评论与转发，原先每隔几页随机等待1到6秒
+# media: 图片视频CDN，原先不做限制
+DEFAULT_RATES = {
+    "timeline": (0.3, 3),
+    "user": (1 / 45.0, 1),
+    "detail": (0.5, 1),
+    "comments": (0.4, 2),
+    "media": (10.0, 10),
+}
+
+# 出现这些状态码说明请求过快，需要自动降速
+THROTTLE_STATUS_CODES = (403, 418, 429)
+
+
+class TokenBucket(object):
+    """线程安全的令牌桶，多个爬取线程共用同一个请求预算"""
+
+    def __init__(self, rate, capacity=1):
+        """
+        :rate 每秒补充的令牌数
+        :capacity 桶容量，即允许的最大突发请求数
+        """
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated_at = monotonic()
+        self.blocked_until = 0.0
+        self.acquired = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        start = max(self.updated_at, self.blocked_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens=1):
+        """取出令牌，令牌不足时阻塞等待，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    self.waited += waited
+                    return waited
+                wait = max(
+                    self.blocked_until - now, (tokens - self.tokens) / self.rate
+                )
+            sleep(wait)
+            waited += wait
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill(monotonic())
+            self.rate = float(rate)
+
+    def block(self, seconds):
+        """暂停发放令牌seconds秒，并清空已有令牌"""
+        with self.lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+
+class RateLimiter(object):
+    """按接口类型分别限速的请求限速器
+
+    每类接口一个令牌桶，另有一个可选的全局令牌桶限制总请求数。等待令牌后再随机
+    多等一小段时间，避免请求间隔过于规律，没有等待的请求不额外等待。遇到
+    403/418/429或验证码时该类接口速率减半并暂停一段时间，之后每次请求成功逐步
+    恢复到设定速率。
+    """
+
+    def __init__(self, rates=None, global_rate=0, global_capacity=1, jitter=0.3,
+                 max_jitter=3, enabled=True):
+        """
+        :rates 各类接口的每秒请求数，未设置的类型使用DEFAULT_RATES
+        :global_rate 所有接口合计每秒请求数，0代表不限制
+        :jitter 随机等待时长占本次等待令牌时长的最大比例
+        :max_jitter 随机等待的最长秒数
+        :enabled 为False时不做任何限速，用于离线回放等场景
+        """
+        rates = rates or {}
+        self.enabled = enabled
+        self.jitter = jitter
+        self.max_jitter = max_jitter
+        self.buckets = {}
+        self.base_rates = {}
+        self.strikes = {}
+        self.throttled = {}
+        for family, (rate, capacity) in DEFAULT_RATES.items():
+            rate = rates.get(family, rate)
+            self.base_rates[family] = rate
+            self.buckets[family] = TokenBucket(rate, capacity)
+            self.strikes[family] = 0
+            self.throttled[family] = 0
+        self.global_bucket = (
+            TokenBucket(global_rate, global_capacity) if global_rate > 0 else None
+        )
+        self.lock = threading.Lock()
+
+    def acquire(self, family):
+        """发出family类请求前调用，必要时阻塞等待"""
+        if not self.enabled or family not in self.buckets:
+            return
+        waited = 0.0
+        if self.global_bucket:
+            waited += self.global_bucket.acquire()
+        waited += self.buckets[family].acquire()
+        if self.jitter and waited > 0:
+            sleep(random.uniform(0, min(self.jitter * waited, self.max_jitter)))
+
+    def on_response(self, family, status_code):
+        """根据响应状态码调整family类请求的速率"""
+        if not self.enabled or family not in self.buckets:
+            return
+        if status_code in THROTTLE_STATUS_CODES:
+            self.throttle(family, "HTTP %d" % status_code)
+            return
+        with self.lock:
+            self.strikes[family] = 0
+            bucket = self.buckets[family]
+            base_rate = self.base_rates[family]
+            if bucket.rate < base_rate:
+                bucket.set_rate(min(base_rate, bucket.rate + base_rate * 0.05))
+
+    def throttle(self, family, reason=""):
+        """被服务器限制时调用，family类请求降速并暂停"""
+        if not self.enabled or family not in self.buckets:
+            return
+        with self.lock:
+            self.strikes[family] += 1
+            self.throttled[family] += 1
+            bucket = self.buckets[family]
+            base_rate = self.base_rates[family]
+            bucket.set_rate(max(base_rate / 16, bucket.rate / 2))
+            pause = min(600, 30 * 2 ** (self.strikes[family] - 1))
+            bucket.block(pause)
+        logger.warning(
+            "%s类请求被限制(%s)，降速至每秒%.3f次并暂停%d秒",
+            family, reason, bucket.rate, pause,
+        )
+
+    def stats(self):
+        """各类接口的限速状态"""
+        return {
+            family: {
+                "rate": round(bucket.rate, 4),
+                "base_rate": round(self.base_rates[family], 4),
+                "requests": bucket.acquired,
+                "waited_seconds": round(bucket.waited, 2),
+                "throttled": self.throttled[family],
+            }
+            for family, bucket in self.buckets.items()
+        }
@@ -0,0 +1,93 @@
+import logging
+import queue
+import threading
+from time import monotonic
+
+logger = logging.getLogger("weibo")
+
+
+class SinkPipeline(object):
+    """写入流水线
+
+    每种写入方式一个后台线程和一个有界队列，爬取线程提交的每批数据放入所有队列，
+    各写入线程按提交顺序独立写入，慢的写入方式不会拖慢爬取和其他写入方式。
+    某个队列已满时提交会阻塞，直到该写入方式赶上，避免未写入的数据无限堆积。
+    close()等待所有已提交的数据写完才返回。
+    """
+
+    def __init__(self, sinks, max_pending=2):
+        """
+        :sinks 写入方式名称到写入函数的有序字典，写入函数接收submit提交的数据
+        :max_pending 每种写入方式最多排队的批数
+        """
+        self.errors = []
+        self.exit = None
+        self.workers = []
+        for name, write in sinks.items():
+            worker = {
+                "name": name,
+                "write": write,
+                "queue": queue.Queue(maxsize=max(1, max_pending)),
+                "batches": 0,
+                "seconds": 0.0,
+                "blocked_seconds": 0.0,
+                "failed": False,
+            }
+            worker["thread"] = threading.Thread(
+                target=self._run, args=(worker,), name="sink-" + name, daemon=True
+            )
+            worker["thread"].start()
+            self.workers.append(worker)
+
+    def _run(self, worker):
+        while True:
+            batch = worker["queue"].get()
+            if batch is None:
+                return
+            if worker["failed"]:
+                # 已经要求退出的写入方式不再写入，只取走数据避免提交方阻塞
+                continue
+            start = monotonic()
+            try:
+                worker["write"](batch)
+            except SystemExit as e:
+                # 缺少依赖库等无法继续写入的情况，由提交方在close时退出
+                worker["failed"] = True
+                self.exit = self.exit or e
+            except Exception as e:
+                logger.exception(e)
+                self.errors.append("%s写入失败: %s" % (worker["name"], e))
+            finally:
+                worker["batches"] += 1
+                worker["seconds"] += monotonic() - start
+
+    def submit(self, batch):
+        """把一批数据交给所有写入方式，队列已满时等待"""
+        for worker in self.workers:
+            start = monotonic()
+            worker["queue"].put(batch)
+            worker["blocked_seconds"] += monotonic() - start
+
+    def stats(self):
+        return {
+            worker["name"]: {
+                "batches": worker["batches"],
+                "seconds": round(worker["seconds"], 2),
+                "blocked_seconds": round(worker["blocked_seconds"], 2),
+            }
+            for worker in self.workers
+        }
+
+    def close(self):
+        """等待所有已提交的数据写完，写入方式要求退出时在调用线程中退出"""
+        for worker in self.workers:
+            worker["queue"].put(None)
+        for worker in self.workers:
+            worker["thread"].join()
+        for name, stat in self.stats().items():
+            logger.debug(
+                "%s写入%d批，耗时%.2f秒，爬取等待%.2f秒",
+                name, stat["batches"], stat["seconds"], stat["blocked_seconds"],
+            )
+        if self.exit is not None:
+            raise self.exit
@@ -0,0 +1,96 @@
+import logging
+
+logger = logging.getLogger("weibo")
+
+# 旧版本建的表可能缺少的列，表名 -> [(列名, 列定义), ...]
+EDIT_COLUMNS = {
+    "weibo": [("edited", "BOOLEAN DEFAULT 0"), ("edit_count", "INT DEFAULT 0")],
+}
+
+# 常用查询用到的索引
+# idx_weibo_user_created: API按用户查询微博并按时间倒序排列，导出评论时按用户筛选微博
+# idx_weibo_created: API不指定用户时按时间倒序查询
+# idx_comments_weibo/idx_reposts_weibo: 按微博查评论和转发
+# idx_bins_path: 下载前检查文件是否已经存入数据库
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_weibo_user_created ON weibo(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_weibo_created ON weibo(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_comments_weibo ON comments(weibo_id)",
+    "CREATE INDEX IF NOT EXISTS idx_reposts_weibo ON reposts(weibo_id)",
+    "CREATE INDEX IF NOT EXISTS idx_bins_path ON bins(path)",
+]
+
+
+def add_edit_columns(con):
+    for table, columns in EDIT_COLUMNS.items():
+        existing = {row[1] for row in con.execute("PRAGMA table_info(%s)" % table)}
+        for name, definition in columns:
+            if name not in existing:
+                con.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, name, definition))
+
+
+def add_indexes(con):
+    for sql in INDEXES:
+        con.execute(sql)
+    # 统计信息让查询计划能在两个weibo索引间正确选择，analysis_limit限制大数据库上的耗时
+    con.execute("PRAGMA analysis_limit = 1000")
+    con.execute("ANALYZE")
+
+
+def add_blob_columns(con):
+    existing = {row[1] for row in con.execute("PRAGMA table_info(bins)")}
+    if "sha256" not in existing:
+        con.execute("ALTER TABLE bins ADD COLUMN sha256 varchar(64)")
+    if "size" not in existing:
+        con.execute("ALTER TABLE bins ADD COLUMN size integer")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_bins_sha256 ON bins(sha256)")
+
+
+# 数据库结构的版本记录在PRAGMA user_version中，版本1为get_sqlite_create_sql建的表，
+# 之后的每次修改在这里追加一项，已有的数据库打开时依次升级到最新版本
+MIGRATIONS = [
+    (2, "weibo表增加edited、edit_count列", add_edit_columns),
+    (3, "增加常用查询的索引", add_indexes),
+    (4, "bins表增加sha256、size列，文件内容改存在blob存储中", add_blob_columns),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(con, create_sql, target=SCHEMA_VERSION):
+    """
+    将数据库升级到target版本
+
+    新数据库和没有版本号的旧数据库先执行建表语句（表已存在时不变），再依次执行
+    尚未执行过的升级。每次升级在一个事务中完成并更新版本号，多个进程同时打开同一个
+    数据库时只有一个会执行升级。
+    """
+    version = get_version(con)
+    if version > SCHEMA_VERSION:
+        logger.warning("SQLite数据库版本%d高于程序支持的版本%d，请更新程序", version, SCHEMA_VERSION)
+        return version
+    if version < 1:
+        con.executescript(create_sql)
+        con.execute("PRAGMA user_version = 1")
+        con.commit()
+        version = 1
+    for migration_version, description, upgrade in MIGRATIONS:
+        if migration_version <= version or migration_version > target:
+            continue
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # 等待锁期间其他进程可能已经完成了升级
+            if get_version(con) < migration_version:
+                logger.info("升级SQLite数据库到版本%d：%s", migration_version, description)
+                upgrade(con)
+                con.execute("PRAGMA user_version = %d" % migration_version)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        version = migration_version
+    return version
@@ -0,0 +1,217 @@
+import logging
+import os
+import sqlite3
+import threading
+from time import monotonic
+
+from util.sqlite_schema import migrate
+
+logger = logging.getLogger("weibo")
+
+
+def describe_row(row, max_length=200):
+    """日志中显示的一行数据，二进制数据只显示长度"""
+    text = repr(
+        tuple("<%d bytes>" % len(v) if isinstance(v, (bytes, bytearray)) else v for v in row)
+    )
+    return text if len(text) <= max_length else text[:max_length] + "..."
+
+
+class SQLiteWriter(object):
+    """整个运行过程共用的SQLite写入器
+
+    只打开一个连接，使用WAL日志模式，INSERT OR REPLACE的行先在内存中攒批，
+    按表和字段相同的连续行用executemany写入，每batch_rows行或每commit_interval秒
+    提交一次事务，不再每行提交一次；只有查询没有写入时由定时器按时提交。查询前
+    把未写入的行写入当前事务但不提交，同一连接上的查询能读到这些行。某些行的数据
+    导致整批写入失败时改为逐行写入，只跳过并记录出错的行；数据库本身出错时保留
+    未提交的行并抛出异常。
+    """
+
+    def __init__(self, path, create_sql, batch_rows=500, commit_interval=5,
+                 max_pending_bytes=32 * 1024 * 1024):
+        """
+        :path 数据库文件路径，第一次写入时才打开
+        :create_sql 新建数据库时执行的建表语句，之后由util.sqlite_schema升级到最新版本
+        :batch_rows 攒够多少行提交一次
+        :commit_interval 有未提交的行时最多多少秒提交一次
+        :max_pending_bytes 未提交的二进制数据超过多少字节时提交，避免图片视频占用过多内存
+        """
+        self.path = path
+        self.create_sql = create_sql
+        self.batch_rows = max(1, batch_rows)
+        self.commit_interval = commit_interval
+        self.max_pending_bytes = max_pending_bytes
+        self.con = None
+        self.lock = threading.RLock()
+        self.sql_cache = {}
+        # [(sql, [参数, ...]), ...]，字段相同的连续行合并为一组
+        self.pending = []  # 还没有写入数据库的行
+        self.executed = []  # 已写入当前事务、还没有提交的行
+        self.pending_rows = 0  # 没有提交的行数，包括executed中的行
+        self.pending_bytes = 0
+        self.committed_at = monotonic()
+        self.timer = None
+        self.rows = 0
+        self.failed_rows = 0
+        self.commits = 0
+        self.write_seconds = 0.0
+
+    def connection(self):
+        """返回数据库连接，必要时新建或升级数据库"""
+        with self.lock:
+            if self.con is None:
+                dir_name = os.path.dirname(self.path)
+                if dir_name and not os.path.isdir(dir_name):
+                    os.makedirs(dir_name, exist_ok=True)
+                # 多用户并发爬取时各线程共用这个连接，由self.lock保证同一时间只有一个线程使用
+                self.con = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                self.con.execute("PRAGMA journal_mode=WAL")
+                self.con.execute("PRAGMA synchronous=NORMAL")
+                migrate(self.con, self.create_sql)
+            return self.con
+
+    def get_insert_sql(self, table, keys):
+        sql = self.sql_cache.get((table, keys))
+        if sql is None:
+            sql = "INSERT OR REPLACE INTO {table}({keys}) VALUES({values})".format(
+                table=table, keys=",".join(keys), values=",".join(["?"] * len(keys))
+            )
+            self.sql_cache[(table, keys)] = sql
+        return sql
+
+    def insert(self, table, data):
+        """写入一行，data为字段名到值的字典"""
+        if not data:
+            return
+        sql = self.get_insert_sql(table, tuple(data.keys()))
+        values = tuple(data.values())
+        with self.lock:
+            if self.pending and self.pending[-1][0] == sql:
+                self.pending[-1][1].append(values)
+            else:
+                self.pending.append((sql, [values]))
+            self.pending_rows += 1
+            self.pending_bytes += sum(
+                len(v) for v in values if isinstance(v, (bytes, bytearray))
+            )
+            if (
+                self.pending_rows >= self.batch_rows
+                or self.pending_bytes >= self.max_pending_bytes
+                or monotonic() - self.committed_at >= self.commit_interval
+            ):
+                self.flush()
+            else:
+                self.start_timer()
+
+    def start_timer(self):
+        """有未提交的行时，最迟commit_interval秒后提交"""
+        if self.timer is None and self.commit_interval and self.commit_interval > 0:
+            self.timer = threading.Timer(self.commit_interval, self.commit_on_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def commit_on_timer(self):
+        with self.lock:
+            self.timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                # 未提交的行仍然保留，下次写入或提交时重试
+                logger.warning("SQLite定时提交失败: %s", e)
+
+    def write_pending(self):
+        """把未写入的行写入当前事务，不提交"""
+        with self.lock:
+            if not self.pending:
+                return
+            con = self.connection()
+            try:
+                for sql, rows in self.pending:
+                    con.executemany(sql, rows)
+                self.executed.extend(self.pending)
+            except sqlite3.Error as e:
+                # 回滚同时撤销了本事务中之前写入的行，与这一批一起重新处理
+                con.rollback()
+                self.pending = self.executed + self.pending
+                self.executed = []
+                if isinstance(e, sqlite3.OperationalError):
+                    # 数据库被锁、磁盘已满等与具体数据无关的错误，保留这些行，下次写入时
+                    # 重试，错误交给触发写入的调用方
+                    raise
+                # 某些行的数据有问题，逐行重新写入，只跳过出错的行
+                self.write_rows_one_by_one(con)
+            self.pending = []
+
+    def flush(self):
+        """写入并提交所有未提交的行"""
+        with self.lock:
+            if not self.pending and not self.executed:
+                return
+            start = monotonic()
+            self.write_pending()
+            con = self.connection()
+            try:
+                con.commit()
+            except sqlite3.OperationalError:
+                con.rollback()
+                self.pending = self.executed
+                self.executed = []
+                raise
+            self.rows += sum(len(rows) for _, rows in self.executed)
+            self.executed = []
+            self.pending_rows = 0
+            self.pending_bytes = 0
+            now = monotonic()
+            self.committed_at = now
+            self.commits += 1
+            self.write_seconds += now - start
+
+    def write_rows_one_by_one(self, con):
+        """逐行写入未写入的行，出错的行记录到日志后跳过，写入的行留在当前事务中"""
+        for sql, rows in self.pending:
+            for row in rows:
+                try:
+                    con.execute(sql, row)
+                    self.executed.append((sql, [row]))
+                except sqlite3.Error as e:
+                    self.failed_rows += 1
+                    self.pending_rows -= 1
+                    logger.warning("SQLite写入失败，已跳过该行: %s %s: %s", sql, describe_row(row), e)
+
+    def fetchone(self, sql, params=()):
+        """查询一行，能读到已insert但还没有提交的行，查询本身不提交事务"""
+        with self.lock:
+            self.write_pending()
+            return self.connection().execute(sql, params).fetchone()
+
+    def stats(self):
+        return {
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "commits": self.commits,
+            "write_seconds": round(self.write_seconds, 3),
+            "rows_per_sec": round(self.rows / self.write_seconds, 1)
+            if self.write_seconds > 0
+            else None,
+        }
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            try:
+                self.flush()
+            finally:
+                if self.con is not None:
+                    self.con.close()
+                    self.con = None
+        if self.failed_rows:
+            logger.warning("SQLite共有%d行写入失败，详见之前的日志", self.failed_rows)
+        if self.rows:
+            stats = self.stats()
+            logger.info(
+                "SQLite共写入%d行，提交%d次，写入耗时%.2f秒，平均每秒%s行",
+                stats["rows"], stats["commits"], stats["write_seconds"], stats["rows_per_sec"],
+            )
@@ -0,0 +1,99 @@
+from lxml import etree
+
+LOCATION_ICON = "timeline_card_small_location_default.png"
+ARTICLE_PREFIX = "发布了头条文章"
+
+_string = etree.XPath("string(.)")
+
+
+class _Walker(object):
+    """一次遍历微博正文的元素树，同时收集文本、话题、@用户、位置和头条文章url"""
+
+    def __init__(self):
+        self.texts = []
+        self.spans = []
+        self.location_indexes = []
+        self.topics = []
+        self.at_users = []
+        self.article_url = None
+        # 正在遍历的、需要取字符串值的元素所收集的文本
+        self.open_parts = []
+
+    def add_text(self, text):
+        self.texts.append(text)
+        for parts in self.open_parts:
+            parts.append(text)
+
+    def walk(self, element, parent_span):
+        tag = element.tag
+        if not isinstance(tag, str):
+            # 注释和处理指令只有tail属于正文
+            return
+        parts = None
+        span = None
+        if tag == "span":
+            # [下标, 是否已检查过第一个带src的img子元素]
+            span = [len(self.spans), False]
+            self.spans.append(element)
+            if element.get("class") == "surl-text":
+                parts = []
+        elif tag == "a":
+            parts = []
+            if self.article_url is None and element.get("data-url") is not None:
+                self.article_url = element.get("data-url")
+        elif tag == "img" and parent_span is not None and not parent_span[1]:
+            src = element.get("src")
+            if src is not None:
+                parent_span[1] = True
+                if LOCATION_ICON in src:
+                    self.location_indexes.append(parent_span[0])
+        if parts is not None:
+            self.open_parts.append(parts)
+        if element.text:
+            self.add_text(element.text)
+        for child in element:
+            self.walk(child, span)
+            if child.tail:
+                self.add_text(child.tail)
+        if parts is not None:
+            self.open_parts.pop()
+            self.on_close(element, "".join(parts))
+
+    def on_close(self, element, string):
+        if element.tag == "span":
+            if len(string) > 2 and string[0] == "#" and string[-1] == "#":
+                self.topics.append(string[1:-1])
+        else:
+            href = element.get("href")
+            if href is not None and "@" + href[3:] == string:
+                self.at_users.append(string[1:])
+
+
+def extract_text_info(selector):
+    """
+    从etree.HTML解析的微博正文中提取文本片段、头条文章url、位置、话题和@用户
+
+    只遍历一次元素树，各字段的取值规则与//text()、//span、//a等单独查询一致：
+    texts为正文中的全部文本节点；正文以"发布了头条文章"开头时取第一个带data-url
+    的链接作为头条文章url；第一个img子元素为定位图标的span之后的span为位置；
+    class为surl-text且形如#话题#的span为话题；文本与href对应的链接为@用户。
+    """
+    walker = _Walker()
+    walker.walk(selector, None)
+    article_url = ""
+    if "".join(walker.texts).startswith(ARTICLE_PREFIX):
+        url = walker.article_url
+        if url and url.startswith("http://t.cn"):
+            article_url = url
+    location = ""
+    if walker.location_indexes:
+        index = min(walker.location_indexes) + 1
+        if index < len(walker.spans):
+            location = _string(walker.spans[index])
+    return {
+        "texts": walker.texts,
+        "article_url": article_url,
+        "location": location,
+        "topics": ",".join(walker.topics),
+        "at_users": ",".join(walker.at_users),
+    }
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.cookies import get_cookie_header
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+
+class TransportResponse(object):
+    """异步传输层返回的响应，提供与requests.Response相同的常用属性"""
+
+    def __init__(self, url, status_code, headers, content, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, "replace")
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise HTTPError(
+                "%s Error for url: %s" % (self.status_code, self.url), response=self
+            )
+
+
+class SyncTransport(object):
+    """默认传输层，直接使用requests.Session逐个发出请求"""
+
+    is_async = False
+
+    def __init__(self, session, limiter=None):
+        self.session = session
+        self.limiter = limiter
+
+    def get(self, url, family=None, **kwargs):
+        """发出GET请求，family为请求所属的接口类型，用于限速"""
+        if self.limiter:
+            self.limiter.acquire(family)
+        response = self.session.get(url, **kwargs)
+        if self.limiter:
+            self.limiter.on_response(family, response.status_code)
+        return response
+
+    def _get_or_error(self, call):
+        url, kwargs = call
+        try:
+            return self.get(url, **kwargs)
+        except Exception as e:
+            return e
+
+    def get_many(self, calls, max_workers=1):
+        """
+        发出多个请求，calls为(url, kwargs)列表，失败的请求对应位置为异常对象
+        max_workers大于1时用线程池同时发出请求
+        """
+        if max_workers <= 1 or len(calls) <= 1:
+            return [self._get_or_error(call) for call in calls]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+            return list(executor.map(self._get_or_error, calls))
+
+    def close(self):
+        pass
+
+
+class AsyncTransport(object):
+    """基于aiohttp的异步传输层
+
+    在后台线程中运行一个事件循环，所有请求共用同一个aiohttp连接池，
+    最多同时保持max_in_flight个请求。get与requests用法相同，会阻塞到响应返回；
+    get_many一次提交多个请求并发执行，单个进程即可同时进行数十个请求。
+
+    cookie与requests.Session共用：每次请求时从session.cookies取出对应域名的cookie，
+    响应设置的cookie也写回session.cookies。与SyncTransport的HTTPAdapter一样，
+    连接失败或超时时最多重试max_retries次，重试前等待的时间逐次加倍。
+    """
+
+    is_async = True
+
+    def __init__(self, session, max_in_flight=32, limiter=None, max_retries=5,
+                 backoff_factor=0.5):
+        """
+        :session 提供cookie的requests.Session
+        :max_in_flight 同时进行的请求数
+        :limiter 请求限速器，为None时不限速
+        :max_retries 连接失败或超时时的最大重试次数
+        :backoff_factor 第n次重试前等待backoff_factor * 2^(n-1)秒
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("使用异步传输层需要先安装aiohttp库，请运行 pip install aiohttp")
+
+        self.aiohttp = aiohttp
+        self.session = session
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="async-transport", daemon=True
+        )
+        self.thread.start()
+        self.client = self._run(self._create_client())
+
+    async def _create_client(self):
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        connector = self.aiohttp.TCPConnector(limit=self.max_in_flight)
+        # cookie保存在session.cookies中，aiohttp自己不保存
+        return self.aiohttp.ClientSession(
+            connector=connector, cookie_jar=self.aiohttp.DummyCookieJar()
+        )
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _client_timeout(self, timeout):
+        if timeout is None:
+            return self.aiohttp.ClientTimeout(total=None)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self.aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return self.aiohttp.ClientTimeout(total=timeout)
+
+    def _add_cookies(self, url, headers):
+        """按url从session.cookies中取出要发送的cookie，加到请求头中"""
+        cookie = get_cookie_header(self.session.cookies, requests.Request("GET", url).prepare())
+        if not cookie:
+            return headers
+        headers = dict(headers or {})
+        headers.setdefault("Cookie", cookie)
+        return headers
+
+    def _save_cookies(self, response):
+        """把响应（包括重定向）设置的cookie写回session.cookies"""
+        for r in list(response.history) + [response]:
+            host = urlsplit(str(r.url)).hostname
+            for name, morsel in r.cookies.items():
+                self.session.cookies.set(
+                    name,
+                    morsel.value,
+                    domain=morsel["domain"] or host,
+                    path=morsel["path"] or "/",
+                )
+
+    async def _fetch(self, url, family=None, params=None, headers=None, timeout=None,
+                     verify=True, **kwargs):
+        if params:
+            # 与requests一致，忽略值为None的参数
+            params = {k: v for k, v in params.items() if v is not None}
+        if self.limiter:
+            # 限速器是阻塞实现，放到线程池中等待，避免卡住事件循环
+            await self.loop.run_in_executor(None, self.limiter.acquire, family)
+        for retry in range(self.max_retries + 1):
+            if retry:
+                await asyncio.sleep(self.backoff_factor * 2 ** (retry - 1))
+            try:
+                return await self._request(url, family, params, headers, timeout, verify)
+            except asyncio.TimeoutError as e:
+                error = Timeout(str(e) or "请求超时: %s" % url)
+            except self.aiohttp.ClientConnectionError as e:
+                error = ConnectionError(str(e))
+            except self.aiohttp.ClientError as e:
+                raise ConnectionError(str(e))
+        raise error
+
+    async def _request(self, url, family, params, headers, timeout, verify):
+        async with self.semaphore:
+            async with self.client.get(
+                url,
+                params=params,
+                headers=self._add_cookies(url, headers),
+                timeout=self._client_timeout(timeout),
+                ssl=None if verify else False,
+            ) as response:
+                content = await response.read()
+                self._save_cookies(response)
+                if self.limiter:
+                    self.limiter.on_response(family, response.status)
+                return TransportResponse(
+                    str(response.url),
+                    response.status,
+                    dict(response.headers),
+                    content,
+                    response.charset,
+                )
+
+    async def _fetch_many(self, calls):
+        return await asyncio.gather(
+            *[self._fetch(url, **kwargs) for url, kwargs in calls],
+            return_exceptions=True
+        )
+
+    def get(self, url, **kwargs):
+        return self._run(self._fetch(url, **kwargs))
+
+    def get_many(self, calls, max_workers=None):
+        """
+        并发发出多个请求，calls为(url, kwargs)列表，失败的请求对应位置为异常对象
+        同时进行的请求数由max_in_flight控制，忽略max_workers
+        """
+        return self._run(self._fetch_many(calls))
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self._run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
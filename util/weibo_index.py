@@ -0,0 +1,59 @@
+import os
+import sqlite3
+from time import time
+
+WEIBO_INDEX_NAME = "weibo_index.db"
+
+
+class WeiboIndex(object):
+    """已写入微博的id索引
+
+    每个用户目录下一个weibo_index.db，与该用户的结果文件放在一起。每条微博按写入方式
+    记录一行，包含微博id和写入时的编辑次数；写入方式是启用的写入方式、下载等的组合，
+    组合变化后之前的记录不再使用。开始爬取一个用户前一次性读出该用户的全部记录，
+    之后判断微博是否已写入只需查字典；覆盖模式下已写入且编辑次数没有变化的微博
+    可以不再解析和写入。
+    """
+
+    def __init__(self, path):
+        dir_name = os.path.dirname(path)
+        if dir_name and not os.path.isdir(dir_name):
+            os.makedirs(dir_name, exist_ok=True)
+        self.con = sqlite3.connect(path, timeout=30)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS weibo_index (
+                id varchar(20) NOT NULL
+                ,user_id varchar(20) NOT NULL
+                ,write_mode varchar(200) NOT NULL
+                ,edit_count INT DEFAULT 0
+                ,written_at REAL
+                ,PRIMARY KEY (id, user_id, write_mode)
+            )"""
+        )
+        self.con.commit()
+
+    def get_edit_counts(self, user_id, write_mode):
+        """返回该用户以write_mode写入过的微博，键为微博id字符串，值为写入时的编辑次数"""
+        rows = self.con.execute(
+            "SELECT id, edit_count FROM weibo_index WHERE user_id=? AND write_mode=?",
+            (str(user_id), write_mode),
+        )
+        return {weibo_id: edit_count or 0 for weibo_id, edit_count in rows}
+
+    def put_many(self, user_id, write_mode, weibos):
+        """在一个事务中记录已写入的微博，返回记录的条数"""
+        written_at = time()
+        rows = [
+            (str(w["id"]), str(user_id), write_mode, w.get("edit_count", 0) or 0, written_at)
+            for w in weibos
+        ]
+        if rows:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO weibo_index(id, user_id, write_mode, edit_count, written_at) VALUES(?,?,?,?,?)",
+                rows,
+            )
+            self.con.commit()
+        return len(rows)
+
+    def close(self):
+        self.con.close()
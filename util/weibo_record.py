@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from types import MappingProxyType
+
+_MISSING = object()
+
+
+class SlotsRecord(MutableMapping):
+    """
+    用__slots__保存字段的记录，按键读写的用法与原来的OrderedDict相同
+
+    字段按FIELDS的顺序排列，与原来依次赋值得到的键顺序一致，未赋值的字段不算作键；
+    FIELDS以外的键保存在额外的字典中，排在最后。每条记录不必各带一个哈希表，
+    整个用户爬取过程中保存在内存里的记录占用小得多。写入json、MongoDB等需要
+    真正的字典时用to_dict转换。
+    """
+
+    __slots__ = ("_extra",)
+    FIELDS = ()
+    FIELD_SET = frozenset()
+
+    def __init__(self):
+        self._extra = None
+
+    def __getitem__(self, key):
+        if key in self.FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = OrderedDict()
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELD_SET and getattr(self, key, _MISSING) is not _MISSING:
+            delattr(self, key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if getattr(self, name, _MISSING) is not _MISSING:
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, list(self.items()))
+
+    def to_dict(self):
+        """转换为OrderedDict，嵌套的记录（转发的原微博）也一并转换"""
+        return OrderedDict(
+            (k, v.to_dict() if isinstance(v, SlotsRecord) else v) for k, v in self.items()
+        )
+
+
+class WeiboRecord(SlotsRecord):
+    """parse_weibo和get_one_weibo得到的一条微博"""
+
+    FIELDS = (
+        "user_id",
+        "screen_name",
+        "id",
+        "bid",
+        "text",
+        "article_url",
+        "pics",
+        "video_url",
+        "live_photo_url",
+        "location",
+        "created_at",
+        "source",
+        "attitudes_count",
+        "comments_count",
+        "reposts_count",
+        "topics",
+        "at_users",
+        "llm_analysis",
+        "retweet",
+        "full_created_at",
+        "edited",
+        "edit_count",
+    )
+    FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS
+
+
+class UserRecord(SlotsRecord):
+    """get_user_info得到的用户信息"""
+
+    FIELDS = (
+        "id",
+        "screen_name",
+        "gender",
+        "birthday",
+        "location",
+        "ip_location",
+        "education",
+        "company",
+        "registration_time",
+        "sunshine",
+        "statuses_count",
+        "followers_count",
+        "follow_count",
+        "description",
+        "profile_url",
+        "profile_image_url",
+        "avatar_hd",
+        "urank",
+        "mbrank",
+        "verified",
+        "verified_type",
+        "verified_reason",
+    )
+    FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS
+
+
+def to_dict(info):
+    """记录转换为OrderedDict，已经是字典的原样返回"""
+    return info.to_dict() if isinstance(info, SlotsRecord) else info
+
+
+def normalize_weibo(weibo):
+    """
+    把一条微博拆成(微博行, 原微博行)，转发微博的原微博单独成行，没有原微博时为None
+
+    微博行不含retweet，增加retweet_id列，值为原微博id（原创微博为空字符串）；
+    原微博行的retweet_id为空字符串。两行都是只读的浅拷贝，各写入方式共用，
+    不会修改爬取到的微博，也不必为每种写入方式深拷贝一份。
+    """
+    row = {k: v for k, v in weibo.items() if k != "retweet"}
+    retweet = weibo.get("retweet")
+    if retweet:
+        row["retweet_id"] = retweet["id"]
+        retweet_row = dict(retweet)
+        retweet_row["retweet_id"] = ""
+        return MappingProxyType(row), MappingProxyType(retweet_row)
+    row["retweet_id"] = ""
+    return MappingProxyType(row), None
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
 import codecs
 import copy
 import csv
@@ -9,16 +10,18 @@ import logging
 import logging.config
 import math
 import os
+import queue
 import random
 import re
 import sqlite3
 import sys
+import threading
 import warnings
 import webbrowser
 from collections import OrderedDict
 from datetime import date, datetime, timedelta
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
 
 import requests
 from requests.exceptions import RequestException
@@ -28,8 +31,24 @@ from tqdm import tqdm
 
 import const
 from util import csvutil
+from util.blob_store import BlobStore
+from util.capture import CapturingTransport, NotCapturedError, ReplayTransport, ResponseCapture
 from util.dateutil import convert_to_days_ago
+from util.detail_extractor import extract_status
+from util.download_manifest import MANIFEST_NAME, DownloadManifest
+from util.jsonl_store import JsonLinesStore, compact_all
+from util.long_text_cache import LongTextCache
+from util.media_downloader import MediaDownloader
+from util.mongo_writer import MongoWriter
+from util.mysql_writer import MySQLWriter
 from util.notify import push_deer
+from util.ratelimit import DEFAULT_RATES, RateLimiter
+from util.sink_pipeline import SinkPipeline
+from util.sqlite_writer import SQLiteWriter
+from util.text_extractor import extract_text_info
+from util.weibo_index import WEIBO_INDEX_NAME, WeiboIndex
+from util.weibo_record import UserRecord, WeiboRecord, normalize_weibo, to_dict
+from util.transport import AsyncTransport, SyncTransport
 from util.llm_analyzer import LLMAnalyzer  # 导入 LLM 分析器
 
 warnings.filterwarnings("ignore")
@@ -41,6 +60,14 @@ logging_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "logging.
 logging.config.fileConfig(logging_path)
 logger = logging.getLogger("weibo")
 
+# 未配置mysql_config时的MySQL连接参数
+DEFAULT_MYSQL_CONFIG = {
+    "host": "localhost",
+    "port": 3306,
+    "user": "root",
+    "password": "123456",
+    "charset": "utf8mb4",
+}
 # 日期时间格式
 DTFORMAT = "%Y-%m-%dT%H:%M:%S"
 
@@ -147,24 +174,80 @@ class Weibo(object):
         self.llm_analyzer = LLMAnalyzer(config) if config.get("llm_config") else None
         
         user_id_list = config["user_id_list"]
+        self.long_text_workers = config.get(
+            "long_text_workers", 1
+        )  # 同时获取的长微博数，大于1时每页的长微博会先批量并发获取
+        long_text_cache_days = config.get(
+            "long_text_cache_days", 0
+        )  # 长微博缓存保存的天数，0代表只在本次运行中缓存
+        self.long_text_cache = LongTextCache(
+            self.get_long_text_cache_path() if long_text_cache_days > 0 else None,
+            long_text_cache_days,
+        )
+        self.skip_unchanged_weibo = config.get(
+            "skip_unchanged_weibo", 0
+        )  # 覆盖模式下是否跳过已写入且没有再编辑的微博，已写入的微博记录在用户目录下的weibo_index.db中
+        self.prefetch_pages = config.get(
+            "prefetch_pages", 0
+        )  # 流水线爬取时预取的页数，0代表逐页获取、解析和写入
+        self.write_queue_size = config.get(
+            "write_queue_size", 2
+        )  # 每种写入方式最多排队等待写入的批数，0代表在爬取线程中直接写入
+        self.sink_pipeline = None  # 当前用户的写入流水线
+        self.crawl_worker_count = config.get(
+            "crawl_worker_count", 1
+        )  # 同时爬取的用户数，默认为1，即逐个用户爬取
+        request_budget = config.get(
+            "request_budget_per_minute", 0
+        )  # 所有爬取线程合计每分钟最多发出的请求数，0代表不限制
+        # 按接口类型限速，取代原先各处的随机等待。速率是所有爬取线程合计的，
+        # 并发爬取多个用户时对服务器的请求频率不变
+        self.rate_limiter = RateLimiter(
+            rates=config.get("rate_limit") or {},
+            global_rate=request_budget / 60.0,
+            global_capacity=self.crawl_worker_count,
+            jitter=config.get("rate_limit_jitter", 0.3),
+            max_jitter=config.get("rate_limit_max_jitter", 3),
+        )
+        # 图片视频下载器，每个域名一个连接池，所有用户共用下载线程池
+        self.media_downloader = MediaDownloader(
+            self.rate_limiter,
+            max_workers=config.get("download_workers", 8),
+            per_host=config.get("download_per_host", 4),
+        )
         requests_session = requests.Session()
         requests_session.cookies.update(core_cookies)
 
         self.session = requests_session
-        try:
-            # 请求只带 SUB
-            # 服务器下发适配 m.weibo.cn 的新指纹
-            self.session.get("https://m.weibo.cn", headers=self.headers, timeout=10)
-            logger.info("Session 预热成功，服务器已下发最新指纹。")
-            
-        except Exception as e:
-            #请求失败时，启用备份
-            logger.warning(f"Session 预热失败 ({e})，正在启用备份 Cookie...")
-            self.session.cookies.update(backup_cookies) # 把旧指纹装进去救急
+        self.replay_dir = config.get("replay_dir")  # 离线回放的原始响应目录，设置后不访问网络
+        if self.replay_dir:
+            # 回放时不请求网络，也就不下载图片视频
+            for argument in [
+                "original_pic_download",
+                "retweet_pic_download",
+                "original_video_download",
+                "retweet_video_download",
+                "original_live_photo_download",
+                "retweet_live_photo_download",
+            ]:
+                setattr(self, argument, 0)
+            self.rate_limiter.enabled = False
+        if not self.replay_dir:
+            try:
+                # 请求只带 SUB
+                # 服务器下发适配 m.weibo.cn 的新指纹
+                self.session.get("https://m.weibo.cn", headers=self.headers, timeout=10)
+                logger.info("Session 预热成功，服务器已下发最新指纹。")
+
+            except Exception as e:
+                #请求失败时，启用备份
+                logger.warning(f"Session 预热失败 ({e})，正在启用备份 Cookie...")
+                self.session.cookies.update(backup_cookies) # 把旧指纹装进去救急
 
         adapter = HTTPAdapter(max_retries=5)
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        self.transport = self.create_transport(config)
         # 避免卡住
         if isinstance(user_id_list, list):
             random.shuffle(user_id_list)
@@ -198,9 +281,42 @@ class Weibo(object):
         self.user = {}  # 存储目标微博用户信息
         self.got_count = 0  # 存储爬取到的微博数
         self.weibo = []  # 存储爬取到的所有微博信息
-        self.weibo_id_list = []  # 存储爬取到的所有微博id
-        self.long_sleep_count_before_each_user = 0 #每个用户前的长时间sleep避免被ban
+        self.weibo_ids = set()  # 存储爬取到的所有微博id
+        self.stored_edit_counts = {}  # 当前用户已写入的微博id及其编辑次数，见skip_unchanged_weibo
+        self.skipped_count = 0  # 因已写入且没有变化而跳过的微博数
         self.store_binary_in_sqlite = config.get("store_binary_in_sqlite", 0)
+        # 开启store_binary_in_sqlite时图片视频按内容保存在blob存储中，数据库只记录sha256
+        self.blob_store = (
+            BlobStore(self.get_blob_store_path()) if self.store_binary_in_sqlite == 1 else None
+        )
+        # 所有用户共用的SQLite写入器，攒批写入，第一次写入时才打开数据库
+        self.sqlite_writer = SQLiteWriter(
+            self.get_sqlte_path(),
+            self.get_sqlite_create_sql(),
+            batch_rows=config.get("sqlite_batch_rows", 500),
+            commit_interval=config.get("sqlite_commit_interval", 5),
+        )
+        # 所有用户共用的MySQL写入器，第一次写入前创建数据库和表
+        self.mysql_writer = None
+        if "mysql" in self.write_mode:
+            self.mysql_writer = MySQLWriter(
+                self.mysql_config or DEFAULT_MYSQL_CONFIG,
+                self.get_mysql_create_sql(),
+                pool_size=self.crawl_worker_count + 1,
+                batch_rows=config.get("mysql_batch_rows", 500),
+            )
+        # 所有用户共用的MongoDB写入器，第一次写入时才连接
+        self.mongo_writer = MongoWriter(self.mongodb_URI) if "mongo" in self.write_mode else None
+        self.guess_pin = False  # 微博取消了“置顶”字样的显示，append模式下默认猜测每个用户第一条都是置顶
+        self.crawl_error = None  # 当前用户爬取过程中的错误信息
+        self.download_manifest = None  # 当前用户的下载记录
+        self.jsonl_store = None  # 当前用户的jsonl结果文件
+        self.weibo_rows = None  # 最近一批微博拆分后的行，见get_weibo_rows
+        self.weibo_rows_lock = threading.Lock()
+        self.crawl_results = []  # 每个用户的爬取结果，包括微博数、耗时和错误信息
+        self.start_time = monotonic()  # 本次运行的开始时间，用于计算平均每秒获取的微博数
+        self.file_lock = threading.RLock()  # 多用户并发爬取时保护users.csv、用户配置文件等共享文件
+        self.captcha_lock = threading.Lock()  # 多用户并发爬取时同一时间只处理一个验证码
     def validate_config(self, config):
         """验证配置是否正确"""
 
@@ -228,13 +344,13 @@ class Weibo(object):
             sys.exit()
 
         # 验证write_mode
-        write_mode = ["csv", "json", "mongo", "mysql", "sqlite", "post"]
+        write_mode = ["csv", "json", "jsonl", "mongo", "mysql", "sqlite", "post"]
         if not isinstance(config["write_mode"], list):
             sys.exit("write_mode值应为list类型")
         for mode in config["write_mode"]:
             if mode not in write_mode:
                 logger.warning(
-                    "%s为无效模式，请从csv、json、mongo和mysql中挑选一个或多个作为write_mode", mode
+                    "%s为无效模式，请从csv、json、jsonl、mongo和mysql中挑选一个或多个作为write_mode", mode
                 )
                 sys.exit()
         # 验证运行模式
@@ -247,6 +363,87 @@ class Weibo(object):
         if (not isinstance(user_id_list, list)) and (not user_id_list.endswith(".txt")):
             logger.warning("user_id_list值应为list类型或txt文件路径")
             sys.exit()
+
+        # 验证replay_dir
+        replay_dir = config.get("replay_dir")
+        if replay_dir and not os.path.isdir(replay_dir):
+            logger.warning("不存在回放目录%s", replay_dir)
+            sys.exit()
+
+        # 验证http_transport
+        if config.get("http_transport", "sync") not in ["sync", "async"]:
+            logger.warning("http_transport值应为sync或async")
+            sys.exit()
+
+        # 验证skip_unchanged_weibo
+        if config.get("skip_unchanged_weibo", 0) not in [0, 1]:
+            logger.warning("skip_unchanged_weibo值应为0或1")
+            sys.exit()
+
+        # 验证long_text_workers和long_text_cache_days
+        for argument in ["long_text_workers", "long_text_cache_days"]:
+            value = config.get(argument, 0)
+            if not isinstance(value, int) or value < 0:
+                logger.warning("%s值应为非负整数", argument)
+                sys.exit()
+
+        # 验证download_workers和download_per_host
+        for argument, default in [("download_workers", 8), ("download_per_host", 4)]:
+            value = config.get(argument, default)
+            if not isinstance(value, int) or value < 1:
+                logger.warning("%s值应为正整数", argument)
+                sys.exit()
+
+        # 验证mysql_batch_rows
+        mysql_batch_rows = config.get("mysql_batch_rows", 500)
+        if not isinstance(mysql_batch_rows, int) or mysql_batch_rows < 1:
+            logger.warning("mysql_batch_rows值应为正整数")
+            sys.exit()
+
+        # 验证sqlite_batch_rows和sqlite_commit_interval
+        sqlite_batch_rows = config.get("sqlite_batch_rows", 500)
+        if not isinstance(sqlite_batch_rows, int) or sqlite_batch_rows < 1:
+            logger.warning("sqlite_batch_rows值应为正整数")
+            sys.exit()
+        sqlite_commit_interval = config.get("sqlite_commit_interval", 5)
+        if not isinstance(sqlite_commit_interval, (int, float)) or sqlite_commit_interval < 0:
+            logger.warning("sqlite_commit_interval值应为非负数")
+            sys.exit()
+
+        # 验证prefetch_pages和write_queue_size
+        for argument, default in [("prefetch_pages", 0), ("write_queue_size", 2)]:
+            value = config.get(argument, default)
+            if not isinstance(value, int) or value < 0:
+                logger.warning("%s值应为非负整数", argument)
+                sys.exit()
+
+        # 验证crawl_worker_count和request_budget_per_minute
+        crawl_worker_count = config.get("crawl_worker_count", 1)
+        if not isinstance(crawl_worker_count, int) or crawl_worker_count < 1:
+            logger.warning("crawl_worker_count值应为正整数")
+            sys.exit()
+        request_budget = config.get("request_budget_per_minute", 0)
+        if not isinstance(request_budget, (int, float)) or request_budget < 0:
+            logger.warning("request_budget_per_minute值应为非负数")
+            sys.exit()
+
+        # 验证rate_limit
+        rate_limit = config.get("rate_limit") or {}
+        if not isinstance(rate_limit, dict):
+            logger.warning("rate_limit值应为dict类型")
+            sys.exit()
+        for family, rate in rate_limit.items():
+            if family not in DEFAULT_RATES:
+                logger.warning("%s为无效的请求类型，请从%s中挑选", family, "、".join(DEFAULT_RATES))
+                sys.exit()
+            if not isinstance(rate, (int, float)) or rate <= 0:
+                logger.warning("rate_limit中%s的值应为正数", family)
+                sys.exit()
+        for key in ["rate_limit_jitter", "rate_limit_max_jitter"]:
+            value = config.get(key, 0)
+            if not isinstance(value, (int, float)) or value < 0:
+                logger.warning("%s值应为非负数", key)
+                sys.exit()
         if not isinstance(user_id_list, list):
             if not os.path.isabs(user_id_list):
                 user_id_list = (
@@ -294,10 +491,33 @@ class Weibo(object):
         except ValueError:
             return False
 
+    def create_transport(self, config):
+        """根据http_transport配置创建网络传输层，默认使用requests同步请求"""
+        if self.replay_dir:
+            return ReplayTransport(self.replay_dir)
+        transport = None
+        if config.get("http_transport", "sync") == "async":
+            try:
+                transport = AsyncTransport(
+                    self.session, config.get("max_in_flight_requests", 32), self.rate_limiter
+                )
+            except ImportError as e:
+                logger.warning("%s，本次改用sync方式", e)
+        if transport is None:
+            transport = SyncTransport(self.session, self.rate_limiter)
+        raw_capture = config.get("raw_capture") or {}
+        if raw_capture.get("enable"):
+            capture = ResponseCapture(
+                raw_capture.get("dir") or "./weibo/raw_responses",
+                raw_capture.get("max_mb_per_user", 50),
+            )
+            transport = CapturingTransport(transport, capture, self)
+        return transport
+
     def get_json(self, params):
         url = "https://m.weibo.cn/api/container/getIndex?"
         try:
-            r = self.session.get(url, params=params, headers=self.headers, verify=False, timeout=10)
+            r = self.transport.get(url, family="timeline", params=params, headers=self.headers, verify=False, timeout=10)
             r.raise_for_status()
             response_json = r.json()
             return response_json, r.status_code
@@ -329,22 +549,24 @@ class Weibo(object):
             return False
         
         logger.info("请在打开的浏览器窗口中完成验证码验证。")
-        while True:
-            try:
-                # 等待用户输入
-                user_input = input("完成验证码后，请输入 'y' 继续，或输入 'q' 退出：").strip().lower()
-
-                if user_input == 'y':
-                    logger.info("用户输入 'y'，继续爬取。")
-                    return True
-                elif user_input == 'q':
-                    logger.warning("用户选择退出，程序中止。")
-                    sys.exit("用户选择退出，程序中止。")
-                else:
-                    logger.warning("无效输入，请重新输入 'y' 或 'q'。")
-            except EOFError:
-                logger.error("读取用户输入时发生 EOFError，程序退出。")
-                sys.exit("输入流已关闭，程序中止。")
+        # 并发爬取时多个线程可能同时遇到验证码，逐个提示避免输入错乱
+        with self.captcha_lock:
+            while True:
+                try:
+                    # 等待用户输入
+                    user_input = input("完成验证码后，请输入 'y' 继续，或输入 'q' 退出：").strip().lower()
+
+                    if user_input == 'y':
+                        logger.info("用户输入 'y'，继续爬取。")
+                        return True
+                    elif user_input == 'q':
+                        logger.warning("用户选择退出，程序中止。")
+                        sys.exit("用户选择退出，程序中止。")
+                    else:
+                        logger.warning("无效输入，请重新输入 'y' 或 'q'。")
+                except EOFError:
+                    logger.error("读取用户输入时发生 EOFError，程序退出。")
+                    sys.exit("输入流已关闭，程序中止。")
     
     def get_weibo_json(self, page):
         """获取网页中微博json数据"""
@@ -366,7 +588,7 @@ class Weibo(object):
 
         while retries < max_retries:
             try:
-                response = self.session.get(url, params=params, headers=self.headers, timeout=10)
+                response = self.transport.get(url, family="timeline", params=params, headers=self.headers, timeout=10)
                 response.raise_for_status()  # 如果响应状态码不是 200，会抛出 HTTPError
                 js = response.json()
                 if 'data' in js:
@@ -381,6 +603,7 @@ class Weibo(object):
                     #    return {"ok": False}
                 else:
                     logger.warning("未能获取到数据，可能需要验证码验证。")
+                    self.rate_limiter.throttle("timeline", "验证码")
                     if self.handle_captcha(js):
                         logger.info("用户已完成验证码验证，继续请求数据。")
                         retries = 0  # 重置重试计数器
@@ -405,7 +628,7 @@ class Weibo(object):
         """将爬取到的用户信息写入csv文件"""
         file_dir = os.path.split(os.path.realpath(__file__))[0] + os.sep + "weibo"
         if not os.path.isdir(file_dir):
-            os.makedirs(file_dir)
+            os.makedirs(file_dir, exist_ok=True)
         file_path = file_dir + os.sep + "users.csv"
         self.user_csv_file_path = file_path
         result_headers = [
@@ -440,9 +663,10 @@ class Weibo(object):
             ]
         ]
         # 已经插入信息的用户无需重复插入，返回的id是空字符串或微博id 发布日期%Y-%m-%d
-        last_weibo_msg = csvutil.insert_or_update_user(
-            logger, result_headers, result_data, file_path
-        )
+        with self.file_lock:
+            last_weibo_msg = csvutil.insert_or_update_user(
+                logger, result_headers, result_data, file_path
+            )
         self.last_weibo_id = last_weibo_msg.split(" ")[0] if last_weibo_msg else ""
         self.last_weibo_date = (
             last_weibo_msg.split(" ")[1]
@@ -458,46 +682,7 @@ class Weibo(object):
 
     def user_to_mysql(self):
         """将爬取的用户信息写入MySQL数据库"""
-        mysql_config = {
-            "host": "localhost",
-            "port": 3306,
-            "user": "root",
-            "password": "123456",
-            "charset": "utf8mb4",
-        }
-        # 创建'weibo'数据库
-        create_database = """CREATE DATABASE IF NOT EXISTS weibo DEFAULT
-                         CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"""
-        self.mysql_create_database(mysql_config, create_database)
-        # 创建'user'表
-        create_table = """
-                CREATE TABLE IF NOT EXISTS user (
-                id varchar(20) NOT NULL,
-                screen_name varchar(30),
-                gender varchar(10),
-                statuses_count INT,
-                followers_count INT,
-                follow_count INT,
-                registration_time varchar(20),
-                sunshine varchar(20),
-                birthday varchar(40),
-                location varchar(200),
-                ip_location varchar(50),
-                education varchar(200),
-                company varchar(200),
-                description varchar(400),
-                profile_url varchar(200),
-                profile_image_url varchar(200),
-                avatar_hd varchar(200),
-                urank INT,
-                mbrank INT,
-                verified BOOLEAN DEFAULT 0,
-                verified_type INT,
-                verified_reason varchar(140),
-                PRIMARY KEY (id)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
-        self.mysql_create_table(mysql_config, create_table)
-        self.mysql_insert(mysql_config, "user", [self.user])
+        self.mysql_insert("user", [self.user])
         logger.info("%s信息写入MySQL数据库完毕", self.user["screen_name"])
 
     def user_to_database(self):
@@ -514,16 +699,7 @@ class Weibo(object):
         """获取用户信息"""
         params = {"containerid": "100505" + str(self.user_config["user_id"])}
         url = "https://m.weibo.cn/api/container/getIndex"
-        
-        # 这里在读取下一个用户的时候很容易被ban，需要优化休眠时长
-        # 加一个count，不需要一上来啥都没干就sleep
-        if self.long_sleep_count_before_each_user > 0:
-            sleep_time = random.randint(30, 60)
-            # 添加log，否则一般用户不知道以为程序卡了
-            logger.info(f"""短暂sleep {sleep_time}秒，避免被ban""")        
-            sleep(sleep_time)
-            logger.info("sleep结束")  
-        self.long_sleep_count_before_each_user = self.long_sleep_count_before_each_user + 1      
+        # 这里在读取下一个用户的时候很容易被ban，user类请求的限速保证两个用户之间留有足够间隔
 
         max_retries = 5  # 设置最大重试次数，避免无限循环
         retries = 0
@@ -531,12 +707,12 @@ class Weibo(object):
         
         while retries < max_retries:
             try:
-                response = self.session.get(url, params=params, headers=self.headers, timeout=10)
+                response = self.transport.get(url, family="user", params=params, headers=self.headers, timeout=10)
                 response.raise_for_status()
                 js = response.json()
                 if 'data' in js and 'userInfo' in js['data']:
                     info = js["data"]["userInfo"]
-                    user_info = OrderedDict()
+                    user_info = UserRecord()
                     user_info["id"] = self.user_config["user_id"]
                     user_info["screen_name"] = info.get("screen_name", "")
                     user_info["gender"] = info.get("gender", "")
@@ -590,6 +766,7 @@ class Weibo(object):
                     return 0
                 else:
                     logger.warning("未能获取到用户信息，可能需要验证码验证。")
+                    self.rate_limiter.throttle("user", "验证码")
                     if self.handle_captcha(js):
                         logger.info("用户已完成验证码验证，继续请求用户信息。")
                         retries = 0  # 重置重试计数器
@@ -610,22 +787,133 @@ class Weibo(object):
         logger.error("超过最大重试次数，程序将退出。")
         sys.exit("超过最大重试次数，程序已退出。")
 
-    def get_long_weibo(self, id):
+    def get_long_weibo(self, id, edit_count=0):
         """获取长微博"""
+        weibo_info = self.long_text_cache.get(id, edit_count)
+        if not weibo_info:
+            weibo_info = self.get_long_weibo_status(id)
+            if weibo_info:
+                self.long_text_cache.put(id, weibo_info, edit_count)
+        if weibo_info:
+            weibo = self.parse_weibo(weibo_info)
+            return weibo
+
+    def get_long_weibo_status(self, id):
+        """请求长微博详情页，返回其中的status原始数据"""
         url = "https://m.weibo.cn/detail/%s" % id
         logger.info(f"""URL: {url} """)
         for i in range(5):
-            sleep(random.uniform(1.0, 2.5))
-            html = self.session.get(url, headers=self.headers, verify=False).text
-            html = html[html.find('"status":') :]
-            html = html[: html.rfind('"call"')]
-            html = html[: html.rfind(",")]
-            html = "{" + html + "}"
-            js = json.loads(html, strict=False)
-            weibo_info = js.get("status")
+            try:
+                html = self.transport.get(
+                    url, family="detail", headers=self.headers, verify=False
+                ).text
+            except NotCapturedError as e:
+                # 记录时长微博可能来自缓存，没有请求详情页，使用微博列表中的内容
+                logger.warning(e)
+                return None
+            weibo_info = self.parse_long_weibo_html(html)
+            if weibo_info:
+                return weibo_info
+        # 详情页结构变化或解析失败时，改用statuses/show接口
+        return self.get_weibo_status_show(id)
+
+    def parse_long_weibo_html(self, html):
+        """从长微博详情页中解析出status原始数据"""
+        return extract_status(html)
+
+    def get_weibo_status_show(self, id):
+        """通过statuses/show接口获取微博的status原始数据"""
+        url = "https://m.weibo.cn/statuses/show"
+        try:
+            js = self.transport.get(
+                url,
+                family="detail",
+                params={"id": id},
+                headers=self.headers,
+                verify=False,
+                timeout=10,
+            ).json()
+        except (RequestException, ValueError) as e:
+            logger.warning("通过statuses/show获取微博%s失败：%s", id, e)
+            return None
+        if js.get("ok") == 1 and isinstance(js.get("data"), dict):
+            return js["data"]
+
+    def get_long_text_cache_path(self):
+        return "./weibo/long_text_cache.db"
+
+    def get_weibo_index_path(self):
+        return os.path.join(os.path.dirname(self.get_filepath("csv")), WEIBO_INDEX_NAME)
+
+    def get_blob_store_path(self):
+        return "./weibo/blobs"
+
+    def is_long_weibo(self, weibo_info):
+        """判断是否需要从详情页获取完整微博"""
+        return True if weibo_info.get("pic_num") > 9 else weibo_info.get("isLongText")
+
+    def get_since_date(self):
+        """早于该时间的微博不再获取"""
+        if const.MODE == "append":
+            # 上一次标记的微博被删了，就把上一条微博时间记录推前两天，多抓点评论或者微博内容修改
+            # TODO 更加合理的流程是，即使读取到上次更新微博id，也抓取增量评论，由此获得更多的评论
+            return datetime.strptime(convert_to_days_ago(self.last_weibo_date, 1), DTFORMAT)
+        return datetime.strptime(self.user_config["since_date"], DTFORMAT)
+
+    def is_before_since_date(self, weibo_info):
+        """根据原始数据判断微博是否早于起始时间，不必先解析微博"""
+        created_at = self.standardize_date(weibo_info["created_at"])[0]
+        return datetime.strptime(created_at, DTFORMAT) < self.get_since_date()
+
+    def prefetch_long_weibos(self, cards):
+        """并发获取一页中尚未缓存的长微博，存入长微博缓存，解析时不再逐条请求"""
+        pending = OrderedDict()
+        for w in cards:
+            try:
+                if w["card_type"] == 11:
+                    w = (w.get("card_group") or [w])[0] or w
+                if w["card_type"] != 9:
+                    continue
+                weibo_info = w["mblog"]
+                # get_one_page会跳过的微博不必获取：已经获取过的、append模式下的置顶微博、
+                # 早于起始时间的微博，以及已写入且没有变化的微博
+                if (
+                    int(weibo_info["id"]) in self.weibo_ids
+                    or (const.MODE == "append" and self.is_pinned_weibo(w))
+                    or self.is_before_since_date(weibo_info)
+                    or self.is_unchanged_weibo(weibo_info)
+                ):
+                    continue
+                statuses = [(weibo_info, self.is_long_weibo(weibo_info))]
+                retweeted_status = weibo_info.get("retweeted_status")
+                if retweeted_status and retweeted_status.get("id"):
+                    statuses.append(
+                        (retweeted_status, retweeted_status.get("isLongText"))
+                    )
+            except Exception:
+                continue
+            for status, is_long in statuses:
+                edit_count = status.get("edit_count", 0)
+                if is_long and not self.long_text_cache.get(status["id"], edit_count):
+                    pending[str(status["id"])] = edit_count
+        if not pending:
+            return
+        calls = [
+            (
+                "https://m.weibo.cn/detail/%s" % id,
+                {"family": "detail", "headers": self.headers, "verify": False},
+            )
+            for id in pending
+        ]
+        responses = self.transport.get_many(calls, max_workers=self.long_text_workers)
+        for (id, edit_count), response in zip(pending.items(), responses):
+            # 获取失败的长微博在解析时会按原有方式重试
+            if isinstance(response, Exception):
+                continue
+            weibo_info = self.parse_long_weibo_html(response.text)
             if weibo_info:
-                weibo = self.parse_weibo(weibo_info)
-                return weibo
+                self.long_text_cache.put(id, weibo_info, edit_count)
+        logger.info("批量获取长微博%d条", len(pending))
 
     def get_pics(self, weibo_info):
         """获取微博原始图片url"""
@@ -662,49 +950,65 @@ class Weibo(object):
         return video_url
 
     def download_one_file(self, url, file_path, type, weibo_id):
-        """下载单个文件(图片/视频)"""
+        """下载单个文件(图片/视频)，没有打开下载记录时不记录下载结果"""
+        manifest = self.download_manifest
         try:
-
-            file_exist = os.path.isfile(file_path)
-            need_download = (not file_exist)
+            if manifest is not None and manifest.is_done(weibo_id, url):
+                return
+            if os.path.isfile(file_path):
+                # 下载记录出现之前已下载的文件，补充记录后下次不再检查磁盘
+                if manifest is not None:
+                    manifest.add_done(weibo_id, url, file_path, type)
+                return
             sqlite_exist = False
             if "sqlite" in self.write_mode:
                 sqlite_exist = self.sqlite_exist_file(file_path)
 
-            if not need_download:
-                return 
-
-            s = requests.Session()
-            s.mount('http://', HTTPAdapter(max_retries=5))
-            s.mount('https://', HTTPAdapter(max_retries=5))
+            s = self.media_downloader
+            # 先下载到临时文件，校验通过后再移动到file_path，中断时保留临时文件用于续传
+            temp_path = file_path + ".part"
+            digest = None
+            size = 0
             try_count = 0
             success = False
             MAX_TRY_COUNT = 3
             detected_extension = None
+            last_error = ""
             while try_count < MAX_TRY_COUNT:
+                if try_count:
+                    # 请求失败或文件不完整时，等待一段时间再重试同一个CDN，每次等待时间翻倍
+                    sleep(2 ** try_count)
                 try:
-                    response = s.get(
-                        url, headers=self.headers, timeout=(5, 10), verify=False
+                    result = s.download(
+                        url, temp_path, family="media", headers=self.headers,
+                        timeout=(5, 10), verify=False
                     )
-                    response.raise_for_status()
-                    downloaded = response.content
                     try_count += 1
+                    head, tail, size = result["head"], result["tail"], result["size"]
+                    if result["expected"] is not None and size < result["expected"]:
+                        last_error = "文件未下载完整"
+                        logger.debug(f"[DEBUG] 文件未下载完整，将继续下载: {url} ({try_count}/{MAX_TRY_COUNT})")
+                        continue  # 保留已下载的部分，下次从断点继续
 
                     # 获取文件后缀
                     url_path = url.split('?')[0]  # 去除URL中的参数
                     inferred_extension = os.path.splitext(url_path)[1].lower().strip('.')
 
                     # 通过 Magic Number 检测文件类型
-                    if downloaded.startswith(b'\xFF\xD8\xFF'):
+                    if head.startswith(b'\xFF\xD8\xFF'):
                         # JPEG 文件
-                        if not downloaded.endswith(b'\xff\xd9'):
+                        if not tail.endswith(b'\xff\xd9'):
                             logger.debug(f"[DEBUG] JPEG 文件不完整: {url} ({try_count}/{MAX_TRY_COUNT})")
+                            last_error = "JPEG 文件不完整"
+                            os.remove(temp_path)
                             continue  # 文件不完整，继续重试
                         detected_extension = '.jpg'
-                    elif downloaded.startswith(b'\x89PNG\r\n\x1A\n'):
+                    elif head.startswith(b'\x89PNG\r\n\x1A\n'):
                         # PNG 文件
-                        if not downloaded.endswith(b'IEND\xaeB`\x82'):
+                        if not tail.endswith(b'IEND\xaeB`\x82'):
                             logger.debug(f"[DEBUG] PNG 文件不完整: {url} ({try_count}/{MAX_TRY_COUNT})")
+                            last_error = "PNG 文件不完整"
+                            os.remove(temp_path)
                             continue  # 文件不完整，继续重试
                         detected_extension = '.png'
                     else:
@@ -713,7 +1017,7 @@ class Weibo(object):
                             detected_extension = '.' + inferred_extension
                         else:
                             # 尝试从 Content-Type 获取扩展名
-                            content_type = response.headers.get('Content-Type', '').lower()
+                            content_type = result["headers"].get('Content-Type', '').lower()
                             if 'image/jpeg' in content_type:
                                 detected_extension = '.jpg'
                             elif 'image/png' in content_type:
@@ -735,10 +1039,8 @@ class Weibo(object):
                         file_path = re.sub(r'\.\w+$', detected_extension, file_path)
 
                     # 保存文件
-                    if not os.path.isfile(file_path):
-                        with open(file_path, "wb") as f:
-                            f.write(downloaded)
-                            logger.debug("[DEBUG] save " + file_path)
+                    digest = self.save_file(file_path, temp_path)
+                    logger.debug("[DEBUG] save " + file_path)
 
                     success = True
                     logger.debug("[DEBUG] success " + url + "  " + str(try_count))
@@ -746,49 +1048,172 @@ class Weibo(object):
 
                 except RequestException as e:
                     try_count += 1
+                    last_error = e
                     logger.error(f"[ERROR] 请求失败，错误信息：{e}。尝试次数：{try_count}/{MAX_TRY_COUNT}")
-                    sleep_time = 2 ** try_count  # 指数退避
-                    sleep(sleep_time)
                 except Exception as e:
+                    last_error = e
                     logger.exception(f"[ERROR] 下载过程中发生错误: {e}")
                     break  # 对于其他异常，退出重试
 
             if success:
                 if "sqlite" in self.write_mode and not sqlite_exist:
                     self.insert_file_sqlite(
-                        file_path, weibo_id, url, downloaded
+                        file_path, weibo_id, url, size, digest
                     )
+                if manifest is not None:
+                    manifest.add_done(weibo_id, url, file_path, type)
             else:
                 logger.debug("[DEBUG] failed " + url + " TOTALLY")
-                error_file = self.get_filepath(type) + os.sep + "not_downloaded.txt"
-                with open(error_file, "ab") as f:
-                    error_entry = f"{weibo_id}:{file_path}:{url}\n"
-                    f.write(error_entry.encode(sys.stdout.encoding))
+                if manifest is not None:
+                    manifest.add_failed(weibo_id, url, file_path, type, last_error)
         except Exception as e:
-            # 生成原始微博URL
-            original_url = f"https://m.weibo.cn/detail/{weibo_id}"  # 新增
-            error_file = self.get_filepath(type) + os.sep + "not_downloaded.txt"
-            with open(error_file, "ab") as f:
-                # 修改错误条目格式，添加原始URL
-                error_entry = f"{weibo_id}:{file_path}:{url}:{original_url}\n"  # 修改
-                f.write(error_entry.encode(sys.stdout.encoding))
+            if manifest is not None:
+                manifest.add_failed(weibo_id, url, file_path, type, e)
             logger.exception(e)
 
-    def sqlite_exist_file(self, url):
-        if not os.path.exists(self.get_sqlte_path()):
-            return True
-        con = self.get_sqlite_connection()
-        cur = con.cursor()
+    def retry_downloads(self):
+        """
+        重试各用户下载记录中失败的图片视频
+
+        只重试到了重试时间的文件（每失败一次等待时间翻倍），失败次数过多的不再重试；
+        旧版本的not_downloaded.txt先导入下载记录。返回各项计数。
+        """
+        counts = OrderedDict(
+            [("retried", 0), ("succeeded", 0), ("failed", 0), ("waiting", 0), ("given_up", 0)]
+        )
+        root = self.get_result_root()
+        user_dirs = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        for dir_name in user_dirs:
+            user_dir = os.path.join(root, dir_name)
+            if not os.path.isdir(user_dir):
+                continue
+            manifest = DownloadManifest(os.path.join(user_dir, MANIFEST_NAME))
+            for file_type in ["img", "video", "live_photo"]:
+                txt_path = os.path.join(user_dir, file_type, "not_downloaded.txt")
+                if os.path.isfile(txt_path):
+                    imported = manifest.import_not_downloaded(txt_path, file_type)
+                    logger.info("从%s导入%d个下载失败的文件", txt_path, imported)
+            due, waiting, given_up = manifest.get_retry_entries()
+            counts["waiting"] += waiting
+            counts["given_up"] += given_up
+            jobs = []
+            paths = set()
+            for entry in due:
+                # 同一路径只下载一次
+                if entry["path"] in paths:
+                    continue
+                paths.add(entry["path"])
+                jobs.append((entry["url"], entry["path"], entry["type"], entry["weibo_id"]))
+            if not jobs:
+                continue
+            logger.info("重试%s的%d个文件", dir_name, len(jobs))
+            self.download_manifest = manifest
+            try:
+                with tqdm(total=len(jobs), desc="Retry progress") as progress:
+                    self.media_downloader.run(
+                        self.download_one_file, jobs, on_done=lambda: progress.update(1)
+                    )
+            finally:
+                self.download_manifest = None
+            for url, _, _, weibo_id in jobs:
+                counts["retried"] += 1
+                if manifest.is_done(weibo_id, url):
+                    counts["succeeded"] += 1
+                else:
+                    counts["failed"] += 1
+        logger.info(
+            "重试下载完成：重试%d个，成功%d个，失败%d个；未到重试时间%d个，已放弃%d个",
+            *counts.values()
+        )
+        return counts
+
+    def open_user_files(self):
+        """
+        获取用户信息后读取当前用户的下载记录、jsonl结果文件的索引和已写入的微博，每个用户只读取一次。
+        各批次的写入副本、图片视频下载和评论图片下载共用这一个下载记录实例，同一个记录文件只有一把锁
+        """
+        self.stored_edit_counts = {}
+        if self.skip_unchanged_weibo and const.MODE == "overwrite":
+            self.stored_edit_counts = self.load_stored_edit_counts()
+        self.download_manifest = None
+        self.jsonl_store = None
+        if "jsonl" in self.write_mode:
+            self.jsonl_store = JsonLinesStore(self.get_filepath("jsonl"))
+        if "download" in self.get_sinks() or (
+            "sqlite" in self.write_mode and self.download_comment
+        ):
+            user_dir = os.path.dirname(self.get_filepath("csv"))
+            self.download_manifest = DownloadManifest(os.path.join(user_dir, MANIFEST_NAME))
+
+    def get_written_mode(self):
+        """
+        已写入微博的记录对应的写入方式：启用的写入方式、图片视频下载和评论转发下载。
+        增加写入方式等之后，之前写入的微博会重新获取，写入新增的位置
+        """
+        modes = list(self.get_sinks())
+        if self.download_comment:
+            modes.append("comment")
+        if self.download_repost:
+            modes.append("repost")
+        return ",".join(sorted(modes))
+
+    def get_output_files(self):
+        """当前用户保存在本地的结果文件"""
+        paths = [
+            self.get_filepath(mode) for mode in ["csv", "json", "jsonl"] if mode in self.write_mode
+        ]
+        if "sqlite" in self.write_mode:
+            paths.append(self.get_sqlte_path())
+        return paths
+
+    def load_stored_edit_counts(self):
+        """读取当前用户以当前写入方式写入过的微博，有结果文件被删除时全部重新获取"""
+        for path in self.get_output_files():
+            if not os.path.isfile(path):
+                logger.info("结果文件%s不存在，本次不跳过已写入的微博", path)
+                return {}
+        index = WeiboIndex(self.get_weibo_index_path())
+        try:
+            return index.get_edit_counts(self.user_config["user_id"], self.get_written_mode())
+        finally:
+            index.close()
 
-        query_sql = """SELECT url FROM bins WHERE path=? """
-        count = cur.execute(query_sql, (url,)).fetchone()
-        con.close()
+    def record_written_weibos(self):
+        """记录当前用户本次写入的微博及其编辑次数"""
+        index = WeiboIndex(self.get_weibo_index_path())
+        try:
+            index.put_many(self.user_config["user_id"], self.get_written_mode(), self.weibo)
+        finally:
+            index.close()
+
+    def sqlite_exist_file(self, url):
+        # 只查询索引中的path列，不读取表中的数据
+        query_sql = """SELECT 1 FROM bins WHERE path=? LIMIT 1"""
+        count = self.sqlite_writer.fetchone(query_sql, (url,))
         if count is None:
             return False
 
         return True
 
-    def insert_file_sqlite(self, file_path, weibo_id, url, binary):
+    def save_file(self, file_path, temp_path):
+        """
+        把下载完成的临时文件移动到file_path，使用blob存储时返回文件内容的sha256
+
+        file_path已存在时（如扩展名修正后与已有文件同名）不覆盖，只删除临时文件；
+        使用blob存储时仍把内容存入存储，以便数据库中记录sha256。
+        """
+        if self.blob_store is None:
+            if os.path.isfile(file_path):
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, file_path)
+            return None
+        digest = self.blob_store.put_file(temp_path)
+        if not os.path.isfile(file_path):
+            self.blob_store.link(digest, file_path)
+        return digest
+
+    def insert_file_sqlite(self, file_path, weibo_id, url, size, digest=None):
         if not weibo_id:
             return
         if self.store_binary_in_sqlite != 1:  # 新增配置判断
@@ -796,22 +1221,28 @@ class Weibo(object):
         extension = Path(file_path).suffix
         if not extension:
             return
-        if len(binary) <= 0:
+        if size <= 0 or digest is None:
             return
 
         file_data = OrderedDict()
         file_data["weibo_id"] = weibo_id
         file_data["ext"] = extension
-        file_data["data"] = binary  # 仅当启用时存储二进制
+        file_data["data"] = b""  # 二进制数据保存在blob存储中，data列只为兼容旧表结构的NOT NULL约束
+        file_data["sha256"] = digest
+        file_data["size"] = size
         file_data["path"] = file_path
         file_data["url"] = url
 
-        con = self.get_sqlite_connection()
-        self.sqlite_insert(con, file_data, "bins")
-        con.close()
+        self.sqlite_insert(file_data, "bins")
 
     def handle_download(self, file_type, file_dir, urls, w):
         """处理下载相关操作"""
+        for job in self.get_download_jobs(file_type, file_dir, urls, w):
+            self.download_one_file(*job)
+
+    def get_download_jobs(self, file_type, file_dir, urls, w):
+        """返回一条微博需要下载的文件，每项为download_one_file的参数"""
+        jobs = []
         file_prefix = w["created_at"][:11].replace("-", "") + "_" + str(w["id"])
         if file_type == "img":
             if "," in urls:
@@ -824,7 +1255,7 @@ class Weibo(object):
                         file_suffix = url[index:]
                     file_name = file_prefix + "_" + str(i + 1) + file_suffix
                     file_path = file_dir + os.sep + file_name
-                    self.download_one_file(url, file_path, file_type, w["id"])
+                    jobs.append((url, file_path, file_type, w["id"]))
             else:
                 index = urls.rfind(".")
                 if len(urls) - index > 5:
@@ -833,7 +1264,7 @@ class Weibo(object):
                     file_suffix = urls[index:]
                 file_name = file_prefix + file_suffix
                 file_path = file_dir + os.sep + file_name
-                self.download_one_file(urls, file_path, file_type, w["id"])
+                jobs.append((urls, file_path, file_type, w["id"]))
         elif file_type == "video" or file_type == "live_photo":
             file_suffix = ".mp4"
             if ";" in urls:
@@ -843,13 +1274,14 @@ class Weibo(object):
                         file_suffix = ".mov"
                     file_name = file_prefix + "_" + str(i + 1) + file_suffix
                     file_path = file_dir + os.sep + file_name
-                    self.download_one_file(url, file_path, file_type, w["id"])
+                    jobs.append((url, file_path, file_type, w["id"]))
             else:
                 if urls.endswith(".mov"):
                     file_suffix = ".mov"
                 file_name = file_prefix + file_suffix
                 file_path = file_dir + os.sep + file_name
-                self.download_one_file(urls, file_path, file_type, w["id"])
+                jobs.append((urls, file_path, file_type, w["id"]))
+        return jobs
 
     def download_files(self, file_type, weibo_type, wrote_count):
         try:
@@ -877,7 +1309,7 @@ class Weibo(object):
             
             # 检查是否有文件需要下载
             has_files = False
-            for w in self.weibo[wrote_count:]:
+            for w in self.get_batch(wrote_count):
                 if weibo_type == "retweet":
                     if w.get("retweet"):
                         w = w["retweet"]
@@ -889,16 +1321,28 @@ class Weibo(object):
             
             if has_files:
                 if not os.path.isdir(file_dir):
-                    os.makedirs(file_dir)
+                    os.makedirs(file_dir, exist_ok=True)
                 
-                for w in tqdm(self.weibo[wrote_count:], desc="Download progress"):
+                jobs = []
+                paths = set()
+                for w in self.get_batch(wrote_count):
                     if weibo_type == "retweet":
                         if w.get("retweet"):
                             w = w["retweet"]
                         else:
                             continue
                     if w.get(key):
-                        self.handle_download(file_type, file_dir, w.get(key), w)
+                        for job in self.get_download_jobs(file_type, file_dir, w.get(key), w):
+                            # 多条微博转发同一条微博时文件路径相同，同一路径只下载一次，
+                            # 否则并发的下载会写入同一个.part文件
+                            if job[1] in paths:
+                                continue
+                            paths.add(job[1])
+                            jobs.append(job)
+                with tqdm(total=len(jobs), desc="Download progress") as progress:
+                    self.media_downloader.run(
+                        self.download_one_file, jobs, on_done=lambda: progress.update(1)
+                    )
                 
                 logger.info("%s下载完毕,保存路径:", describe)
                 logger.info(file_dir)
@@ -909,50 +1353,19 @@ class Weibo(object):
 
     def get_location(self, selector):
         """获取微博发布位置"""
-        location_icon = "timeline_card_small_location_default.png"
-        span_list = selector.xpath("//span")
-        location = ""
-        for i, span in enumerate(span_list):
-            if span.xpath("img/@src"):
-                if location_icon in span.xpath("img/@src")[0]:
-                    location = span_list[i + 1].xpath("string(.)")
-                    break
-        return location
+        return extract_text_info(selector)["location"]
 
     def get_article_url(self, selector):
         """获取微博中头条文章的url"""
-        article_url = ""
-        text = selector.xpath("string(.)")
-        if text.startswith("发布了头条文章"):
-            url = selector.xpath("//a/@data-url")
-            if url and url[0].startswith("http://t.cn"):
-                article_url = url[0]
-        return article_url
+        return extract_text_info(selector)["article_url"]
 
     def get_topics(self, selector):
         """获取参与的微博话题"""
-        span_list = selector.xpath("//span[@class='surl-text']")
-        topics = ""
-        topic_list = []
-        for span in span_list:
-            text = span.xpath("string(.)")
-            if len(text) > 2 and text[0] == "#" and text[-1] == "#":
-                topic_list.append(text[1:-1])
-        if topic_list:
-            topics = ",".join(topic_list)
-        return topics
+        return extract_text_info(selector)["topics"]
 
     def get_at_users(self, selector):
         """获取@用户"""
-        a_list = selector.xpath("//a")
-        at_users = ""
-        at_list = []
-        for a in a_list:
-            if "@" + a.xpath("@href")[0][3:] == a.xpath("string(.)"):
-                at_list.append(a.xpath("string(.)")[1:])
-        if at_list:
-            at_users = ",".join(at_list)
-        return at_users
+        return extract_text_info(selector)["at_users"]
 
     def string_to_int(self, string):
         """字符串转换为整数"""
@@ -1006,7 +1419,7 @@ class Weibo(object):
         return weibo
 
     def parse_weibo(self, weibo_info):
-        weibo = OrderedDict()
+        weibo = WeiboRecord()
         if weibo_info["user"]:
             weibo["user_id"] = weibo_info["user"]["id"]
             weibo["screen_name"] = weibo_info["user"]["screen_name"]
@@ -1017,8 +1430,10 @@ class Weibo(object):
         weibo["bid"] = weibo_info["bid"]
         text_body = weibo_info["text"]
         selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
+        # 一次遍历取出正文文本和话题、@用户、位置等信息
+        text_info = extract_text_info(selector)
         if self.remove_html_tag:
-            text_list = selector.xpath("//text()")
+            text_list = text_info["texts"]
             # 若text_list中的某个字符串元素以 @ 或 # 开始，则将该元素与前后元素合并为新元素，否则会带来没有必要的换行
             text_list_modified = []
             for ele in range(len(text_list)):
@@ -1029,11 +1444,11 @@ class Weibo(object):
             weibo["text"] = "\n".join(text_list_modified)
         else:
             weibo["text"] = text_body
-        weibo["article_url"] = self.get_article_url(selector)
+        weibo["article_url"] = text_info["article_url"]
         weibo["pics"] = self.get_pics(weibo_info)
         weibo["video_url"] = self.get_video_url(weibo_info)  # 普通视频URL
         weibo["live_photo_url"] = self.get_live_photo_url(weibo_info)  # Live Photo视频URL
-        weibo["location"] = self.get_location(selector)
+        weibo["location"] = text_info["location"]
         weibo["created_at"] = weibo_info["created_at"]
         weibo["source"] = weibo_info["source"]
         weibo["attitudes_count"] = self.string_to_int(
@@ -1043,13 +1458,13 @@ class Weibo(object):
             weibo_info.get("comments_count", 0)
         )
         weibo["reposts_count"] = self.string_to_int(weibo_info.get("reposts_count", 0))
-        weibo["topics"] = self.get_topics(selector)
-        weibo["at_users"] = self.get_at_users(selector)
+        weibo["topics"] = text_info["topics"]
+        weibo["at_users"] = text_info["at_users"]
         
         # 使用 LLM 分析微博内容
         if self.llm_analyzer:
             weibo = self.llm_analyzer.analyze_weibo(weibo)
-            logger.info("完整分析结果：\n%s", json.dumps(weibo, ensure_ascii=False, indent=2))
+            logger.info("完整分析结果：\n%s", json.dumps(to_dict(weibo), ensure_ascii=False, indent=2))
         return self.standardize_info(weibo)
 
     def print_user_info(self):
@@ -1112,20 +1527,22 @@ class Weibo(object):
             weibo_info = info["mblog"]
             weibo_id = weibo_info["id"]
             retweeted_status = weibo_info.get("retweeted_status")
-            is_long = (
-                True if weibo_info.get("pic_num") > 9 else weibo_info.get("isLongText")
-            )
+            is_long = self.is_long_weibo(weibo_info)
             if retweeted_status and retweeted_status.get("id"):  # 转发
                 retweet_id = retweeted_status.get("id")
                 is_long_retweet = retweeted_status.get("isLongText")
                 if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
+                    weibo = self.get_long_weibo(
+                        weibo_id, weibo_info.get("edit_count", 0)
+                    )
                     if not weibo:
                         weibo = self.parse_weibo(weibo_info)
                 else:
                     weibo = self.parse_weibo(weibo_info)
                 if is_long_retweet:
-                    retweet = self.get_long_weibo(retweet_id)
+                    retweet = self.get_long_weibo(
+                        retweet_id, retweeted_status.get("edit_count", 0)
+                    )
                     if not retweet:
                         retweet = self.parse_weibo(retweeted_status)
                 else:
@@ -1137,7 +1554,9 @@ class Weibo(object):
                 weibo["retweet"] = retweet
             else:  # 原创
                 if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
+                    weibo = self.get_long_weibo(
+                        weibo_id, weibo_info.get("edit_count", 0)
+                    )
                     if not weibo:
                         weibo = self.parse_weibo(weibo_info)
                 else:
@@ -1198,8 +1617,9 @@ class Weibo(object):
         if max_id:
             params["max_id"] = max_id
         url = "https://m.weibo.cn/comments/hotflow?max_id_type=0"
-        req = self.session.get(
+        req = self.transport.get(
             url,
+            family="comments",
             params=params,
             headers=self.headers,
         )
@@ -1232,10 +1652,6 @@ class Weibo(object):
         if on_downloaded:
             on_downloaded(weibo, comments)
 
-        # 随机睡眠一下
-        if max_count % 40 == 0:
-            sleep(random.randint(1, 5))
-
         cur_count += count
         max_id = data.get("max_id")
 
@@ -1262,7 +1678,7 @@ class Weibo(object):
         url = "https://m.weibo.cn/api/comments/show?id={id}&page={page}".format(
             id=id, page=page
         )
-        req = self.session.get(url)
+        req = self.transport.get(url, family="comments")
         json = None
         try:
             json = req.json()
@@ -1285,10 +1701,6 @@ class Weibo(object):
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(1, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1315,8 +1727,9 @@ class Weibo(object):
         id = weibo["id"]
         url = "https://m.weibo.cn/api/statuses/repostTimeline"
         params = {"id": id, "page": page}
-        req = self.session.get(
+        req = self.transport.get(
             url,
+            family="comments",
             params=params,
             headers=self.headers,
         )
@@ -1345,10 +1758,6 @@ class Weibo(object):
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(2, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1367,19 +1776,33 @@ class Weibo(object):
         return isTop
     
 
-    def get_one_page(self, page):
-        """获取一页的全部微博"""
+    def is_unchanged_weibo(self, mblog):
+        """
+        覆盖模式下判断微博是否已写入且之后没有再编辑，这样的微博不必重新解析和写入。
+        早于since_date的微博不跳过，照常处理以结束翻页
+        """
+        if const.MODE != "overwrite" or not self.stored_edit_counts:
+            return False
+        # 还没检查cookie时不能跳过，否则可能跳过用于检查cookie的微博
+        if const.CHECK_COOKIE["CHECK"] and not const.CHECK_COOKIE["CHECKED"]:
+            return False
+        edit_count = self.stored_edit_counts.get(str(mblog["id"]))
+        if edit_count is None or edit_count != mblog.get("edit_count", 0):
+            return False
+        return not self.is_before_since_date(mblog)
+
+    def get_one_page(self, page, js=None):
+        """获取一页的全部微博，js为已预取的页面数据"""
         try:
-            js = self.get_weibo_json(page)
-            import json
-            with open('js.json','w') as f:
-                #写入方式1，等价于下面这行
-                json.dump(js,f) #把列表numbers内容写入到"list.json"文件中
+            if js is None:
+                js = self.get_weibo_json(page)
             if js["ok"]:
                 weibos = js["data"]["cards"]
                 
                 if self.query:
                     weibos = weibos[0]["card_group"]
+                if self.long_text_workers > 1:
+                    self.prefetch_long_weibos(weibos)
                 # 如果需要检查cookie，在循环第一个人的时候，就要看看仅自己可见的信息有没有，要是没有直接报错
                 for w in weibos:
                     if w["card_type"] == 11:
@@ -1389,6 +1812,12 @@ class Weibo(object):
                         else:
                             w = w
                     if w["card_type"] == 9:
+                        # 先按原始数据中的id去重，重复的微博不必再解析
+                        if int(w["mblog"]["id"]) in self.weibo_ids:
+                            continue
+                        if self.is_unchanged_weibo(w["mblog"]):
+                            self.skipped_count += 1
+                            continue
                         wb = self.get_one_weibo(w)
                         if wb:
                             if (
@@ -1402,30 +1831,29 @@ class Weibo(object):
                                 logger.info("cookie检查通过")
                                 if const.CHECK_COOKIE["EXIT_AFTER_CHECK"]:
                                     return True
-                            if wb["id"] in self.weibo_id_list:
+                            if wb["id"] in self.weibo_ids:
                                 continue
                             created_at = datetime.strptime(wb["created_at"], DTFORMAT)
-                            since_date = datetime.strptime(
-                                self.user_config["since_date"], DTFORMAT
-                            )
+                            since_date = self.get_since_date()
                             if const.MODE == "append":
                                 # append模式下不会对置顶微博做任何处理
 
                                 # 由于微博本身的调整，下面判断是否为置顶的代码已失效，默认所有用户第一条均为置顶
                                 if self.is_pinned_weibo(w):
                                     continue
-                                if const.CHECK_COOKIE["GUESS_PIN"]:
-                                    const.CHECK_COOKIE["GUESS_PIN"] = False
+                                if self.guess_pin:
+                                    self.guess_pin = False
                                     continue
 
                                 if self.first_crawler:
                                     # 置顶微博的具体时间不好判定，将非置顶微博当成最新微博，写入上次抓取id的csv
                                     self.latest_weibo_id = str(wb["id"])
-                                    csvutil.update_last_weibo_id(
-                                        wb["user_id"],
-                                        str(wb["id"]) + " " + wb["created_at"],
-                                        self.user_csv_file_path,
-                                    )
+                                    with self.file_lock:
+                                        csvutil.update_last_weibo_id(
+                                            wb["user_id"],
+                                            str(wb["id"]) + " " + wb["created_at"],
+                                            self.user_csv_file_path,
+                                        )
                                     self.first_crawler = False
                                 if str(wb["id"]) == self.last_weibo_id:
                                     if const.CHECK_COOKIE["CHECK"] and (
@@ -1447,12 +1875,6 @@ class Weibo(object):
                                             )
                                         )
                                     return True
-                                # 上一次标记的微博被删了，就把上一条微博时间记录推前两天，多抓点评论或者微博内容修改
-                                # TODO 更加合理的流程是，即使读取到上次更新微博id，也抓取增量评论，由此获得更多的评论
-                                since_date = datetime.strptime(
-                                    convert_to_days_ago(self.last_weibo_date, 1),
-                                    DTFORMAT,
-                                )
                             if created_at < since_date:
                                 if self.is_pinned_weibo(w):
                                     continue
@@ -1477,7 +1899,7 @@ class Weibo(object):
                                     return True
                             if (not self.only_crawl_original) or ("retweet" not in wb.keys()):
                                 self.weibo.append(wb)
-                                self.weibo_id_list.append(wb["id"])
+                                self.weibo_ids.add(wb["id"])
                                 self.got_count += 1
                                 # 这里是系统日志输出，尽量别太杂
                                 logger.info(
@@ -1501,6 +1923,9 @@ class Weibo(object):
                     "-" * 30, self.user["screen_name"], self.user["id"], page, "-" * 30
                 )
             )
+        except NotCapturedError:
+            # 回放数据不完整时结束该用户的爬取
+            raise
         except Exception as e:
             logger.exception(e)
 
@@ -1527,10 +1952,14 @@ class Weibo(object):
                 "中的“设置cookie”部分设置cookie信息"
             )
 
+    def get_batch(self, wrote_count):
+        """返回本批要写入的微博，即第wrote_count条到第got_count条"""
+        return self.weibo[wrote_count : self.got_count]
+
     def get_write_info(self, wrote_count):
         """获取要写入的微博信息"""
         write_info = []
-        for w in self.weibo[wrote_count:]:
+        for w in self.get_batch(wrote_count):
             wb = OrderedDict()
             for k, v in w.items():
                 if k not in ["user_id", "screen_name", "retweet"]:
@@ -1559,17 +1988,11 @@ class Weibo(object):
             dir_name = self.user["screen_name"]
             if self.user_id_as_folder_name:
                 dir_name = str(self.user_config["user_id"])
-            file_dir = (
-                os.path.split(os.path.realpath(__file__))[0]
-                + os.sep
-                + "weibo"
-                + os.sep
-                + dir_name
-            )
+            file_dir = self.get_result_root() + os.sep + dir_name
             if type in ["img", "video", "live_photo"]:
                 file_dir = file_dir + os.sep + type
             if not os.path.isdir(file_dir):
-                os.makedirs(file_dir)
+                os.makedirs(file_dir, exist_ok=True)
             if type in ["img", "video", "live_photo"]:
                 return file_dir
             file_path = file_dir + os.sep + str(self.user_config["user_id"]) + "." + type
@@ -1577,6 +2000,10 @@ class Weibo(object):
         except Exception as e:
             logger.exception(e)
 
+    def get_result_root(self):
+        """获取存放各用户结果文件夹的目录"""
+        return os.path.split(os.path.realpath(__file__))[0] + os.sep + "weibo"
+
     def get_result_headers(self):
         """获取要写入结果文件的表头"""
         result_headers = [
@@ -1640,28 +2067,22 @@ class Weibo(object):
         logger.info(file_path)
 
     def update_json_data(self, data, weibo_info):
-        """更新要写入json结果文件中的数据，已经存在于json中的信息更新为最新值，不存在的信息添加到data中"""
-        data["user"] = self.user
-        if data.get("weibo"):
-            is_new = 1  # 待写入微博是否全部为新微博，即待写入微博与json中的数据不重复
-            for old in data["weibo"]:
-                if weibo_info[-1]["id"] == old["id"]:
-                    is_new = 0
-                    break
-            if is_new == 0:
-                for new in weibo_info:
-                    flag = 1
-                    for i, old in enumerate(data["weibo"]):
-                        if new["id"] == old["id"]:
-                            data["weibo"][i] = new
-                            flag = 0
-                            break
-                    if flag:
-                        data["weibo"].append(new)
-            else:
-                data["weibo"] += weibo_info
-        else:
-            data["weibo"] = weibo_info
+        """
+        更新要写入json结果文件中的数据，已经存在于json中的微博更新为最新值并保持原来的位置，
+        不存在的微博按顺序添加到末尾。微博被编辑过时保留编辑次数较多的版本，
+        避免用较早抓取的旧版本覆盖编辑后的内容
+        """
+        data["user"] = to_dict(self.user)
+        weibos = data.get("weibo") or []
+        index = {w["id"]: i for i, w in enumerate(weibos)}
+        for new in weibo_info:
+            i = index.get(new["id"])
+            if i is None:
+                index[new["id"]] = len(weibos)
+                weibos.append(to_dict(new))
+            elif new.get("edit_count", 0) >= weibos[i].get("edit_count", 0):
+                weibos[i] = to_dict(new)
+        data["weibo"] = weibos
         return data
 
     def write_json(self, wrote_count):
@@ -1671,13 +2092,23 @@ class Weibo(object):
         if os.path.isfile(path):
             with codecs.open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-        weibo_info = self.weibo[wrote_count:]
+        weibo_info = self.get_batch(wrote_count)
         data = self.update_json_data(data, weibo_info)
         with codecs.open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False)
         logger.info("%d条微博写入json文件完毕,保存路径:", self.got_count)
         logger.info(path)
 
+    def write_jsonl(self, wrote_count):
+        """将爬到的信息追加写入jsonl文件，只写入新增或内容有变化的微博"""
+        written = self.jsonl_store.write(
+            to_dict(self.user), [to_dict(w) for w in self.get_batch(wrote_count)]
+        )
+        logger.info(
+            "%d条微博写入jsonl文件完毕（新增或更新%d条）,保存路径:", self.got_count, written
+        )
+        logger.info(self.jsonl_store.path)
+
     def send_post_request_with_token(self, url, data, token, max_retries, backoff_factor):
         headers = {
             'Content-Type': 'application/json',
@@ -1700,8 +2131,8 @@ class Weibo(object):
     def write_post(self, wrote_count):
         """将爬到的信息通过POST发出"""
         data = {}
-        data['user'] = self.user
-        weibo_info = self.weibo[wrote_count:]
+        data['user'] = to_dict(self.user)
+        weibo_info = [to_dict(w) for w in self.get_batch(wrote_count)]
         if data.get('weibo'):
             data['weibo'] += weibo_info
         else:
@@ -1722,212 +2153,159 @@ class Weibo(object):
             logger.warning("系统中可能没有安装pymongo库，请先运行 pip install pymongo ，再运行程序")
             sys.exit()
         try:
-            from pymongo import MongoClient
-
-            client = MongoClient(self.mongodb_URI)
-            db = client["weibo"]
-            collection = db[collection]
-            if len(self.write_mode) > 1:
-                new_info_list = copy.deepcopy(info_list)
-            else:
-                new_info_list = info_list
-            for info in new_info_list:
-                if not collection.find_one({"id": info["id"]}):
-                    collection.insert_one(info)
-                else:
-                    collection.update_one({"id": info["id"]}, {"$set": info})
+            # 记录转换为字典后按id批量upsert，不修改info_list
+            self.mongo_writer.upsert(collection, [to_dict(info) for info in info_list])
         except pymongo.errors.ServerSelectionTimeoutError:
             logger.warning("系统中可能没有安装或启动MongoDB数据库，请先根据系统环境安装或启动MongoDB，再运行程序")
             sys.exit()
 
     def weibo_to_mongodb(self, wrote_count):
         """将爬取的微博信息写入MongoDB数据库"""
-        self.info_to_mongodb("weibo", self.weibo[wrote_count:])
+        self.info_to_mongodb("weibo", self.get_batch(wrote_count))
         logger.info("%d条微博写入MongoDB数据库完毕", self.got_count)
 
-    def mysql_create(self, connection, sql):
-        """创建MySQL数据库或表"""
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-        finally:
-            connection.close()
+    def get_mysql_create_sql(self):
+        """MySQL建表语句"""
+        return [
+            # 'user'表
+            """
+                CREATE TABLE IF NOT EXISTS user (
+                id varchar(20) NOT NULL,
+                screen_name varchar(30),
+                gender varchar(10),
+                statuses_count INT,
+                followers_count INT,
+                follow_count INT,
+                registration_time varchar(20),
+                sunshine varchar(20),
+                birthday varchar(40),
+                location varchar(200),
+                ip_location varchar(50),
+                education varchar(200),
+                company varchar(200),
+                description varchar(400),
+                profile_url varchar(200),
+                profile_image_url varchar(200),
+                avatar_hd varchar(200),
+                urank INT,
+                mbrank INT,
+                verified BOOLEAN DEFAULT 0,
+                verified_type INT,
+                verified_reason varchar(140),
+                PRIMARY KEY (id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            # 'weibo'表
+            """
+                CREATE TABLE IF NOT EXISTS weibo (
+                id varchar(20) NOT NULL,
+                bid varchar(12) NOT NULL,
+                user_id varchar(20),
+                screen_name varchar(30),
+                text text,
+                article_url varchar(100),
+                topics varchar(200),
+                at_users varchar(1000),
+                pics varchar(3000),
+                video_url varchar(1000),
+                live_photo_url varchar(1000),
+                location varchar(100),
+                created_at DATETIME,
+                source varchar(30),
+                attitudes_count INT,
+                comments_count INT,
+                reposts_count INT,
+                retweet_id varchar(20),
+                edited BOOLEAN DEFAULT 0,
+                edit_count INT DEFAULT 0,
+                PRIMARY KEY (id)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        ]
 
-    def mysql_create_database(self, mysql_config, sql):
-        """创建MySQL数据库"""
+    def mysql_ensure_schema(self):
+        """创建MySQL数据库和表，整个运行过程只执行一次"""
         try:
             import pymysql
         except ImportError:
             logger.warning("系统中可能没有安装pymysql库，请先运行 pip install pymysql ，再运行程序")
             sys.exit()
         try:
-            if self.mysql_config:
-                mysql_config = self.mysql_config
-            connection = pymysql.connect(**mysql_config)
-            self.mysql_create(connection, sql)
+            self.mysql_writer.ensure_schema()
         except pymysql.OperationalError:
             logger.warning("系统中可能没有安装或正确配置MySQL数据库，请先根据系统环境安装或配置MySQL，再运行程序")
             sys.exit()
 
-    def mysql_create_table(self, mysql_config, sql):
-        """创建MySQL表"""
-        import pymysql
-
-        if self.mysql_config:
-            mysql_config = self.mysql_config
-        mysql_config["db"] = "weibo"
-        connection = pymysql.connect(**mysql_config)
-        self.mysql_create(connection, sql)
-
-    def mysql_insert(self, mysql_config, table, data_list):
+    def mysql_insert(self, table, data_list):
         """
         向MySQL表插入或更新数据
 
         Parameters
         ----------
-        mysql_config: map
-            MySQL配置表
         table: str
             要插入的表名
         data_list: list
             要插入的数据列表
+        """
+        try:
+            self.mysql_writer.insert(table, data_list)
+        except Exception as e:
+            logger.exception(e)
 
-        Returns
-        -------
-        bool: SQL执行结果
+    def get_weibo_rows(self, wrote_count):
         """
-        import pymysql
-
-        if len(data_list) > 0:
-            keys = ", ".join(data_list[0].keys())
-            values = ", ".join(["%s"] * len(data_list[0]))
-            if self.mysql_config:
-                mysql_config = self.mysql_config
-            mysql_config["db"] = "weibo"
-            connection = pymysql.connect(**mysql_config)
-            cursor = connection.cursor()
-            sql = """INSERT INTO {table}({keys}) VALUES ({values}) ON
-                     DUPLICATE KEY UPDATE""".format(
-                table=table, keys=keys, values=values
-            )
-            update = ",".join(
-                [" {key} = values({key})".format(key=key) for key in data_list[0]]
-            )
-            sql += update
-            try:
-                cursor.executemany(sql, [tuple(data.values()) for data in data_list])
-                connection.commit()
-            except Exception as e:
-                connection.rollback()
-                logger.exception(e)
-            finally:
-                connection.close()
+        返回wrote_count之后每条微博的(微博行, 原微博行)，见util.weibo_record.normalize_weibo。
+        同一批微博只拆分一次，各写入方式共用
+        """
+        key = (wrote_count, self.got_count)
+        with self.weibo_rows_lock:
+            if self.weibo_rows is None or self.weibo_rows[0] != key:
+                self.weibo_rows = (
+                    key,
+                    [normalize_weibo(w) for w in self.get_batch(wrote_count)],
+                )
+            return self.weibo_rows[1]
+
+    def get_mysql_weibo(self, row):
+        """MySQL的weibo表中created_at为完整的日期时间"""
+        return OrderedDict(
+            (k, row["full_created_at"] if k == "created_at" else v)
+            for k, v in row.items()
+            if k != "full_created_at"
+        )
 
     def weibo_to_mysql(self, wrote_count):
         """将爬取的微博信息写入MySQL数据库"""
-        mysql_config = {
-            "host": "localhost",
-            "port": 3306,
-            "user": "root",
-            "password": "123456",
-            "charset": "utf8mb4",
-        }
-        # 创建'weibo'表
-        create_table = """
-                CREATE TABLE IF NOT EXISTS weibo (
-                id varchar(20) NOT NULL,
-                bid varchar(12) NOT NULL,
-                user_id varchar(20),
-                screen_name varchar(30),
-                text text,
-                article_url varchar(100),
-                topics varchar(200),
-                at_users varchar(1000),
-                pics varchar(3000),
-                video_url varchar(1000),
-                live_photo_url varchar(1000),
-                location varchar(100),
-                created_at DATETIME,
-                source varchar(30),
-                attitudes_count INT,
-                comments_count INT,
-                reposts_count INT,
-                retweet_id varchar(20),
-                edited BOOLEAN DEFAULT 0,
-                edit_count INT DEFAULT 0,
-                PRIMARY KEY (id)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
-        self.mysql_create_table(mysql_config, create_table)
-
-        # 要插入的微博列表
-        weibo_list = []
+        rows = self.get_weibo_rows(wrote_count)
         # 要插入的转发微博列表
-        retweet_list = []
-        if len(self.write_mode) > 1:
-            info_list = copy.deepcopy(self.weibo[wrote_count:])
-        else:
-            info_list = self.weibo[wrote_count:]
-        for w in info_list:
-            w["created_at"] = w["full_created_at"]
-            del w["full_created_at"]
-
-            if "retweet" in w:
-                r = w["retweet"]
-                r["retweet_id"] = ""
-                r["created_at"] = r["full_created_at"]
-                del r["full_created_at"]
-                retweet_list.append(r)
-                w["retweet_id"] = r["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
-        # 在'weibo'表中插入或更新微博数据
-        self.mysql_insert(mysql_config, "weibo", retweet_list)
-        self.mysql_insert(mysql_config, "weibo", weibo_list)
+        retweet_list = [self.get_mysql_weibo(r) for _, r in rows if r is not None]
+        # 要插入的微博列表
+        weibo_list = [self.get_mysql_weibo(w) for w, _ in rows]
+        # 在'weibo'表中插入或更新微博数据，转发的原微博先写入
+        self.mysql_insert("weibo", retweet_list + weibo_list)
         logger.info("%d条微博写入MySQL数据库完毕", self.got_count)
 
     def weibo_to_sqlite(self, wrote_count):
-        con = self.get_sqlite_connection()
-        weibo_list = []
-        retweet_list = []
-        info_list = copy.deepcopy(self.weibo[wrote_count:])
-        for w in info_list:
-            if "retweet" in w:
-                w["retweet"]["retweet_id"] = ""
-                retweet_list.append(w["retweet"])
-                w["retweet_id"] = w["retweet"]["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
+        rows = self.get_weibo_rows(wrote_count)
+        weibo_list = [w for w, _ in rows]
+        retweet_list = [r for _, r in rows if r is not None]
 
         comment_max_count = self.comment_max_download_count
         repost_max_count = self.comment_max_download_count
         download_comment = self.download_comment and comment_max_count > 0
         download_repost = self.download_repost and repost_max_count > 0
 
-        count = 0
         for weibo in weibo_list:
-            self.sqlite_insert_weibo(con, weibo)
+            self.sqlite_insert_weibo(weibo)
             if (download_comment) and (weibo["comments_count"] > 0):
                 self.get_weibo_comments(
                     weibo, comment_max_count, self.sqlite_insert_comments
                 )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
             if (download_repost) and (weibo["reposts_count"] > 0):
                 self.get_weibo_reposts(
                     weibo, repost_max_count, self.sqlite_insert_reposts
                 )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
 
         for weibo in retweet_list:
-            self.sqlite_insert_weibo(con, weibo)
-        con.close()
+            self.sqlite_insert_weibo(weibo)
 
     def export_comments_to_csv_for_current_user(self):
         """将当前用户相关的评论从 SQLite 导出到该用户目录下的 CSV 文件"""
@@ -1950,12 +2328,14 @@ class Weibo(object):
             csv_path = self.get_filepath("csv")
             user_dir = os.path.dirname(csv_path)
             if not os.path.isdir(user_dir):
-                os.makedirs(user_dir)
+                os.makedirs(user_dir, exist_ok=True)
             # 使用用户昵称作为文件名的一部分，避免再出现纯数字 user_id
             screen_name = self.user.get("screen_name") or user_id
             safe_screen_name = re.sub(r'[\\/:*?"<>|]', "_", str(screen_name))
             out_path = os.path.join(user_dir, f"{safe_screen_name}_comments.csv")
 
+            # 先提交写入器中还未提交的评论
+            self.sqlite_writer.flush()
             con = sqlite3.connect(db_path)
             cur = con.cursor()
 
@@ -2025,25 +2405,20 @@ class Weibo(object):
     def sqlite_insert_comments(self, weibo, comments):
         if not comments or len(comments) == 0:
             return
-        con = self.get_sqlite_connection()
         for comment in comments:
             data = self.parse_sqlite_comment(comment, weibo)
-            self.sqlite_insert(con, data, "comments")
+            self.sqlite_insert(data, "comments")
             if "comments" in comment and isinstance(comment["comments"], list):
                 for c in comment["comments"]:
                     data = self.parse_sqlite_comment(c, weibo)
-                    self.sqlite_insert(con, data, "comments")
-        con.close()
+                    self.sqlite_insert(data, "comments")
 
     def sqlite_insert_reposts(self, weibo, reposts):
         if not reposts or len(reposts) == 0:
             return
-        con = self.get_sqlite_connection()
         for repost in reposts:
             data = self.parse_sqlite_repost(repost, weibo)
-            self.sqlite_insert(con, data, "reposts")
-
-        con.close()
+            self.sqlite_insert(data, "reposts")
 
     def parse_sqlite_comment(self, comment, weibo):
         if not comment:
@@ -2071,47 +2446,55 @@ class Weibo(object):
             sqlite_comment["pic_url"] = comment["pic"]["large"]["url"]
         if sqlite_comment["pic_url"]:
             pic_url = sqlite_comment["pic_url"]
-
-            # 评论图片目录：weibo/<用户目录>/<用户昵称>_comments_img
-            csv_path = self.get_filepath("csv")
-            user_dir = os.path.dirname(csv_path)
-            if not os.path.isdir(user_dir):
-                os.makedirs(user_dir)
-            screen_name = self.user.get("screen_name") or str(
-                self.user_config.get("user_id", "")
-            )
-            safe_screen_name = re.sub(r'[\\/:*?"<>|]', "_", str(screen_name))
-            pic_path = os.path.join(user_dir, f"{safe_screen_name}_comments_img")
-            if not os.path.exists(pic_path):
-                os.makedirs(pic_path)
-
-            # 文件名包含 微博用户昵称 + weibo_id + 评论用户昵称 + comments
-            # 为避免重名，如果已存在则在末尾追加 _1/_2/... 序号
             weibo_id = sqlite_comment["weibo_id"]
-            comment_user = sqlite_comment.get("user_screen_name", "")
-            safe_comment_user = re.sub(r'[\\/:*?"<>|]', "_", str(comment_user))
-            base_name = "{screen_name}_{weibo_id}_{comment_user}_comments".format(
-                screen_name=safe_screen_name,
-                weibo_id=weibo_id,
-                comment_user=safe_comment_user,
-            )
-            pic_name = base_name + ".jpg"
-            idx = 1
-            while os.path.exists(os.path.join(pic_path, pic_name)):
-                pic_name = f"{base_name}_{idx}.jpg"
-                idx += 1
-            pic_full_path = os.path.join(pic_path, pic_name)
-            if not os.path.exists(pic_full_path):
-                try:
-                    response = self.session.get(pic_url, timeout=10)
-                    with open(pic_full_path, "wb") as f:
-                        f.write(response.content)
-                    logger.info("评论图片下载成功: %s", pic_full_path)
-                except Exception as e:
-                    logger.warning("下载评论图片失败: %s", e)
+            manifest = self.download_manifest
+            if manifest is None or not manifest.is_done(weibo_id, pic_url):
+                self.download_comment_pic(pic_url, weibo_id, sqlite_comment, manifest)
         self._try_get_value("like_count", "like_count", sqlite_comment, comment)
         return sqlite_comment
 
+    def download_comment_pic(self, pic_url, weibo_id, sqlite_comment, manifest):
+        """下载评论中的图片，已下载过的图片由调用者根据下载记录跳过，manifest为None时不记录"""
+        # 评论图片目录：weibo/<用户目录>/<用户昵称>_comments_img
+        csv_path = self.get_filepath("csv")
+        user_dir = os.path.dirname(csv_path)
+        if not os.path.isdir(user_dir):
+            os.makedirs(user_dir, exist_ok=True)
+        screen_name = self.user.get("screen_name") or str(
+            self.user_config.get("user_id", "")
+        )
+        safe_screen_name = re.sub(r'[\\/:*?"<>|]', "_", str(screen_name))
+        pic_path = os.path.join(user_dir, f"{safe_screen_name}_comments_img")
+        if not os.path.exists(pic_path):
+            os.makedirs(pic_path, exist_ok=True)
+
+        # 文件名包含 微博用户昵称 + weibo_id + 评论用户昵称 + comments
+        # 为避免重名，如果已存在则在末尾追加 _1/_2/... 序号
+        comment_user = sqlite_comment.get("user_screen_name", "")
+        safe_comment_user = re.sub(r'[\\/:*?"<>|]', "_", str(comment_user))
+        base_name = "{screen_name}_{weibo_id}_{comment_user}_comments".format(
+            screen_name=safe_screen_name,
+            weibo_id=weibo_id,
+            comment_user=safe_comment_user,
+        )
+        pic_name = base_name + ".jpg"
+        idx = 1
+        while os.path.exists(os.path.join(pic_path, pic_name)):
+            pic_name = f"{base_name}_{idx}.jpg"
+            idx += 1
+        pic_full_path = os.path.join(pic_path, pic_name)
+        try:
+            response = self.transport.get(pic_url, family="media", timeout=10)
+            with open(pic_full_path, "wb") as f:
+                f.write(response.content)
+            if manifest is not None:
+                manifest.add_done(weibo_id, pic_url, pic_full_path, "comment_img")
+            logger.info("评论图片下载成功: %s", pic_full_path)
+        except Exception as e:
+            if manifest is not None:
+                manifest.add_failed(weibo_id, pic_url, pic_full_path, "comment_img", e)
+            logger.warning("下载评论图片失败: %s", e)
+
     def parse_sqlite_repost(self, repost, weibo):
         if not repost:
             return
@@ -2142,9 +2525,9 @@ class Weibo(object):
         if value:
             dict[source_name] = value
 
-    def sqlite_insert_weibo(self, con: sqlite3.Connection, weibo: dict):
+    def sqlite_insert_weibo(self, weibo: dict):
         sqlite_weibo = self.parse_sqlite_weibo(weibo)
-        self.sqlite_insert(con, sqlite_weibo, "weibo")
+        self.sqlite_insert(sqlite_weibo, "weibo")
 
     def parse_sqlite_weibo(self, weibo):
         if not weibo:
@@ -2173,13 +2556,11 @@ class Weibo(object):
         return sqlite_weibo
 
     def user_to_sqlite(self):
-        con = self.get_sqlite_connection()
-        self.sqlite_insert_user(con, self.user)
-        con.close()
+        self.sqlite_insert_user(self.user)
 
-    def sqlite_insert_user(self, con: sqlite3.Connection, user: dict):
+    def sqlite_insert_user(self, user: dict):
         sqlite_user = self.parse_sqlite_user(user)
-        self.sqlite_insert(con, sqlite_user, "user")
+        self.sqlite_insert(sqlite_user, "user")
 
     def parse_sqlite_user(self, user):
         if not user:
@@ -2201,37 +2582,8 @@ class Weibo(object):
         sqlite_user["bio"] = user["description"]
         return sqlite_user
 
-    def sqlite_insert(self, con: sqlite3.Connection, data: dict, table: str):
-        if not data:
-            return
-        cur = con.cursor()
-        keys = ",".join(data.keys())
-        values = ",".join(["?"] * len(data))
-        sql = """INSERT OR REPLACE INTO {table}({keys}) VALUES({values})
-                """.format(
-            table=table, keys=keys, values=values
-        )
-        cur.execute(sql, list(data.values()))
-        con.commit()
-
-    def get_sqlite_connection(self):
-        path = self.get_sqlte_path()
-        create = False
-        if not os.path.exists(path):
-            create = True
-
-        con = sqlite3.connect(path)
-
-        if create == True:
-            self.create_sqlite_table(connection=con)
-
-        return con
-
-    def create_sqlite_table(self, connection: sqlite3.Connection):
-        sql = self.get_sqlite_create_sql()
-        cur = connection.cursor()
-        cur.executescript(sql)
-        connection.commit()
+    def sqlite_insert(self, data: dict, table: str):
+        self.sqlite_writer.insert(table, data)
 
     def get_sqlte_path(self):
         return "./weibo/weibodata.db"
@@ -2277,6 +2629,8 @@ class Weibo(object):
                     ,comments_count INT
                     ,reposts_count INT
                     ,retweet_id varchar(20)
+                    ,edited BOOLEAN DEFAULT 0
+                    ,edit_count INT DEFAULT 0
                     ,PRIMARY KEY (id)
                 );
 
@@ -2345,35 +2699,139 @@ class Weibo(object):
         with codecs.open(user_config_file_path, "w", encoding="utf-8") as f:
             f.write("\n".join(lines))
 
+    def get_sinks(self):
+        """返回启用的写入方式，键为名称，值为接收wrote_count的写入方法名"""
+        sinks = OrderedDict()
+        for mode, method in [
+            ("csv", "write_csv"),
+            ("json", "write_json"),
+            ("jsonl", "write_jsonl"),
+            ("post", "write_post"),
+            ("mysql", "weibo_to_mysql"),
+            ("mongo", "weibo_to_mongodb"),
+            ("sqlite", "weibo_to_sqlite"),
+        ]:
+            if mode in self.write_mode:
+                sinks[mode] = method
+        if (
+            self.original_pic_download
+            or self.original_video_download
+            or self.original_live_photo_download
+            or (
+                not self.only_crawl_original
+                and (
+                    self.retweet_pic_download
+                    or self.retweet_video_download
+                    or self.retweet_live_photo_download
+                )
+            )
+        ):
+            sinks["download"] = "download_all_files"
+        return sinks
+
+    def download_all_files(self, wrote_count):
+        """下载wrote_count之后的微博中需要下载的图片和视频"""
+        if self.original_pic_download:
+            self.download_files("img", "original", wrote_count)
+        if self.original_video_download:
+            self.download_files("video", "original", wrote_count)
+        if self.original_live_photo_download:
+            self.download_files("live_photo", "original", wrote_count)
+        # 下载转发微博文件（如果不禁爬转发）
+        if not self.only_crawl_original:
+            if self.retweet_pic_download:
+                self.download_files("img", "retweet", wrote_count)
+            if self.retweet_video_download:
+                self.download_files("video", "retweet", wrote_count)
+            if self.retweet_live_photo_download:
+                self.download_files("live_photo", "retweet", wrote_count)
+
     def write_data(self, wrote_count):
         """将爬到的信息写入文件或数据库"""
         if self.got_count > wrote_count:
-            if "csv" in self.write_mode:
-                self.write_csv(wrote_count)
-            if "json" in self.write_mode:
-                self.write_json(wrote_count)
-            if "post" in self.write_mode:
-                self.write_post(wrote_count)
-            if "mysql" in self.write_mode:
-                self.weibo_to_mysql(wrote_count)
-            if "mongo" in self.write_mode:
-                self.weibo_to_mongodb(wrote_count)
-            if "sqlite" in self.write_mode:
-                self.weibo_to_sqlite(wrote_count)
-            if self.original_pic_download:
-                self.download_files("img", "original", wrote_count)
-            if self.original_video_download:
-                self.download_files("video", "original", wrote_count)
-            if self.original_live_photo_download:
-                self.download_files("live_photo", "original", wrote_count)
-            # 下载转发微博文件（如果不禁爬转发）
-            if not self.only_crawl_original:
-                if self.retweet_pic_download:
-                    self.download_files("img", "retweet", wrote_count)
-                if self.retweet_video_download:
-                    self.download_files("video", "retweet", wrote_count)
-                if self.retweet_live_photo_download:
-                    self.download_files("live_photo", "retweet", wrote_count)
+            for method in self.get_sinks().values():
+                getattr(self, method)(wrote_count)
+
+    def create_sink_pipeline(self):
+        """创建当前用户的写入流水线，每种写入方式一个写入线程"""
+        if self.write_queue_size <= 0:
+            return None
+        sinks = OrderedDict(
+            (name, lambda batch, method=method: getattr(batch[0], method)(batch[1]))
+            for name, method in self.get_sinks().items()
+        )
+        if not sinks:
+            return None
+        return SinkPipeline(sinks, self.write_queue_size)
+
+    def write_batch(self, wrote_count):
+        """写入wrote_count之后的微博，有写入流水线时交给写入线程，否则直接写入"""
+        if self.got_count <= wrote_count:
+            return
+        if self.sink_pipeline is None:
+            self.write_data(wrote_count)
+        else:
+            self.sink_pipeline.submit((self.batch_writer(self.got_count), wrote_count))
+
+    def batch_writer(self, end):
+        """
+        返回只写入前end条微博的爬虫副本，写入线程用它写入。副本与爬虫共用微博列表，
+        只是got_count固定为end，解析线程之后追加的微博不在本批之内，不必复制列表；
+        当前用户的下载记录、jsonl结果文件和各数据库写入器也都是同一个实例
+        """
+        writer = copy.copy(self)
+        writer.got_count = end
+        writer.weibo_rows = None
+        writer.weibo_rows_lock = threading.Lock()
+        return writer
+
+    def get_pages_pipelined(self, pages):
+        """
+        流水线方式获取全部微博：预取线程依次请求页面，当前线程解析微博并获取长微博，
+        每20页交给写入流水线写入一次。各阶段之间用有界队列连接
+        """
+        page_queue = queue.Queue(maxsize=self.prefetch_pages)
+        stop = threading.Event()
+        errors = []
+
+        def fetch_pages():
+            try:
+                for page in pages:
+                    if stop.is_set():
+                        break
+                    page_queue.put((page, self.get_weibo_json(page)))
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                page_queue.put(None)
+
+        fetcher = threading.Thread(target=fetch_pages, name="page-fetcher", daemon=True)
+        fetcher.start()
+        wrote_count = 0
+        fetched_all = False
+        try:
+            with tqdm(total=len(pages), desc="Progress") as progress:
+                while True:
+                    item = page_queue.get()
+                    if item is None:
+                        fetched_all = True
+                        break
+                    page, js = item
+                    progress.update(1)
+                    if self.get_one_page(page, js):
+                        break
+                    if page % 20 == 0:  # 每爬20页写入一次文件
+                        self.write_batch(wrote_count)
+                        wrote_count = self.got_count
+        finally:
+            stop.set()
+            # 提前结束时取走已预取的页面，让预取线程能够退出
+            while not fetched_all:
+                fetched_all = page_queue.get() is None
+            fetcher.join()
+            self.write_batch(wrote_count)  # 将剩余不足20页的微博写入文件
+        if errors:
+            raise errors[0]
 
     def get_pages(self):
         """获取全部微博"""
@@ -2381,42 +2839,58 @@ class Weibo(object):
             # 用户id不可用
             if self.get_user_info() != 0:
                 return
+            self.open_user_files()
             logger.info("准备搜集 {} 的微博".format(self.user["screen_name"]))
             if const.MODE == "append" and (
                 "first_crawler" not in self.__dict__ or self.first_crawler is False
             ):
                 # 本次运行的某用户首次抓取，用于标记最新的微博id
                 self.first_crawler = True
-                const.CHECK_COOKIE["GUESS_PIN"] = True
+                self.guess_pin = True
             since_date = datetime.strptime(self.user_config["since_date"], DTFORMAT)
             today = datetime.today()
             if since_date <= today:    # since_date 若为未来则无需执行
                 page_count = self.get_page_count()
                 wrote_count = 0
-                page1 = 0
-                random_pages = random.randint(1, 5)
                 self.start_date = datetime.now().strftime(DTFORMAT)
                 pages = range(self.start_page, page_count + 1)
-                for page in tqdm(pages, desc="Progress"):
-                    is_end = self.get_one_page(page)
-                    if is_end:
-                        break
-
-                    if page % 20 == 0:  # 每爬20页写入一次文件
-                        self.write_data(wrote_count)
-                        wrote_count = self.got_count
-
-                    # 通过加入随机等待避免被限制。爬虫速度过快容易被系统限制(一段时间后限
-                    # 制会自动解除)，加入随机等待模拟人的操作，可降低被系统限制的风险。默
-                    # 认是每爬取1到5页随机等待6到10秒，如果仍然被限，可适当增加sleep时间
-                    if (page - page1) % random_pages == 0 and page < page_count:
-                        sleep(random.randint(6, 10))
-                        page1 = page
-                        random_pages = random.randint(1, 5)
-
-                self.write_data(wrote_count)  # 将剩余不足20页的微博写入文件
+                self.sink_pipeline = self.create_sink_pipeline()
+                try:
+                    if self.prefetch_pages > 0:
+                        self.get_pages_pipelined(pages)
+                    else:
+                        for page in tqdm(pages, desc="Progress"):
+                            is_end = self.get_one_page(page)
+                            if is_end:
+                                break
+
+                            if page % 20 == 0:  # 每爬20页写入一次文件
+                                self.write_batch(wrote_count)
+                                wrote_count = self.got_count
+
+                            # 爬虫速度过快容易被系统限制(一段时间后限制会自动解除)，翻页间隔由
+                            # timeline类请求的限速控制，如果仍然被限，可在rate_limit中调低速率
+
+                        self.write_batch(wrote_count)  # 将剩余不足20页的微博写入文件
+                finally:
+                    # 等待已提交的微博全部写入后才开始下一个用户
+                    if self.sink_pipeline is not None:
+                        pipeline, self.sink_pipeline = self.sink_pipeline, None
+                        pipeline.close()
+                        if pipeline.errors and not self.crawl_error:
+                            self.crawl_error = pipeline.errors[0]
+                if (
+                    self.skip_unchanged_weibo
+                    and const.MODE == "overwrite"
+                    and not self.crawl_error
+                ):
+                    # 全部写入成功后才记录，写入失败的微博下次仍会重新获取
+                    self.record_written_weibos()
+            if self.skipped_count:
+                logger.info("跳过%d条已写入且没有变化的微博", self.skipped_count)
             logger.info("微博爬取完成，共爬取%d条微博", self.got_count)
         except Exception as e:
+            self.crawl_error = str(e)
             logger.exception(e)
 
     def get_user_config_list(self, file_path):
@@ -2464,30 +2938,155 @@ class Weibo(object):
         self.user = {}
         self.user_config = user_config
         self.got_count = 0
-        self.weibo_id_list = []
+        self.weibo_ids = set()
+        self.stored_edit_counts = {}
+        self.skipped_count = 0
+        self.crawl_error = None
+        self.download_manifest = None  # 当前用户的下载记录，获取用户信息后读取
+        self.weibo_rows = None
+        self.jsonl_store = None  # 当前用户的jsonl结果文件，获取用户信息后读取索引
+
+    def crawl_user(self, user_config):
+        """爬取一个用户的全部微博，返回该用户的爬取结果"""
+        start_time = monotonic()
+        got_count = 0
+        if len(user_config["query_list"]):
+            for query in user_config["query_list"]:
+                self.query = query
+                self.initialize_info(user_config)
+                self.get_pages()
+                got_count += self.got_count
+        else:
+            self.initialize_info(user_config)
+            self.get_pages()
+            got_count = self.got_count
+
+        # 当前用户所有微博和评论抓取完毕后，再导出该用户的评论 CSV
+        self.export_comments_to_csv_for_current_user()
+
+        logger.info("信息抓取完毕")
+        logger.info("*" * 100)
+        if self.user_config_file_path and self.user:
+            with self.file_lock:
+                self.update_user_config_file(self.user_config_file_path)
+        return {
+            "user_id": user_config["user_id"],
+            "screen_name": self.user.get("screen_name", ""),
+            "got_count": got_count,
+            "elapsed": round(monotonic() - start_time, 2),
+            "error": self.crawl_error,
+        }
+
+    def start_workers(self):
+        """多用户并发爬取，每个线程使用独立的爬虫状态，共用Session和请求预算"""
+        user_queue = queue.Queue()
+        for user_config in self.user_config_list:
+            user_queue.put(user_config)
+        user_count = len(self.user_config_list)
+        results_lock = threading.Lock()
+
+        def worker():
+            # 浅拷贝共享配置、Session和锁，用户相关的状态由initialize_info重新创建
+            crawler = copy.copy(self)
+            if isinstance(crawler.transport, CapturingTransport):
+                crawler.transport = crawler.transport.bind(crawler)
+            while True:
+                try:
+                    user_config = user_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = crawler.crawl_user(user_config)
+                except (Exception, SystemExit) as e:
+                    logger.exception(e)
+                    result = {
+                        "user_id": user_config["user_id"],
+                        "screen_name": crawler.user.get("screen_name", ""),
+                        "got_count": crawler.got_count,
+                        "elapsed": 0,
+                        "error": str(e) or type(e).__name__,
+                    }
+                with results_lock:
+                    self.crawl_results.append(result)
+                    logger.info(
+                        "用户爬取进度：%d/%d，用户 %s %s",
+                        len(self.crawl_results),
+                        user_count,
+                        result["user_id"],
+                        "失败" if result["error"] else "完成",
+                    )
+
+        threads = [
+            threading.Thread(target=worker, name="crawl-worker-%d" % i, daemon=True)
+            for i in range(min(self.crawl_worker_count, user_count))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def print_crawl_results(self):
+        """打印每个用户的爬取结果"""
+        if not self.crawl_results:
+            return
+        failed = [r for r in self.crawl_results if r["error"]]
+        logger.info(
+            "共爬取%d个用户，成功%d个，失败%d个",
+            len(self.crawl_results),
+            len(self.crawl_results) - len(failed),
+            len(failed),
+        )
+        got_count = sum(r["got_count"] for r in self.crawl_results)
+        # 多用户并发爬取时各用户的耗时有重叠，按整个运行的耗时计算速度
+        elapsed = monotonic() - self.start_time
+        if elapsed > 0:
+            logger.info("共获取%d条微博，平均每秒%.1f条", got_count, got_count / elapsed)
+        for result in self.crawl_results:
+            logger.info(
+                "用户 %s(%s)：获取%d条微博，耗时%.1f秒%s",
+                result["screen_name"],
+                result["user_id"],
+                result["got_count"],
+                result["elapsed"],
+                "，错误：" + result["error"] if result["error"] else "",
+            )
+        for family, stat in self.rate_limiter.stats().items():
+            if stat["requests"] or stat["throttled"]:
+                logger.info(
+                    "%s类请求%d次，当前速率每秒%.3f次，累计等待%.1f秒，被限制%d次",
+                    family,
+                    stat["requests"],
+                    stat["rate"],
+                    stat["waited_seconds"],
+                    stat["throttled"],
+                )
 
     def start(self):
         """运行爬虫"""
         try:
-            for user_config in self.user_config_list:
-                if len(user_config["query_list"]):
-                    for query in user_config["query_list"]:
-                        self.query = query
-                        self.initialize_info(user_config)
-                        self.get_pages()
-                else:
-                    self.initialize_info(user_config)
-                    self.get_pages()
-
-                # 当前用户所有微博和评论抓取完毕后，再导出该用户的评论 CSV
-                self.export_comments_to_csv_for_current_user()
-
-                logger.info("信息抓取完毕")
-                logger.info("*" * 100)
-                if self.user_config_file_path and self.user:
-                    self.update_user_config_file(self.user_config_file_path)
+            self.start_time = monotonic()
+            self.crawl_results = []
+            if self.mysql_writer is not None:
+                self.mysql_ensure_schema()
+            if self.crawl_worker_count > 1 and not const.CHECK_COOKIE["CHECK"]:
+                self.start_workers()
+            else:
+                if self.crawl_worker_count > 1:
+                    logger.warning("检查cookie时只能逐个用户爬取，已忽略crawl_worker_count")
+                for user_config in self.user_config_list:
+                    self.crawl_results.append(self.crawl_user(user_config))
         except Exception as e:
             logger.exception(e)
+        finally:
+            self.print_crawl_results()
+            self.transport.close()
+            self.long_text_cache.close()
+            self.media_downloader.close()
+            if self.mysql_writer is not None:
+                self.mysql_writer.close()
+            if self.mongo_writer is not None:
+                self.mongo_writer.close()
+            self.sqlite_writer.close()
 
 
 def handle_config_renaming(config, oldName, newName):
@@ -2518,6 +3117,35 @@ def get_config():
         sys.exit()
 
 
+def retry_downloads():
+    """重试之前下载失败的图片视频，有文件仍然失败时返回1"""
+    try:
+        config = get_config()
+        wb = Weibo(config)
+        try:
+            counts = wb.retry_downloads()
+        finally:
+            wb.transport.close()
+            wb.media_downloader.close()
+            wb.sqlite_writer.close()
+        return 1 if counts["failed"] else 0
+    except Exception as e:
+        logger.exception(e)
+        return 1
+
+
+def compact_json():
+    """整理各用户的jsonl结果文件，并生成json格式的结果文件"""
+    try:
+        root = os.path.split(os.path.realpath(__file__))[0] + os.sep + "weibo"
+        count = compact_all(root)
+        logger.info("共整理%d个jsonl文件", count)
+        return 0
+    except Exception as e:
+        logger.exception(e)
+        return 1
+
+
 def main():
     try:
         config = get_config()
@@ -2532,4 +3160,18 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="微博爬虫")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="crawl",
+        choices=["crawl", "retry-downloads", "compact-json"],
+        help="crawl: 爬取微博（默认）；retry-downloads: 重试之前下载失败的图片视频；"
+        "compact-json: 整理jsonl结果文件并生成json文件",
+    )
+    args = parser.parse_args()
+    if args.command == "retry-downloads":
+        sys.exit(retry_downloads())
+    if args.command == "compact-json":
+        sys.exit(compact_json())
     main()